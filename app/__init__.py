@@ -13,6 +13,22 @@ def create_app(config_class=Config):
     migrate.init_app(app, db)
     bcrypt.init_app(app) # Inicializa Bcrypt
     csrf.init_app(app) # Inicializa CSRF
+
+    # Cache (memória do processo ou Redis compartilhado, via CACHE_BACKEND)
+    from app.services.cache_service import init_cache
+    init_cache(app)
+
+    # Carimbo de versão das turmas (chave dos caches de exportação)
+    from app.services.versao_dados_service import registrar_eventos_versao
+    registrar_eventos_versao()
+
+    # Invalidação do cache persistente de resumos da IA (planos/atividades editados)
+    from app.services.resumo_ia_cache_service import registrar_eventos_resumos_ia
+    registrar_eventos_resumos_ia()
+
+    # Limite de uso das rotas de IA por usuário/escola (memória ou Redis, via IA_LIMITE_BACKEND)
+    from app.services.limite_ia_service import init_limitador_ia
+    init_limitador_ia(app)
     
     # Configuração da view de login
     login_manager.login_view = 'auth.login'
@@ -22,8 +38,9 @@ def create_app(config_class=Config):
     @login_manager.user_loader
     def load_user(user_id):
         # Importação mais específica para evitar Circular Import
-        from app.models.users import User 
-        return User.query.get(int(user_id))
+        # User + Role + Escola em uma query, com cache de identidade por worker
+        from app.services.identidade_service import carregar_usuario
+        return carregar_usuario(int(user_id))
 
     # --- CORREÇÃO FINAL: REGISTRO GLOBAL DO CONTEXT PROCESSOR ---
     # Isso injeta num_notificacoes e notificacoes_topo em TODOS os templates.
@@ -31,6 +48,12 @@ def create_app(config_class=Config):
     app.context_processor(inject_notifications_logic)
     # -----------------------------------------------------------
 
+    # --- Comandos CLI (flask reconstruir-resumos, flask processar-jobs) ---
+    from app.services.resumo_notas_service import reconstruir_resumos_command
+    app.cli.add_command(reconstruir_resumos_command)
+    from app.services.job_service import processar_jobs_command
+    app.cli.add_command(processar_jobs_command)
+
     # 2. Registrar Blueprints
     
     # --- Autenticação (Rotas de Login/Registro) ---
@@ -65,6 +88,10 @@ def create_app(config_class=Config):
     from app.blueprints.portal import portal_bp
     app.register_blueprint(portal_bp, url_prefix='/portal') # Rota: /portal/dashboard
 
+    # --- Tarefas em segundo plano (status/download das exportações) ---
+    from app.blueprints.jobs import jobs_bp
+    app.register_blueprint(jobs_bp, url_prefix='/jobs')
+
     # --- Segurança e Backup ---
     from app.blueprints.backup import backup_bp
     app.register_blueprint(backup_bp, url_prefix='/backup')
@@ -1,20 +1,18 @@
 # blueprints/alunos.py
 
 import os
-import requests 
 import json 
 import base64    
 from datetime import date, datetime 
-from io import BytesIO
 
 from flask import (
     Blueprint, render_template, redirect, url_for, 
     send_file, flash, jsonify, send_from_directory, request, current_app
 )
+import numpy as np
 import pandas as pd
 from werkzeug.utils import secure_filename
-from sqlalchemy import func, distinct, case
-from sqlalchemy.orm import joinedload
+from sqlalchemy import func, distinct, case, tuple_, literal_column
 
 # --- Imports para Exportação de Documentos ---
 # PDF (ReportLab)
@@ -35,12 +33,33 @@ from openpyxl.styles import Font
 # Imports Locais e Extensões
 from app.extensions import csrf 
 from app.models import (
-    db, Turma, Aluno, Atividade, Presenca, DiarioBordo, Material, BlocoAula, Horario
+    db, Turma, Aluno, Atividade, Presenca, DiarioBordo, Material, BlocoAula, Horario, ResumoNota
 )
 from app.forms.forms_legacy import (
     AlunoForm, AtividadeForm, PresencaForm, EditarAlunoForm
 )
-from app.utils.helpers import extrair_texto_de_ficheiro, obter_resumo_ia, allowed_file 
+from app.utils.helpers import (
+    extrair_texto_de_ficheiro, obter_resumo_ia, allowed_file, evento_sse, resposta_sse,
+    pede_sse, eventos_ia_sse
+)
+from app.services.presenca_service import upsert_presencas
+from app.services.export_service import (
+    escrever_xlsx_streaming, chave_exportacao_turma,
+    MIMETYPE_XLSX, MIMETYPE_DOCX, MIMETYPE_PDF, TAMANHO_LOTE_EXPORT
+)
+from app.services.job_service import (
+    registrar_tarefa, responder_exportacao, enfileirar_job, resposta_job,
+    guardar_arquivos_entrada, remover_arquivos_entrada
+)
+from app.services.ia_service import obter_cliente_ia
+from app.services.imagem_service import preparar_imagem_ia
+from app.services.limite_ia_service import limitar_ia
+from app.services.matriz_notas_service import montar_matriz_notas, linhas_matriz
+from app.services.analise_notas_service import carregar_analise, dividir, percentis
+from app.services.texto_extraido_service import indexar_arquivo, remover_texto_extraido
+from app.services.resumo_notas_service import (
+    atualizar_resumos, atualizar_resumos_presencas, unidade_da_atividade
+)
 from flask_login import login_required, current_user
 
 # Criação do Blueprint
@@ -65,7 +84,7 @@ def turma(id_turma):
     
     alunos = alunos_query.order_by(Aluno.nome).all()
     
-    # Carrega atividades
+    # Carrega atividades (exibidas nos cards por unidade)
     atividades = Atividade.query.filter_by(id_turma=id_turma).order_by(Atividade.data.desc()).all()
     
     # --- LÓGICA DE UNIDADES ---
@@ -75,62 +94,60 @@ def turma(id_turma):
     ]
     
     atividades_por_unidade = {}
-    totais_por_unidade = {}
     
     # Agrupa atividades
     for a in atividades:
         u = a.unidade if a.unidade else '1ª Unidade' # Default para 1ª se vazio
-        if u not in atividades_por_unidade:
-            atividades_por_unidade[u] = []
-            totais_por_unidade[u] = 0.0
-        atividades_por_unidade[u].append(a)
-        totais_por_unidade[u] += (a.peso or 0)
+        atividades_por_unidade.setdefault(u, []).append(a)
+
+    # Unidade normalizada no banco ('' ou NULL contam como 1ª Unidade).
+    # Literais (não bind params) para que o GROUP BY case com o SELECT em drivers com prepared statements.
+    unidade_expr = func.coalesce(func.nullif(Atividade.unidade, literal_column("''")), literal_column("'1ª Unidade'"))
+    posicao_unidade = case(
+        {u: i for i, u in enumerate(ordem_unidades)}, value=unidade_expr, else_=-1
+    )
 
-    # DESCUBRA A ÚLTIMA UNIDADE ATIVA (Para mostrar no acumulado)
+    # Pontuação máxima e posição de cada unidade, agregadas no banco
+    totais_por_unidade = {}
     unidade_focada = '1ª Unidade' # Padrão
-    # Percorre a ordem de trás para frente. A primeira que tiver dados é a atual.
-    for u in reversed(ordem_unidades):
-        if u in atividades_por_unidade:
-            unidade_focada = u
-            break
-            
-    # Carrega presenças
+    maior_posicao = -1
+    for unidade, total, posicao in db.session.query(
+        unidade_expr,
+        func.coalesce(func.sum(Atividade.peso), 0.0),
+        func.max(posicao_unidade)
+    ).filter(Atividade.id_turma == id_turma).group_by(unidade_expr):
+        totais_por_unidade[unidade] = float(total)
+        # DESCUBRA A ÚLTIMA UNIDADE ATIVA (Para mostrar no acumulado)
+        if posicao > maior_posicao:
+            maior_posicao = posicao
+            unidade_focada = unidade
+
+    total_max_score = sum(totais_por_unidade.values())
+
+    # --- CÁLCULO INTELIGENTE ---
+    # Soma apenas as notas da "Unidade Focada", lida do resumo materializado (uma linha por aluno)
     ids_alunos = [aluno.id for aluno in alunos]
-    presencas_turma = []
+    unidades_focadas = [unidade_focada, ''] if unidade_focada == '1ª Unidade' else [unidade_focada]
+    pontos_focados = {}
     if ids_alunos:
-        presencas_turma = Presenca.query.join(Atividade).filter(
-            Atividade.id_turma == id_turma,
-            Presenca.id_aluno.in_(ids_alunos)
-        ).options(joinedload(Presenca.atividade)).all() 
-
-    # Mapeia presenças
-    presencas_por_aluno = {}
-    for p in presencas_turma:
-        if p.id_aluno not in presencas_por_aluno:
-            presencas_por_aluno[p.id_aluno] = []
-        presencas_por_aluno[p.id_aluno].append(p)
-
-    total_max_score = sum(a.peso for a in atividades if a.peso is not None)
+        pontos_focados = dict(
+            db.session.query(
+                ResumoNota.id_aluno,
+                func.sum(ResumoNota.soma_notas)
+            ).filter(
+                ResumoNota.id_turma == id_turma,
+                ResumoNota.unidade.in_(unidades_focadas),
+                ResumoNota.id_aluno.in_(ids_alunos)
+            ).group_by(ResumoNota.id_aluno).all()
+        )
 
-    alunos_com_media = []
-    for aluno in alunos:
-        presencas_aluno = presencas_por_aluno.get(aluno.id, [])
-        
-        # --- CÁLCULO INTELIGENTE ---
-        # Soma apenas as notas da "Unidade Focada"
-        total_pontos_focados = 0
-        
-        for p in presencas_aluno:
-            # Verifica se a atividade pertence à unidade ativa
-            unidade_ativ = p.atividade.unidade if p.atividade.unidade else '1ª Unidade'
-            
-            if unidade_ativ == unidade_focada and p.nota is not None:
-                total_pontos_focados += p.nota 
-        
-        alunos_com_media.append({
+    alunos_com_media = [
+        {
             'aluno': aluno,
-            'media': total_pontos_focados # Agora mostra só o acumulado da unidade atual
-        })
+            'media': float(pontos_focados.get(aluno.id) or 0) # Acumulado da unidade atual
+        }
+        for aluno in alunos
+    ]
         
     return render_template(
         'professor/turma/visao_geral.html', 
@@ -295,6 +312,7 @@ def add_atividade(id_turma):
             # Salva em uploads/docs/
             filepath = os.path.join(docs_folder, filename_final)
             arquivo.save(filepath)
+            indexar_arquivo(filepath, arquivo.filename)  # Texto pronto para os prompts da IA
             
             nome_arquivo_anexo = arquivo.filename
             path_arquivo_anexo = filename_final
@@ -364,6 +382,7 @@ def registrar_presenca(id_aluno, id_atividade):
             db.session.add(nova_presenca)
             flash(f'Registro criado! Nota: {nova_presenca.nota}', 'success')
         
+        atualizar_resumos_presencas([(id_aluno, id_atividade)])
         db.session.commit()
         return redirect(url_for('alunos.turma', id_turma=aluno.id_turma))
 
@@ -396,6 +415,8 @@ def edit_atividade(id_atividade):
     form = AtividadeForm(obj=temp_atividade)
     
     if form.validate_on_submit():
+        chave_resumo_anterior = unidade_da_atividade(atividade)
+        peso_anterior = atividade.peso
         
         # Lógica de Upload do Anexo
         arquivo = request.files.get('arquivo_anexo')
@@ -409,10 +430,12 @@ def edit_atividade(id_atividade):
                 old_path = os.path.join(docs_folder, atividade.path_arquivo_anexo)
                 if os.path.exists(old_path):
                     os.remove(old_path)
+                    remover_texto_extraido(old_path)
                 else:
                     old_path_root = os.path.join(current_app.config['UPLOAD_FOLDER'], atividade.path_arquivo_anexo)
                     if os.path.exists(old_path_root):
                         os.remove(old_path_root)
+                        remover_texto_extraido(old_path_root)
             
             filename_seguro = secure_filename(arquivo.filename)
             _, ext_seguro = os.path.splitext(filename_seguro)
@@ -420,6 +443,7 @@ def edit_atividade(id_atividade):
             
             filepath = os.path.join(docs_folder, filename_final)
             arquivo.save(filepath)
+            indexar_arquivo(filepath, arquivo.filename)
             
             atividade.nome_arquivo_anexo = arquivo.filename
             atividade.path_arquivo_anexo = filename_final
@@ -463,6 +487,10 @@ def edit_atividade(id_atividade):
 
         if not atividade.descricao.strip():
             atividade.descricao = None
+
+        # Peso/unidade entram nos resumos de notas de todos os alunos da atividade
+        if unidade_da_atividade(atividade) != chave_resumo_anterior or atividade.peso != peso_anterior:
+            atualizar_resumos([chave_resumo_anterior, unidade_da_atividade(atividade)])
         
         db.session.commit()
         flash(f'Atividade "{atividade.titulo}" atualizada com sucesso!', 'success')
@@ -486,12 +514,16 @@ def delete_atividade(id_atividade):
             filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], 'docs', atividade.path_arquivo_anexo)
             if os.path.exists(filepath):
                 os.remove(filepath)
+                remover_texto_extraido(filepath)
             else:
                 filepath_root = os.path.join(current_app.config['UPLOAD_FOLDER'], atividade.path_arquivo_anexo)
                 if os.path.exists(filepath_root):
                     os.remove(filepath_root)
+                    remover_texto_extraido(filepath_root)
         
+        chave_resumo = unidade_da_atividade(atividade)
         db.session.delete(atividade)
+        atualizar_resumos([chave_resumo])
         db.session.commit()
         flash(f'Atividade "{atividade.titulo}" deletada.', 'success')
     except Exception as e:
@@ -649,6 +681,48 @@ def gradebook(id_turma):
                            unidade_atual=unidade_selecionada, # Envia a seleção atual
                            lista_unidades=lista_unidades)     # Envia a lista completa
 
+# Campos do gradebook editáveis célula a célula
+CAMPOS_GRADEBOOK = ('nota', 'desempenho', 'status', 'situacao')
+
+# Limite de células por requisição no salvamento em lote
+MAX_ALTERACOES_LOTE = 2000
+
+
+def _nova_presenca_gradebook(id_aluno, id_atividade):
+    """Presença padrão criada quando o professor edita uma célula ainda vazia."""
+    return Presenca(id_aluno=id_aluno, id_atividade=id_atividade,
+                    status='Presente', participacao='Sim', situacao='Bom',
+                    nota=0.0, desempenho=0)
+
+
+def _converter_valor_gradebook(campo, valor, peso):
+    """
+    Valida e converte o valor de uma célula do gradebook.
+    Retorna (valor_convertido, mensagem_de_erro).
+    """
+    if campo == 'nota':
+        if valor is None or str(valor).strip() == '':
+            return 0.0, None
+        try:
+            valor_float = float(str(valor).replace(',', '.'))
+        except ValueError:
+            return None, "Valor de nota inválido"
+        if peso is not None and valor_float > peso:
+            return None, f"Nota excede o máximo ({peso})"
+        return valor_float, None
+
+    if campo == 'desempenho':
+        try:
+            return (int(valor) if valor else 0), None
+        except (ValueError, TypeError):
+            return None, "Desempenho deve ser número inteiro"
+
+    if campo in ('status', 'situacao'):
+        return valor, None
+
+    return None, f"Campo '{campo}' desconhecido"
+
+
 @alunos_bp.route('/gradebook/salvar', methods=['POST'])
 @login_required
 @csrf.exempt
@@ -688,44 +762,21 @@ def salvar_gradebook():
         if not atividade:
             return jsonify({"status": "error", "message": "Atividade não encontrada"}), 404
 
-        # 2. Buscar ou Criar Presença
+        # 2. Validar o valor da célula
+        valor_convertido, erro = _converter_valor_gradebook(campo, valor, atividade.peso)
+        if erro:
+            return jsonify({"status": "error", "message": erro}), 400
+
+        # 3. Buscar ou Criar Presença e Atualizar
         presenca = Presenca.query.filter_by(id_aluno=id_aluno, id_atividade=id_atividade).first()
         
         if not presenca:
-            presenca = Presenca(id_aluno=id_aluno, id_atividade=id_atividade,
-                                status='Presente', participacao='Sim', situacao='Bom',
-                                nota=0.0, desempenho=0)
+            presenca = _nova_presenca_gradebook(id_aluno, id_atividade)
             db.session.add(presenca)
 
-        # 3. Atualizar Dados
-        if campo == 'nota':
-            if valor is not None and str(valor).strip() != '':
-                try:
-                    valor_str = str(valor).replace(',', '.')
-                    valor_float = float(valor_str)
-                    
-                    if atividade.peso is not None and valor_float > atividade.peso: 
-                        return jsonify({"status": "error", "message": f"Nota excede o máximo ({atividade.peso})"}), 400
-                    
-                    presenca.nota = valor_float
-                except ValueError:
-                    return jsonify({"status": "error", "message": "Valor de nota inválido"}), 400
-            else:
-                presenca.nota = 0.0
-                
-        elif campo == 'desempenho':
-            try:
-                presenca.desempenho = int(valor) if valor else 0
-            except ValueError:
-                return jsonify({"status": "error", "message": "Desempenho deve ser número inteiro"}), 400
-                
-        elif campo == 'status':
-            presenca.status = valor
-        elif campo == 'situacao':
-            presenca.situacao = valor
-        else:
-            return jsonify({"status": "error", "message": f"Campo '{campo}' desconhecido"}), 400
-            
+        setattr(presenca, campo, valor_convertido)
+
+        atualizar_resumos_presencas([(id_aluno, id_atividade)])
         db.session.commit()
         return jsonify({"status": "success", "message": "Salvo"}), 200
 
@@ -736,6 +787,107 @@ def salvar_gradebook():
         # Retorna erro genérico, pois o frontend já foi ajustado para ignorar o bloco .catch
         return jsonify({"status": "error", "message": f"Erro interno."}), 500
 
+@alunos_bp.route('/gradebook/salvar_lote', methods=['POST'])
+@login_required
+@csrf.exempt
+def salvar_gradebook_lote():
+    """
+    Salva várias células do gradebook em uma única requisição/transação
+    (ex: coluna colada de uma planilha).
+    Corpo: {"alteracoes": [{"id_aluno", "id_atividade", "campo", "valor"}, ...]}
+    Responde com o resultado de cada célula, na mesma ordem do envio.
+    """
+    try:
+        data = request.json
+        alteracoes = data.get('alteracoes') if isinstance(data, dict) else None
+        if not alteracoes or not isinstance(alteracoes, list):
+            return jsonify({"status": "error", "message": "Nenhuma alteração enviada"}), 400
+        if len(alteracoes) > MAX_ALTERACOES_LOTE:
+            return jsonify({"status": "error", "message": f"Máximo de {MAX_ALTERACOES_LOTE} alterações por envio"}), 400
+
+        # 1. Normaliza IDs (células inválidas são reportadas individualmente)
+        resultados = []
+        celulas = []
+        for indice, alt in enumerate(alteracoes):
+            try:
+                id_aluno = int(alt.get('id_aluno'))
+                id_atividade = int(alt.get('id_atividade'))
+            except (ValueError, TypeError, AttributeError):
+                resultados.append({"indice": indice, "status": "error", "message": "IDs inválidos"})
+                continue
+            resultados.append({"indice": indice, "id_aluno": id_aluno, "id_atividade": id_atividade,
+                               "campo": alt.get('campo'), "status": "pending"})
+            celulas.append((indice, id_aluno, id_atividade, alt.get('campo'), alt.get('valor')))
+
+        pares = list({(c[1], c[2]) for c in celulas})
+
+        # 2. Autorização em uma única consulta: pares (aluno, atividade) da mesma turma do professor,
+        #    já trazendo o peso da atividade para validar as notas
+        pesos_autorizados = {}
+        if pares:
+            pesos_autorizados = {
+                (id_aluno, id_atividade): peso
+                for id_aluno, id_atividade, peso in db.session.query(Aluno.id, Atividade.id, Atividade.peso)
+                .join(Atividade, Atividade.id_turma == Aluno.id_turma)
+                .join(Turma, Turma.id == Aluno.id_turma)
+                .filter(
+                    Turma.autor_id == current_user.id,
+                    tuple_(Aluno.id, Atividade.id).in_(pares)
+                )
+            }
+
+        # 3. Presenças existentes em uma única consulta
+        presencas_map = {}
+        pares_autorizados = list(pesos_autorizados.keys())
+        if pares_autorizados:
+            presencas_map = {
+                (p.id_aluno, p.id_atividade): p
+                for p in Presenca.query.filter(
+                    tuple_(Presenca.id_aluno, Presenca.id_atividade).in_(pares_autorizados)
+                )
+            }
+
+        # 4. Aplica as alterações válidas
+        salvos = 0
+        for indice, id_aluno, id_atividade, campo, valor in celulas:
+            resultado = resultados[indice]
+            par = (id_aluno, id_atividade)
+
+            if par not in pesos_autorizados:
+                resultado.update(status="error", message="Não autorizado")
+                continue
+
+            valor_convertido, erro = _converter_valor_gradebook(campo, valor, pesos_autorizados[par])
+            if erro:
+                resultado.update(status="error", message=erro)
+                continue
+
+            presenca = presencas_map.get(par)
+            if not presenca:
+                presenca = _nova_presenca_gradebook(id_aluno, id_atividade)
+                db.session.add(presenca)
+                presencas_map[par] = presenca
+
+            setattr(presenca, campo, valor_convertido)
+            resultado.update(status="success", message="Salvo")
+            salvos += 1
+
+        atualizar_resumos_presencas(
+            (r['id_aluno'], r['id_atividade']) for r in resultados if r['status'] == 'success'
+        )
+        db.session.commit()
+        return jsonify({
+            "status": "success" if salvos == len(alteracoes) else "partial",
+            "message": f"{salvos} de {len(alteracoes)} células salvas.",
+            "salvos": salvos,
+            "resultados": resultados
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"ERRO AO SALVAR NOTAS EM LOTE: {str(e)}")
+        return jsonify({"status": "error", "message": "Erro interno do servidor."}), 500
+
 @alunos_bp.route('/gradebook/salvar_massa', methods=['POST'])
 @login_required
 @csrf.exempt
@@ -766,29 +918,28 @@ def salvar_gradebook_massa():
         if atividade.peso is not None and valor_nota > atividade.peso: 
             return jsonify({"status": "error", "message": f"Nota excede o máximo ({atividade.peso})"}), 400
             
-        # 4. Busca todos os alunos da turma
-        alunos = Aluno.query.filter_by(id_turma=atividade.id_turma).all()
-        
-        if not alunos:
+        # 4. Busca os IDs dos alunos da turma
+        ids_alunos = [id_aluno for (id_aluno,) in db.session.query(Aluno.id).filter_by(id_turma=atividade.id_turma)]
+
+        if not ids_alunos:
             return jsonify({"status": "error", "message": "Turma sem alunos."}), 400
 
-        alunos_afetados = 0
-        
-        # 5. Itera e atualiza/cria presenças
-        for aluno in alunos:
-            presenca = Presenca.query.filter_by(id_aluno=aluno.id, id_atividade=id_atividade).first()
-            
-            if not presenca:
-                presenca = Presenca(id_aluno=aluno.id, id_atividade=id_atividade,
-                                    status='Presente', participacao='Sim', situacao='Bom',
-                                    desempenho=0)
-                db.session.add(presenca)
-                
-            presenca.nota = valor_nota
-            alunos_afetados += 1
+        # 5. Upsert da turma inteira em um único statement
+        linhas = [
+            {'id_aluno': id_aluno, 'id_atividade': id_atividade, 'nota': valor_nota,
+             'status': 'Presente', 'participacao': 'Sim', 'situacao': 'Bom', 'desempenho': 0}
+            for id_aluno in ids_alunos
+        ]
+        resultado = upsert_presencas(linhas, campos_atualizar=['nota'])
+        atualizar_resumos([unidade_da_atividade(atividade)], ids_alunos=ids_alunos)
 
         db.session.commit()
-        return jsonify({"status": "success", "message": f"{alunos_afetados} notas salvas em massa."}), 200
+        return jsonify({
+            "status": "success",
+            "message": f"{len(ids_alunos)} notas salvas em massa.",
+            "inseridos": resultado['inseridos'],
+            "atualizados": resultado['atualizados']
+        }), 200
 
     except Exception as e:
         db.session.rollback()
@@ -882,54 +1033,42 @@ def dashboard(id_turma):
             frequencia_media=0
         )
 
-    ids_alunos_turma = [aluno.id for aluno in alunos]
-
-    todas_presencas_turma = Presenca.query.join(Atividade).filter(
-        Presenca.id_aluno.in_(ids_alunos_turma),
-        Atividade.id_turma == id_turma
-    ).all()
-
-    presencas_por_aluno = {}
-    for p in todas_presencas_turma:
-        if p.id_aluno not in presencas_por_aluno:
-            presencas_por_aluno[p.id_aluno] = []
-        presencas_por_aluno[p.id_aluno].append(p)
+    # Totais por aluno do resumo materializado, agregados em arrays (analise_notas_service)
+    analise = carregar_analise(Aluno.id_turma == id_turma, id_turma=id_turma)
+    registros = analise.por_aluno(analise.total_registros)
+    desempenho = dividir(analise.por_aluno(analise.soma_desempenho), registros)
+    tem_presenca = registros > 0
+    percentil = percentis(desempenho, tem_presenca)
+    posicoes = analise.posicoes_alunos()
 
     for aluno in alunos:
-        presencas_aluno = presencas_por_aluno.get(aluno.id, [])
-        desempenho_medio = (
-            sum(p.desempenho for p in presencas_aluno if p.desempenho is not None) / len(presencas_aluno)
-            if presencas_aluno else 0
-        )
+        i = posicoes[aluno.id]
         dados_desempenho.append({
             "aluno": aluno.nome, 
-            "desempenho": desempenho_medio,
+            "desempenho": float(desempenho[i]),
             "id_aluno": aluno.id, 
-            "tem_presenca": bool(presencas_aluno)
+            "tem_presenca": bool(tem_presenca[i]),
+            "percentil": float(percentil[i])
         })
         
-    desempenho_total_turma = sum(item['desempenho'] for item in dados_desempenho)
-    desempenho_medio_turma = desempenho_total_turma / len(dados_desempenho) if dados_desempenho else 0
+    desempenho_medio_turma = float(desempenho.mean()) if desempenho.size else 0
 
-    count_presente = sum(1 for p in todas_presencas_turma if p.status == 'Presente')
-    count_ausente = sum(1 for p in todas_presencas_turma if p.status == 'Ausente')
-    count_justificado = sum(1 for p in todas_presencas_turma if p.status == 'Justificado')
+    count_presente = int(analise.total_presentes.sum())
+    count_ausente = int(analise.total_ausentes.sum())
+    count_justificado = int(analise.total_justificados.sum())
     
-    total_registros = len(todas_presencas_turma)
-    frequencia_media = ((count_presente + count_justificado) / total_registros) * 100 if total_registros > 0 else 0
+    frequencia_media = float(dividir(analise.frequentes().sum(), registros.sum())) * 100
     
     dados_frequencia = {
         "presente": count_presente, "ausente": count_ausente, "justificado": count_justificado
     }
 
-    count_excelente = 0; count_bom = 0; count_reforco = 0; count_insat = 0
-    for item in dados_desempenho:
-        d = item['desempenho']
-        if d == 0 and not item['tem_presenca']: continue 
-        elif d >= 80: count_excelente += 1
-        elif d >= 60: count_bom += 1
-        elif d >= 40: count_reforco += 1
-        else: count_insat += 1
+    # Alunos sem nenhum registro ficam fora das faixas de situação
+    avaliados = desempenho[tem_presenca]
+    count_excelente = int(np.count_nonzero(avaliados >= 80))
+    count_bom = int(np.count_nonzero((avaliados >= 60) & (avaliados < 80)))
+    count_reforco = int(np.count_nonzero((avaliados >= 40) & (avaliados < 60)))
+    count_insat = int(np.count_nonzero(avaliados < 40))
 
     dados_situacao = {
         "excelente": count_excelente, "bom": count_bom,
@@ -953,6 +1092,7 @@ def dashboard(id_turma):
 
 @alunos_bp.route('/gerar_questoes_ia', methods=['POST'])
 @login_required
+@limitar_ia()
 def gerar_questoes_ia():
     api_key = current_app.config.get('GOOGLE_API_KEY')
     if not api_key:
@@ -973,14 +1113,15 @@ def gerar_questoes_ia():
     3. Defina...
     """
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    # Streaming: os pedaços chegam ao navegador conforme a IA escreve (timeout = intervalo entre pedaços)
+    if pede_sse():
+        pedacos = obter_cliente_ia().gerar_texto_stream(prompt, timeout=20)
+        return resposta_sse(eventos_ia_sse(
+            pedacos, lambda texto: {"status": "success", "questoes": texto.strip()}
+        ))
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=20)
-        response.raise_for_status() 
-        texto_questoes = response.json()['candidates'][0]['content']['parts'][0]['text']
+        texto_questoes = obter_cliente_ia().gerar_texto(prompt, timeout=20)
         return jsonify({"status": "success", "questoes": texto_questoes.strip()})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -1061,138 +1202,71 @@ def exportar_relatorio(id_turma):
         flash('Não autorizado.', 'danger')
         return redirect(url_for('core.index'))
     
-    alunos = Aluno.query.filter_by(id_turma=id_turma).all()
-    dados = []
-    
-    atividades_da_turma_ids = [a.id for a in turma.atividades]
-    
-    for aluno in alunos:
-        presencas_aluno = []
-        if atividades_da_turma_ids:
-            presencas_aluno = Presenca.query.filter(
-                Presenca.id_aluno == aluno.id, 
-                Presenca.id_atividade.in_(atividades_da_turma_ids)
-            ).options(joinedload(Presenca.atividade)).all()
-        
-        if not presencas_aluno:
-             dados.append({
-                "Turma": turma.nome, "Aluno": aluno.nome, "Matrícula": aluno.matricula,
-                "Atividade": "N/A", "Data": "N/A", "Peso": "N/A",
-                "Presença": "N/A", "Participação": "N/A", "Nota": "N/A",
-                "Desempenho (%)": "N/A", "Situação": "N/A",
-            })
-             continue 
-
-        for p in presencas_aluno:
-            atividade = p.atividade
-            dados.append({
-                "Turma": turma.nome, "Aluno": aluno.nome, "Matrícula": aluno.matricula,
-                "Atividade": atividade.titulo if atividade else "N/A",
-                "Data": atividade.data.strftime('%d/%m/%Y') if atividade and atividade.data else "N/A",
-                "Peso": atividade.peso if atividade else "N/A",
-                "Presença": p.status, "Participação": p.participacao, "Nota": p.nota,
-                "Desempenho (%)": p.desempenho, "Situação": p.situacao,
-            })
-
-    df = pd.DataFrame(dados)
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name=f"{turma.nome}")
-    output.seek(0)
+    # Uma única query (alunos LEFT JOIN presenças das atividades da turma), lida em lotes
+    # e gravada direto na planilha write-only: memória constante, independente do tamanho da turma
+    atividades_da_turma = db.session.query(Atividade.id).filter(Atividade.id_turma == id_turma)
+    linhas_query = db.session.query(
+        Aluno.nome, Aluno.matricula,
+        Atividade.id, Atividade.titulo, Atividade.data, Atividade.peso,
+        Presenca.id, Presenca.status, Presenca.participacao, Presenca.nota,
+        Presenca.desempenho, Presenca.situacao
+    ).select_from(Aluno)\
+     .outerjoin(Presenca, db.and_(
+         Presenca.id_aluno == Aluno.id,
+         Presenca.id_atividade.in_(atividades_da_turma.scalar_subquery())
+     ))\
+     .outerjoin(Atividade, Atividade.id == Presenca.id_atividade)\
+     .filter(Aluno.id_turma == id_turma)\
+     .order_by(Aluno.id, Presenca.id)\
+     .yield_per(TAMANHO_LOTE_EXPORT)
+
+    def gerar_linhas():
+        for (nome, matricula, id_atividade, titulo, data, peso,
+             id_presenca, status, participacao, nota, desempenho, situacao) in linhas_query:
+            if id_presenca is None:
+                yield [turma.nome, nome, matricula, "N/A", "N/A", "N/A",
+                       "N/A", "N/A", "N/A", "N/A", "N/A"]
+                continue
+
+            yield [
+                turma.nome, nome, matricula,
+                titulo if id_atividade else "N/A",
+                data.strftime('%d/%m/%Y') if data else "N/A",
+                peso if id_atividade else "N/A",
+                status, participacao, nota, desempenho, situacao,
+            ]
+
+    arquivo = escrever_xlsx_streaming(
+        ["Turma", "Aluno", "Matrícula", "Atividade", "Data", "Peso",
+         "Presença", "Participação", "Nota", "Desempenho (%)", "Situação"],
+        gerar_linhas(),
+        nome_planilha=turma.nome
+    )
 
     return send_file(
-        output, 
+        arquivo, 
         download_name=f"Relatorio_{turma.nome.replace(' ', '_')}.xlsx", 
         as_attachment=True,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        mimetype=MIMETYPE_XLSX
     )
 
-# ------------------- FUNÇÃO PARA AGRUPAR DADOS POR UNIDADE -------------------
-
-def _gerar_dados_por_unidade(turma):
-    alunos = Aluno.query.filter_by(id_turma=turma.id).order_by(Aluno.nome).all()
-    atividades_geral = Atividade.query.filter_by(id_turma=turma.id).order_by(Atividade.data).all()
-    
-    presencas_geral = Presenca.query.join(Atividade).filter(Atividade.id_turma == turma.id).all()
-    presencas_map = {(p.id_aluno, p.id_atividade): p for p in presencas_geral}
-    
-    # Determina quais unidades têm atividades
-    unidades_presentes = sorted(list(set([a.unidade for a in atividades_geral if a.unidade])))
-    
-    # Garante uma ordem lógica se possível
-    ordem_padrao = ['1ª Unidade', '2ª Unidade', '3ª Unidade', '4ª Unidade', 'Recuperação', 'Exame Final']
-    unidades_ordenadas = [u for u in ordem_padrao if u in unidades_presentes]
-    # Adiciona qualquer outra unidade que não esteja na lista padrão
-    for u in unidades_presentes:
-        if u not in unidades_ordenadas:
-            unidades_ordenadas.append(u)
-
-    dados_unidades = {}
-    tipo_map = {
-        'Prova': 'PROVA', 'Atividade': 'ATIV', 'Trabalho': 'TRAB',
-        'Seminario': 'SEM', 'Visto': 'VISTO', 'Participacao': 'PART'
-    }
-
-    for unidade in unidades_ordenadas:
-        # Filtra atividades desta unidade
-        atividades_unidade = [a for a in atividades_geral if a.unidade == unidade]
-        
-        cabecalhos = ["ALUNO"]
-        for ativ in atividades_unidade:
-            prefixo = tipo_map.get(ativ.tipo, ativ.tipo[:4].upper() if ativ.tipo else 'ATIV')
-            data_str = ativ.data.strftime('%d/%m') if ativ.data else "S/D"
-            cabecalhos.append(f"{prefixo} {data_str}")
-        
-        cabecalhos.append("TOTAL")
-        cabecalhos.append("SITUAÇÃO")
-
-        linhas = []
-        for aluno in alunos:
-            linha = [aluno.nome]
-            total_aluno = 0.0
-            
-            for ativ in atividades_unidade:
-                presenca = presencas_map.get((aluno.id, ativ.id))
-                nota = 0.0
-                if presenca and presenca.nota is not None:
-                    nota = presenca.nota
-                
-                linha.append(nota)
-                total_aluno += nota
-            
-            linha.append(total_aluno)
-            
-            # Situação por Unidade
-            situacao = "APROVADO" if total_aluno >= 5.0 else "REPROVADO"
-            linha.append(situacao)
-            
-            linhas.append(linha)
-        
-        dados_unidades[unidade] = {
-            'atividades': atividades_unidade,
-            'cabecalhos': cabecalhos,
-            'linhas': linhas
-        }
-    
-    return dados_unidades
+# ------------------- EXPORTAÇÕES DA MATRIZ (SÍNCRONAS OU VIA JOB) -------------------
 
-@alunos_bp.route('/turma/<int:id_turma>/exportar_matriz_xlsx')
-@login_required
-def exportar_matriz_xlsx(id_turma):
-    turma = Turma.query.get_or_404(id_turma)
-    if turma.autor != current_user:
-        flash('Não autorizado.', 'danger')
-        return redirect(url_for('core.index'))
+def _turma_do_job(parametros):
+    turma = db.session.get(Turma, parametros['id_turma'])
+    if not turma:
+        raise ValueError("Turma não encontrada.")
+    return turma
 
-    dados_por_unidade = _gerar_dados_por_unidade(turma)
-    output = BytesIO()
+def _escrever_matriz_xlsx(turma, destino):
+    dados_por_unidade = montar_matriz_notas(turma.id)
 
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+    with pd.ExcelWriter(destino, engine='openpyxl') as writer:
         for unidade, dados in dados_por_unidade.items():
             # Limpar nome da aba (Excel limita a 31 chars)
             sheet_name = unidade[:30]
             
-            df = pd.DataFrame(dados['linhas'], columns=dados['cabecalhos'])
+            df = pd.DataFrame(list(linhas_matriz(dados)), columns=dados['cabecalhos'])
             df.to_excel(writer, index=False, sheet_name=sheet_name)
             
             # Formatação
@@ -1208,30 +1282,34 @@ def exportar_matriz_xlsx(id_turma):
 
             # Cor na Situacao (Última Coluna)
             situacao_col_idx = num_cols
-            for row_idx in range(2, len(dados['linhas']) + 2):
+            for row_idx in range(2, len(dados['alunos']) + 2):
                 cell = ws.cell(row=row_idx, column=situacao_col_idx)
                 if cell.value == 'APROVADO':
                     cell.font = Font(color="008000", bold=True)
                 elif cell.value == 'REPROVADO':
                     cell.font = Font(color="FF0000", bold=True)
 
-    output.seek(0)
-    return send_file(
-        output,
-        download_name=f"Matriz_Notas_{turma.nome.replace(' ', '_')}.xlsx",
-        as_attachment=True,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+@registrar_tarefa('alunos.matriz_xlsx')
+def _job_matriz_xlsx(parametros, destino):
+    _escrever_matriz_xlsx(_turma_do_job(parametros), destino)
 
-@alunos_bp.route('/turma/<int:id_turma>/exportar_matriz_docx')
+@alunos_bp.route('/turma/<int:id_turma>/exportar_matriz_xlsx')
 @login_required
-def exportar_matriz_docx(id_turma):
+def exportar_matriz_xlsx(id_turma):
     turma = Turma.query.get_or_404(id_turma)
     if turma.autor != current_user:
         flash('Não autorizado.', 'danger')
         return redirect(url_for('core.index'))
 
-    dados_por_unidade = _gerar_dados_por_unidade(turma)
+    return responder_exportacao(
+        'alunos.matriz_xlsx', {'id_turma': turma.id},
+        f"Matriz_Notas_{turma.nome.replace(' ', '_')}.xlsx",
+        MIMETYPE_XLSX,
+        chave_cache=chave_exportacao_turma(turma, 'matriz_xlsx')
+    )
+
+def _escrever_matriz_docx(turma, destino):
+    dados_por_unidade = montar_matriz_notas(turma.id)
 
     document = Document()
     # Configuração Paisagem
@@ -1263,7 +1341,7 @@ def exportar_matriz_docx(id_turma):
         # Linhas
         situacao_idx = len(dados['cabecalhos']) - 1
 
-        for linha_dados in dados['linhas']:
+        for linha_dados in linhas_matriz(dados):
             row_cells = table.add_row().cells
             for i, item in enumerate(linha_dados):
                 if i == situacao_idx: # Coluna Situação
@@ -1284,29 +1362,31 @@ def exportar_matriz_docx(id_turma):
         
         document.add_page_break() # Quebra de página entre unidades
 
-    f = BytesIO()
-    document.save(f)
-    f.seek(0)
+    document.save(destino)
 
-    return send_file(
-        f,
-        download_name=f"Matriz_Notas_{turma.nome.replace(' ', '_')}.docx",
-        as_attachment=True,
-        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-    )
+@registrar_tarefa('alunos.matriz_docx')
+def _job_matriz_docx(parametros, destino):
+    _escrever_matriz_docx(_turma_do_job(parametros), destino)
 
-@alunos_bp.route('/turma/<int:id_turma>/exportar_matriz_pdf')
+@alunos_bp.route('/turma/<int:id_turma>/exportar_matriz_docx')
 @login_required
-def exportar_matriz_pdf(id_turma):
+def exportar_matriz_docx(id_turma):
     turma = Turma.query.get_or_404(id_turma)
     if turma.autor != current_user:
         flash('Não autorizado.', 'danger')
         return redirect(url_for('core.index'))
 
-    dados_por_unidade = _gerar_dados_por_unidade(turma)
+    return responder_exportacao(
+        'alunos.matriz_docx', {'id_turma': turma.id},
+        f"Matriz_Notas_{turma.nome.replace(' ', '_')}.docx",
+        MIMETYPE_DOCX,
+        chave_cache=chave_exportacao_turma(turma, 'matriz_docx')
+    )
+
+def _escrever_matriz_pdf(turma, destino):
+    dados_por_unidade = montar_matriz_notas(turma.id)
 
-    f = BytesIO()
-    doc = SimpleDocTemplate(f, pagesize=landscape(A4), rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
+    doc = SimpleDocTemplate(destino, pagesize=landscape(A4), rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30)
     elements = []
     styles = getSampleStyleSheet()
 
@@ -1320,7 +1400,7 @@ def exportar_matriz_pdf(id_turma):
         elements.append(Spacer(1, 10))
 
         data_table = [dados['cabecalhos']]
-        for linha in dados['linhas']:
+        for linha in linhas_matriz(dados):
             nova_linha = []
             for item in linha:
                 if isinstance(item, float):
@@ -1357,9 +1437,8 @@ def exportar_matriz_pdf(id_turma):
 
         # Estilos Condicionais (Cores)
         col_situacao_idx = len(dados['cabecalhos']) - 1
-        for row_idx, row_data in enumerate(dados['linhas']):
+        for row_idx, situacao in enumerate(dados['situacoes']):
             actual_row_idx = row_idx + 1 # +1 por causa do cabeçalho
-            situacao = row_data[-1] # Último item é a situação
             
             if situacao == 'APROVADO':
                 table_styles.append(('TEXTCOLOR', (col_situacao_idx, actual_row_idx), (col_situacao_idx, actual_row_idx), colors.green))
@@ -1375,17 +1454,29 @@ def exportar_matriz_pdf(id_turma):
         elements.append(PageBreak())
 
     doc.build(elements)
-    f.seek(0)
 
-    return send_file(
-        f,
-        download_name=f"Matriz_Notas_{turma.nome.replace(' ', '_')}.pdf",
-        as_attachment=True,
-        mimetype='application/pdf'
+@registrar_tarefa('alunos.matriz_pdf')
+def _job_matriz_pdf(parametros, destino):
+    _escrever_matriz_pdf(_turma_do_job(parametros), destino)
+
+@alunos_bp.route('/turma/<int:id_turma>/exportar_matriz_pdf')
+@login_required
+def exportar_matriz_pdf(id_turma):
+    turma = Turma.query.get_or_404(id_turma)
+    if turma.autor != current_user:
+        flash('Não autorizado.', 'danger')
+        return redirect(url_for('core.index'))
+
+    return responder_exportacao(
+        'alunos.matriz_pdf', {'id_turma': turma.id},
+        f"Matriz_Notas_{turma.nome.replace(' ', '_')}.pdf",
+        MIMETYPE_PDF,
+        chave_cache=chave_exportacao_turma(turma, 'matriz_pdf')
     )
 
 @alunos_bp.route('/aluno/<int:id_aluno>/analisar_desempenho_ia', methods=['POST'])
 @login_required
+@limitar_ia()
 def analisar_desempenho_ia(id_aluno):
     aluno = Aluno.query.get_or_404(id_aluno)
     if not aluno.turma or aluno.turma.autor != current_user:
@@ -1426,14 +1517,8 @@ def analisar_desempenho_ia(id_aluno):
     Responda em formato HTML simples (sem tags html/body), usando <h4> para títulos, <p> para texto e <ul>/<li> para listas. Seja direto e construtivo.
     """
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
-
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data), timeout=30)
-        response.raise_for_status()
-        analise = response.json()['candidates'][0]['content']['parts'][0]['text']
+        analise = obter_cliente_ia().gerar_texto(prompt, timeout=30)
         return jsonify({"status": "success", "analise": analise})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -1448,22 +1533,8 @@ def listar_alunos():
         
     return render_template('admin/usuarios/listar_alunos.html', alunos=alunos_list)
 
-@alunos_bp.route('/corrigir_resposta_ia', methods=['POST'])
-@login_required
-def corrigir_resposta_ia():
-    api_key = current_app.config.get('GOOGLE_API_KEY')
-    if not api_key:
-        return jsonify({"status": "error", "message": "API Key não configurada."}), 500
-
-    data = request.json
-    questao = data.get('questao', '')
-    resposta_aluno = data.get('resposta', '')
-    valor_max = data.get('valor_max', 10.0)
-
-    if not questao or not resposta_aluno:
-        return jsonify({"status": "error", "message": "Questão e Resposta são obrigatórias."}), 400
-
-    prompt = f"""
+def _prompt_correcao_texto(questao, resposta_aluno, valor_max):
+    return f"""
     Aja como um professor especialista corrigindo uma prova subjetiva (dissertativa).
     Sua tarefa é avaliar a resposta de um aluno para uma questão específica.
 
@@ -1484,41 +1555,105 @@ def corrigir_resposta_ia():
     }}
     """
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+@alunos_bp.route('/corrigir_resposta_ia', methods=['POST'])
+@login_required
+@limitar_ia()
+def corrigir_resposta_ia():
+    api_key = current_app.config.get('GOOGLE_API_KEY')
+    if not api_key:
+        return jsonify({"status": "error", "message": "API Key não configurada."}), 500
+
+    data = request.json
+    questao = data.get('questao', '')
+    resposta_aluno = data.get('resposta', '')
+    valor_max = data.get('valor_max', 10.0)
+
+    if not questao or not resposta_aluno:
+        return jsonify({"status": "error", "message": "Questão e Resposta são obrigatórias."}), 400
+
+    prompt = _prompt_correcao_texto(questao, resposta_aluno, valor_max)
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=30)
-        response.raise_for_status()
-        
-        texto_ia = response.json()['candidates'][0]['content']['parts'][0]['text']
-        texto_ia = texto_ia.replace('```json', '').replace('```', '').strip()
-        
-        resultado = json.loads(texto_ia)
+        # Cache de respostas: reenvio da mesma questão/resposta (duplo clique, retry da tela) não chama a IA de novo
+        texto_ia = obter_cliente_ia().gerar_texto(prompt, timeout=30, cache=_json_da_ia)
+        resultado = _json_da_ia(texto_ia)
         return jsonify({"status": "success", "nota": resultado['nota'], "feedback": resultado['feedback']})
         
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
-@alunos_bp.route('/corrigir_prova_foto', methods=['POST'])
+@alunos_bp.route('/corrigir_respostas_ia_lote', methods=['POST'])
 @login_required
-def corrigir_prova_foto():
+@limitar_ia(custo=lambda req: len((req.get_json(silent=True) or {}).get('respostas') or []))
+def corrigir_respostas_ia_lote():
+    """
+    Corrige várias respostas da mesma questão (ex.: a turma inteira) em paralelo.
+    JSON: {"questao", "valor_max", "respostas": [{"id_aluno", "resposta"}, ...],
+           "id_atividade" (opcional), "salvar": true para gravar as notas em Presenca}.
+    Resposta em text/event-stream: um evento 'resultado' por resposta, na ordem em
+    que ficam prontas, e um evento 'fim' com o total.
+    """
     api_key = current_app.config.get('GOOGLE_API_KEY')
     if not api_key:
         return jsonify({"status": "error", "message": "API Key não configurada."}), 500
 
-    # Recebe a imagem e dados
-    arquivo = request.files.get('imagem_prova')
-    gabarito_ou_contexto = request.form.get('contexto', '')
-    valor_total = request.form.get('valor_total', 10.0)
+    data = request.json or {}
+    questao = data.get('questao', '')
+    valor_max = data.get('valor_max', 10.0)
+    respostas = [r for r in data.get('respostas', []) if isinstance(r, dict)]
+    salvar = bool(data.get('salvar'))
 
-    if not arquivo:
-        return jsonify({"status": "error", "message": "Nenhuma imagem enviada."}), 400
+    if not questao or not respostas:
+        return jsonify({"status": "error", "message": "Questão e Respostas são obrigatórias."}), 400
+
+    atividade = None
+    if salvar:
+        try:
+            for r in respostas:
+                r['id_aluno'] = int(r['id_aluno'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"status": "error", "message": "Informe o id_aluno de cada resposta para salvar."}), 400
+
+        atividade = db.session.get(Atividade, data.get('id_atividade') or 0)
+        if not atividade or not atividade.turma or atividade.turma.autor != current_user:
+            return jsonify({"status": "error", "message": "Atividade inválida para salvar as notas."}), 403
+        ids_turma = {id_aluno for (id_aluno,) in db.session.query(Aluno.id).filter_by(id_turma=atividade.id_turma)}
+        if any(r.get('id_aluno') not in ids_turma for r in respostas):
+            return jsonify({"status": "error", "message": "Aluno não pertence à turma da atividade."}), 400
+
+    prompts = [
+        [{"text": _prompt_correcao_texto(questao, r.get('resposta', ''), valor_max)}] for r in respostas
+    ]
+    lote = obter_cliente_ia().gerar_em_lote(
+        prompts, max_paralelo=current_app.config.get('IA_MAX_CORRECOES_PARALELAS', 4), timeout=30
+    )
 
-    # Converte imagem para Base64
-    imagem_base64 = base64.b64encode(arquivo.read()).decode('utf-8')
-    mime_type = arquivo.mimetype # ex: image/jpeg
+    def eventos():
+        corrigidas = 0
+        for indice, texto_ia, erro in lote:
+            id_aluno = respostas[indice].get('id_aluno')
+            dados = {"indice": indice, "id_aluno": id_aluno}
+            try:
+                if erro is not None:
+                    raise erro
+                resultado = _json_da_ia(texto_ia)
+                dados.update(status="success", nota=resultado['nota'], feedback=resultado['feedback'])
+                if atividade is not None:
+                    dados["nota"] = _gravar_nota_ia(atividade, id_aluno, resultado['nota'], resultado['feedback'])
+                corrigidas += 1
+            except Exception as e:
+                db.session.rollback()
+                dados.update(status="error", message=str(e))
+            yield evento_sse(dados, 'resultado')
+        yield evento_sse({"total": len(respostas), "corrigidas": corrigidas}, 'fim')
+
+    return resposta_sse(eventos())
+
+def _partes_correcao_foto(imagem, mime_type, valor_total, gabarito_ou_contexto):
+    """Prompt + imagem (multimodal) da correção de uma prova fotografada (imagem: bytes ou stream)."""
+    # Reduz/recodifica (sem EXIF) e converte para Base64
+    imagem_bytes, mime_type = preparar_imagem_ia(imagem, mime_type)
+    imagem_base64 = base64.b64encode(imagem_bytes).decode('utf-8')
 
     prompt = f"""
     Aja como um professor corrigindo uma prova real baseada nesta imagem.
@@ -1541,29 +1676,156 @@ def corrigir_prova_foto():
     }}
     """
 
-    # CORREÇÃO: USANDO MODELO 2.5 COMO SOLICITADO
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    
-    # Payload específico para envio de imagem (Multimodal)
-    data = {
-        "contents": [{
-            "parts": [
-                {"text": prompt},
-                {"inline_data": {"mime_type": mime_type, "data": imagem_base64}}
-            ]
-        }]
-    }
+    # Partes específicas para envio de imagem (Multimodal)
+    return [
+        {"text": prompt},
+        {"inline_data": {"mime_type": mime_type, "data": imagem_base64}}
+    ]
+
+def _json_da_ia(texto_ia):
+    texto_ia = texto_ia.replace('```json', '').replace('```', '').strip()
+    return json.loads(texto_ia)
+
+@alunos_bp.route('/corrigir_prova_foto', methods=['POST'])
+@login_required
+@limitar_ia()
+def corrigir_prova_foto():
+    api_key = current_app.config.get('GOOGLE_API_KEY')
+    if not api_key:
+        return jsonify({"status": "error", "message": "API Key não configurada."}), 500
+
+    # Recebe a imagem e dados
+    arquivo = request.files.get('imagem_prova')
+    gabarito_ou_contexto = request.form.get('contexto', '')
+    valor_total = request.form.get('valor_total', 10.0)
+
+    if not arquivo:
+        return jsonify({"status": "error", "message": "Nenhuma imagem enviada."}), 400
+
+    partes = _partes_correcao_foto(arquivo.stream, arquivo.mimetype, valor_total, gabarito_ou_contexto)
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data), timeout=60)
-        response.raise_for_status()
-        
-        texto_ia = response.json()['candidates'][0]['content']['parts'][0]['text']
-        texto_ia = texto_ia.replace('```json', '').replace('```', '').strip()
-        resultado = json.loads(texto_ia)
+        texto_ia = obter_cliente_ia().gerar_conteudo(partes, timeout=60, cache=_json_da_ia)
+        resultado = _json_da_ia(texto_ia)
         
         return jsonify({"status": "success", **resultado})
         
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ------------------- CORREÇÃO DE PROVAS EM LOTE (JOB) -------------------
+
+@alunos_bp.route('/atividade/<int:id_atividade>/corrigir_provas_foto_lote', methods=['POST'])
+@login_required
+@limitar_ia(custo=lambda req: len(req.files.getlist('imagens_prova')))
+def corrigir_provas_foto_lote(id_atividade):
+    """
+    Recebe várias fotos de prova de uma atividade (imagens_prova + id_aluno, na mesma
+    ordem) e enfileira a correção. Responde 202 com o job: o progresso sai em
+    GET /jobs/<id> e o relatório (JSON) em GET /jobs/<id>/download.
+    As notas são gravadas em Presenca à medida que cada prova é corrigida.
+    """
+    atividade = Atividade.query.get_or_404(id_atividade)
+    if not atividade.turma or atividade.turma.autor != current_user:
+        return jsonify({"status": "error", "message": "Não autorizado"}), 403
+
+    if not current_app.config.get('GOOGLE_API_KEY'):
+        return jsonify({"status": "error", "message": "API Key não configurada."}), 500
+
+    arquivos = [a for a in request.files.getlist('imagens_prova') if a and a.filename]
+    ids_alunos = request.form.getlist('id_aluno', type=int)
+
+    if not arquivos:
+        return jsonify({"status": "error", "message": "Nenhuma imagem enviada."}), 400
+    max_fotos = current_app.config.get('IA_MAX_FOTOS_LOTE', 40)
+    if len(arquivos) > max_fotos:
+        return jsonify({"status": "error", "message": f"Envie no máximo {max_fotos} provas por vez."}), 400
+    if len(arquivos) != len(ids_alunos):
+        return jsonify({"status": "error", "message": "Informe um aluno para cada imagem."}), 400
+
+    ids_turma = {id_aluno for (id_aluno,) in db.session.query(Aluno.id).filter_by(id_turma=atividade.id_turma)}
+    if not set(ids_alunos) <= ids_turma:
+        return jsonify({"status": "error", "message": "Aluno não pertence à turma da atividade."}), 400
+
+    pasta, caminhos = guardar_arquivos_entrada(arquivos)
+    itens = [
+        {"id_aluno": id_aluno, "caminho": caminho, "mime_type": arquivo.mimetype}
+        for id_aluno, caminho, arquivo in zip(ids_alunos, caminhos, arquivos)
+    ]
+    parametros = {
+        "id_atividade": atividade.id,
+        "contexto": request.form.get('contexto', ''),
+        "pasta": pasta,
+        "itens": itens
+    }
+    job = enfileirar_job(
+        'alunos.correcao_provas_foto', current_user.id, parametros,
+        download_name=f"correcao_{secure_filename(atividade.titulo or 'atividade')}.json",
+        mimetype='application/json', total_itens=len(itens)
+    )
+    return jsonify(resposta_job(job)), 202
+
+def _gravar_nota_ia(atividade, id_aluno, nota, feedback):
+    """Grava a nota corrigida pela IA (upsert) e atualiza o resumo do aluno."""
+    peso = atividade.peso or 0.0
+    nota = max(float(nota), 0.0)
+    if peso:
+        nota = min(nota, peso)  # A IA às vezes soma acima do valor da prova
+    nota = round(nota, 1)
+    desempenho = round(nota / peso * 100) if peso else 0
+
+    upsert_presencas(
+        [{'id_aluno': id_aluno, 'id_atividade': atividade.id, 'nota': nota, 'desempenho': desempenho,
+          'status': 'Presente', 'participacao': 'Sim', 'observacoes': f"[IA]: {feedback}" if feedback else None}],
+        campos_atualizar=['nota', 'desempenho']
+    )
+    atualizar_resumos([unidade_da_atividade(atividade)], ids_alunos=[id_aluno])
+    db.session.commit()
+    return nota
+
+@registrar_tarefa('alunos.correcao_provas_foto', com_progresso=True, ia=True)
+def _tarefa_correcao_provas_foto(parametros, destino, progresso):
+    try:
+        atividade = db.session.get(Atividade, parametros['id_atividade'])
+        if not atividade:
+            raise ValueError("Atividade não encontrada.")
+
+        itens = parametros['itens']
+        valor_total = atividade.peso or 10.0
+        nomes = dict(db.session.query(Aluno.id, Aluno.nome).filter(Aluno.id.in_([i['id_aluno'] for i in itens])))
+
+        def preparar(item):
+            # Lida só quando entra em voo: no máximo IA_MAX_CORRECOES_PARALELAS imagens em memória
+            with open(item['caminho'], 'rb') as f:
+                return _partes_correcao_foto(f, item['mime_type'], valor_total, parametros.get('contexto', ''))
+
+        relatorio = [None] * len(itens)
+        concluidos = 0
+        lote = obter_cliente_ia().gerar_em_lote(
+            itens, max_paralelo=current_app.config.get('IA_MAX_CORRECOES_PARALELAS', 4),
+            preparar=preparar, timeout=60
+        )
+        for indice, texto_ia, erro in lote:
+            id_aluno = itens[indice]['id_aluno']
+            linha = {"id_aluno": id_aluno, "aluno": nomes.get(id_aluno)}
+            try:
+                if erro is not None:
+                    raise erro
+                resultado = _json_da_ia(texto_ia)
+                linha["nota"] = _gravar_nota_ia(
+                    atividade, id_aluno, resultado['nota_calculada'], resultado.get('feedback_geral')
+                )
+                linha["resumo_correcao"] = resultado.get('resumo_correcao')
+                linha["feedback_geral"] = resultado.get('feedback_geral')
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao corrigir prova do aluno {id_aluno}: {e}")
+                linha["erro"] = str(e)
+            relatorio[indice] = linha
+
+            concluidos += 1
+            progresso(concluidos, len(itens))
+
+        destino.write(json.dumps(relatorio, ensure_ascii=False, indent=2).encode('utf-8'))
+    finally:
+        remover_arquivos_entrada(parametros['pasta'])
@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify
 from flask_login import login_required, current_user
 
+from app.services.limite_ia_service import obter_limitador_ia
+
 # Blueprint para API (JSON)
 # Prefixo /api/v1 permite versionamento futuro sem quebrar apps antigos
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
@@ -21,5 +23,11 @@ def me():
         "role": current_user.role
     })
 
+@api_bp.route('/ia/limites', methods=['GET'])
+@login_required
+def limites_ia():
+    """Contadores do limitador da IA (em voo, na fila, rejeitados, concluídos)."""
+    return jsonify(obter_limitador_ia().contadores())
+
 # Aqui entraremos futuramente com rotas como:
 # @api_bp.route('/alunos/sync', methods=['POST']) -> Para sincronizar SQLite offline
\ No newline at end of file
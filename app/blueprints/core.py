@@ -1,23 +1,33 @@
 import os
 from datetime import datetime
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
-from sqlalchemy import func, case
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from werkzeug.utils import secure_filename
 from flask_login import login_required, current_user
 
 # --- IMPORTS DE MODELOS E FORMS ---
 try:
     # CORREÇÃO: Adicionando Role aos imports
-    from app.models import db, User, Turma, Aluno, Atividade, Lembrete, Horario, BlocoAula, Presenca, DiarioBordo, Escola, Notificacao, Role
+    from app.models import db, User, Turma, Aluno, Atividade, Lembrete, Horario, BlocoAula, DiarioBordo, Escola, Notificacao, Role
     from app.forms.forms_legacy import TurmaForm, LembreteForm, UserProfileForm, EscolaForm, CoordenadorForm, ProfessorForm
+    from app.services.resumo_notas_service import atualizar_resumos, unidade_da_atividade
+    from app.services.notificacao_service import resumo_notificacoes, invalidar_resumo_notificacoes
+    from app.services.identidade_service import invalidar_usuario, invalidar_todos_usuarios
+    from app.services.analise_notas_service import carregar_analise, dividir, percentis
     try:
         from app.utils.helpers import enviar_notificacao
     except ImportError:
         def enviar_notificacao(user_id, msg, link): pass
 except ImportError:
     # CORREÇÃO: Adicionando Role aos imports
-    from ..models import db, User, Turma, Aluno, Atividade, Lembrete, Horario, BlocoAula, Presenca, DiarioBordo, Escola, Notificacao, Role
+    from ..models import db, User, Turma, Aluno, Atividade, Lembrete, Horario, BlocoAula, DiarioBordo, Escola, Notificacao, Role
     from ..forms.forms_legacy import TurmaForm, LembreteForm, UserProfileForm, EscolaForm, CoordenadorForm, ProfessorForm
+    from ..services.resumo_notas_service import atualizar_resumos, unidade_da_atividade
+    from ..services.notificacao_service import resumo_notificacoes, invalidar_resumo_notificacoes
+    from ..services.identidade_service import invalidar_usuario, invalidar_todos_usuarios
+    from ..services.analise_notas_service import carregar_analise, dividir, percentis
     try:
         from ..utils.helpers import enviar_notificacao
     except ImportError:
@@ -31,19 +41,13 @@ def inject_notifications_logic():
     """
     Injeta variáveis globais como notificações em todos os templates.
     """
-    num_notificacoes = 0
-    notificacoes_topo = []
-
     if current_user.is_authenticated:
-        # Pega o número de notificações não lidas
-        num_notificacoes = Notificacao.query.filter_by(destinatario=current_user, lida=False).count()
-        
-        # Pega as últimas 5 notificações para o dropdown (lidas e não lidas)
-        notificacoes_topo = Notificacao.query.filter_by(destinatario=current_user).order_by(Notificacao.data_criacao.desc()).limit(5).all()
-        
+        # Contador + últimas 5 notificações, em cache por usuário (invalidado nas escritas)
+        return resumo_notificacoes(current_user.id)
+
     return dict(
-        num_notificacoes=num_notificacoes,
-        notificacoes_topo=notificacoes_topo
+        num_notificacoes=0,
+        notificacoes_topo=[]
     )
 # Exportar a função para o __init__.py fazer o registro:
 inject_notifications_logic = inject_notifications_logic
@@ -187,70 +191,62 @@ def dashboard_global():
         .join(Turma)\
         .filter(Turma.autor_id == current_user.id).scalar()
 
-    desempenho_turmas_raw = db.session.query(
-        Turma.nome,
-        func.avg(Presenca.desempenho).label('media_desempenho')
-    ).select_from(Turma).join(Turma.alunos, isouter=True).join(Aluno.presencas, isouter=True)\
-     .filter(Turma.autor_id == current_user.id)\
-     .group_by(Turma.nome)\
-     .order_by(Turma.nome).all()
-     
-    frequencia_turmas_raw = db.session.query(
-        Turma.nome,
-        func.avg(case((Presenca.status == 'Presente', 100.0), (Presenca.status == 'Justificado', 100.0), else_=0.0)).label('media_frequencia')
-    ).select_from(Turma).join(Turma.alunos, isouter=True).join(Aluno.presencas, isouter=True)\
-     .filter(Turma.autor_id == current_user.id)\
-     .group_by(Turma.nome).all()
-
-    dados_combinados = {}
-    for d in desempenho_turmas_raw:
-        dados_combinados[d.nome] = {"desempenho": float(d.media_desempenho) if d.media_desempenho else 0}
-        
-    for f in frequencia_turmas_raw:
-        if f.nome not in dados_combinados:
-            dados_combinados[f.nome] = {}
-        dados_combinados[f.nome]['frequencia'] = float(f.media_frequencia) if f.media_frequencia else 0
+    # Totais do resumo materializado (resumo_notas) em arrays, sem varrer as presenças
+    turmas = db.session.query(Turma.id, Turma.nome)\
+        .filter(Turma.autor_id == current_user.id)\
+        .order_by(Turma.nome).all()
+    ids_turmas = [id_turma for id_turma, _ in turmas]
+    analise = carregar_analise(Aluno.id_turma.in_(ids_turmas))
+
+    # Por aluno (na ordem de analise.ids_alunos)
+    registros = analise.por_aluno(analise.total_registros)
+    pontos_obtidos = analise.por_aluno(analise.soma_notas)
+    pontos_max = analise.por_aluno(analise.soma_pesos_registros)
+    percentual = dividir(pontos_obtidos, pontos_max) * 100
+    com_pontos = pontos_max > 0
+    percentil = percentis(percentual, com_pontos)
+
+    # Por turma (turmas sem alunos também aparecem nos gráficos, zeradas)
+    codigo_turma = {id_turma: i for i, id_turma in enumerate(ids_turmas)}
+    turma_linha = np.array([codigo_turma[t] for t in analise.turma], dtype=np.int64)
+    turma_aluno = np.zeros(len(analise.ids_alunos), dtype=np.int64)
+    turma_aluno[analise.indice_aluno] = turma_linha
+    desempenho_turmas = dividir(
+        analise.por_grupo(turma_linha, len(turmas), analise.soma_desempenho),
+        analise.por_grupo(turma_linha, len(turmas), analise.total_desempenho)
+    )
+    # Aluno sem nenhum registro conta como uma linha de frequência 0%
+    frequencia_turmas = dividir(
+        analise.por_grupo(turma_linha, len(turmas), analise.frequentes()),
+        analise.por_grupo(turma_aluno, len(turmas), np.maximum(registros, 1))
+    ) * 100
 
     dados_graficos = [
-        {"turma": nome, **dados} 
-        for nome, dados in dados_combinados.items()
+        {
+            "turma": nome,
+            "desempenho": float(desempenho_turmas[i]),
+            "frequencia": float(frequencia_turmas[i])
+        }
+        for i, (_, nome) in enumerate(turmas)
     ]
-    
-    top_alunos_data = []
-    
-    # CORREÇÃO DA QUERY PARA EVITAR ERRO DE TABELA DUPLICADA
-    alunos_scores = db.session.query(
-        Aluno,
-        func.sum(Presenca.nota).label('pontos_obtidos'),
-        func.sum(Atividade.peso).label('pontos_max_aluno')
-    ).select_from(Aluno).join(Turma)\
-     .join(Presenca, isouter=True)\
-     .join(Atividade, isouter=True)\
-     .filter(Turma.autor_id == current_user.id)\
-     .group_by(Aluno.id, Aluno.nome)\
-     .all()
-     
-    for aluno, pontos_obtidos, pontos_max_aluno in alunos_scores:
-        pontos_obtidos = float(pontos_obtidos) if pontos_obtidos else 0.0
-        pontos_max_aluno = float(pontos_max_aluno) if pontos_max_aluno and pontos_max_aluno > 0 else 0.0
-        
-        if pontos_max_aluno > 0:
-            percentual = (pontos_obtidos / pontos_max_aluno) * 100
-        else:
-            percentual = 0.0
-            
-        top_alunos_data.append({
-            "aluno": aluno,
-            "pontos_obtidos": pontos_obtidos,
-            "pontos_max_aluno": pontos_max_aluno,
-            "percentual": percentual
-        })
-        
+
+    # Top 10 por aproveitamento (ordenação estável, como o sort anterior)
+    candidatos = np.flatnonzero(com_pontos)
+    top = candidatos[np.argsort(-percentual[candidatos], kind='stable')][:10]
+    alunos_top = {
+        a.id: a for a in Aluno.query.options(joinedload(Aluno.turma))
+        .filter(Aluno.id.in_([int(analise.ids_alunos[i]) for i in top]))
+    }
     top_alunos_data = [
-        a for a in top_alunos_data if a['pontos_max_aluno'] > 0
+        {
+            "aluno": alunos_top[int(analise.ids_alunos[i])],
+            "pontos_obtidos": float(pontos_obtidos[i]),
+            "pontos_max_aluno": float(pontos_max[i]),
+            "percentual": float(percentual[i]),
+            "percentil": float(percentil[i])
+        }
+        for i in top
     ]
-    top_alunos_data.sort(key=lambda x: x['percentual'], reverse=True)
-    top_alunos_data = top_alunos_data[:10]
 
     # --- CORREÇÃO: PREPARAÇÃO DOS DADOS PARA GRÁFICOS (CHART.JS) ---
     chart_labels = [d['turma'] for d in dados_graficos]
@@ -282,6 +278,7 @@ def ler_notificacao(id):
     
     notificacao.lida = True
     db.session.commit()
+    invalidar_resumo_notificacoes(current_user.id)
     
     if notificacao.link:
         return redirect(notificacao.link)
@@ -292,6 +289,7 @@ def ler_notificacao(id):
 def ler_todas_notificacoes():
     Notificacao.query.filter_by(destinatario=current_user, lida=False).update({'lida': True})
     db.session.commit()
+    invalidar_resumo_notificacoes(current_user.id)
     flash('Todas as notificações marcadas como lidas.', 'success')
     return redirect(request.referrer or url_for('core.index'))
 
@@ -375,7 +373,9 @@ def excluir_atividade(id):
         flash('Não autorizado.', 'danger')
         return redirect(url_for('core.index'))
 
+    chave_resumo = unidade_da_atividade(atividade)
     db.session.delete(atividade)
+    atualizar_resumos([chave_resumo])
     db.session.commit()
     flash('Atividade removida com sucesso.', 'success')
     return redirect(url_for('core.listar_atividades'))
@@ -417,6 +417,7 @@ def edit_perfil():
         current_user.telefone = form.telefone.data
         current_user.genero = form.genero.data 
         db.session.commit()
+        invalidar_usuario(current_user.id)
         flash('Perfil e preferências atualizados com sucesso!', 'success')
         return redirect(url_for('core.edit_perfil'))
 
@@ -471,6 +472,7 @@ def excluir_usuario(id):
         return redirect(request.referrer)
     db.session.delete(user)
     db.session.commit()
+    invalidar_usuario(id)
     flash('Usuário removido com sucesso.', 'success')
     return redirect(request.referrer)
 
@@ -517,6 +519,7 @@ def editar_escola(id):
     if form.validate_on_submit():
         form.populate_obj(escola)
         db.session.commit()
+        invalidar_todos_usuarios()
         flash('Escola atualizada com sucesso!', 'success')
         return redirect(url_for('core.listar_escolas'))
     return render_template('edit/edit_escola.html', form=form, escola=escola)
@@ -531,6 +534,7 @@ def excluir_escola(id):
     escola = Escola.query.get_or_404(id)
     db.session.delete(escola)
     db.session.commit()
+    invalidar_todos_usuarios()
     flash('Escola excluída.', 'success')
     return redirect(url_for('core.listar_escolas'))
 
@@ -596,6 +600,7 @@ def editar_coordenador(id):
             from app import bcrypt
             coord.password_hash = bcrypt.generate_password_hash(form.senha.data).decode('utf-8')
         db.session.commit()
+        invalidar_usuario(coord.id)
         flash('Coordenador atualizado!', 'success')
         return redirect(url_for('core.listar_coordenadores'))
     return render_template('edit/edit_coordenador.html', form=form, coord=coord)
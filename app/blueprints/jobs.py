@@ -0,0 +1,67 @@
+from flask import Blueprint, jsonify, send_file, current_app
+from flask_login import login_required, current_user
+
+from app.models import db, Job
+from app.services.job_service import (
+    resposta_job, caminho_arquivo_job, STATUS_CONCLUIDO, STATUS_ERRO
+)
+from app.utils.helpers import evento_sse, resposta_sse
+
+# Blueprint de acompanhamento de tarefas em segundo plano (exportações)
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def _job_do_usuario(id_job):
+    job = db.session.get(Job, id_job)
+    if not job or job.id_user != current_user.id:
+        return None
+    return job
+
+
+@jobs_bp.route('/<id_job>')
+@login_required
+def status_job(id_job):
+    job = _job_do_usuario(id_job)
+    if not job:
+        return jsonify({"status": "error", "message": "Tarefa não encontrada."}), 404
+    return jsonify(resposta_job(job))
+
+
+@jobs_bp.route('/<id_job>/eventos')
+@login_required
+def eventos_job(id_job):
+    """
+    Status do job em SSE (alternativa ao polling) sem prender a thread do worker:
+    cada conexão consulta o job uma vez, envia 'progresso' (ou 'fim' ao concluir/falhar)
+    e fecha com 'retry:' de JOBS_SSE_INTERVALO; o EventSource reconecta sozinho.
+    """
+    job = _job_do_usuario(id_job)
+    if not job:
+        return jsonify({"status": "error", "message": "Tarefa não encontrada."}), 404
+
+    dados = resposta_job(job)
+    evento = 'fim' if dados['job_status'] in (STATUS_CONCLUIDO, STATUS_ERRO) else 'progresso'
+    retry = int(current_app.config.get('JOBS_SSE_INTERVALO', 1.5) * 1000)
+    return resposta_sse([f"retry: {retry}\n" + evento_sse(dados, evento)])
+
+
+@jobs_bp.route('/<id_job>/download')
+@login_required
+def download_job(id_job):
+    job = _job_do_usuario(id_job)
+    if not job:
+        return jsonify({"status": "error", "message": "Tarefa não encontrada."}), 404
+
+    if job.status != STATUS_CONCLUIDO:
+        return jsonify({"status": "error", "message": "Arquivo ainda não está pronto."}), 409
+
+    caminho = caminho_arquivo_job(job)
+    if not caminho:
+        return jsonify({"status": "error", "message": "Arquivo expirado. Gere a exportação novamente."}), 410
+
+    return send_file(
+        caminho,
+        download_name=job.download_name,
+        as_attachment=True,
+        mimetype=job.mimetype
+    )
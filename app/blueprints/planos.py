@@ -1,14 +1,12 @@
 # blueprints/planos.py
 
 import os
-import requests 
 import json     
 from datetime import date, datetime 
-from io import BytesIO
 
 from flask import (
     Blueprint, render_template, redirect, url_for, 
-    send_file, flash, jsonify, send_from_directory, request, current_app
+    flash, jsonify, send_from_directory, request, current_app
 )
 from werkzeug.utils import secure_filename
 from sqlalchemy import func, case 
@@ -25,13 +23,25 @@ from reportlab.lib.styles import getSampleStyleSheet # Necessário para o PDF
 # --- Imports de Módulos Locais ---
 from app.models import (
     db, Turma, Aluno, Atividade, Presenca, PlanoDeAula, 
-    Material, Horario, BlocoAula, DiarioBordo, Lembrete
+    Material, Horario, BlocoAula, DiarioBordo, Lembrete, User
 )
 from app.forms.forms_legacy import (
     PlanoDeAulaForm, MaterialForm, DiarioForm 
 )
 # Assumindo que essas funções estão em 'utils.py'
-from app.utils.helpers import extrair_texto_de_ficheiro, obter_resumo_ia 
+from app.utils.helpers import (
+    extrair_texto_de_ficheiro, obter_resumos_ia, LIMITE_TEXTO_RESUMO,
+    pede_sse, resposta_sse, eventos_ia_sse
+)
+from app.services.resumo_notas_service import atualizar_resumos, unidade_da_atividade
+from app.services.export_service import MIMETYPE_DOCX, MIMETYPE_PDF
+from app.services.job_service import (
+    registrar_tarefa, responder_exportacao, guardar_arquivos_entrada, remover_arquivos_entrada
+)
+from app.services.ia_service import obter_cliente_ia, ErroIA
+from app.services.limite_ia_service import limitar_ia
+from app.services.resumo_ia_cache_service import origem_resumo
+from app.services.texto_extraido_service import texto_do_arquivo, indexar_arquivo, remover_texto_extraido
 from flask_login import login_required, current_user
 
 # Criação do Blueprint para Planejamento, Diário e Horário
@@ -115,23 +125,20 @@ def planejamento(id_turma):
 
 
 # --- ROTA DE IA (Gerar Plano) ---
-@planos_bp.route('/turma/<int:id_turma>/gerar_plano_ia', methods=['POST'])
-@login_required
-def gerar_plano_ia(id_turma):
-    turma = Turma.query.get_or_404(id_turma)
-    if turma.autor != current_user:
-        flash('Não autorizado.', 'danger')
-        return redirect(url_for('planos.planejamento', id_turma=id_turma))
-    
-    planos = PlanoDeAula.query.filter_by(id_turma=id_turma).order_by(PlanoDeAula.data_prevista.desc()).all()
-    tema_ia = request.form.get('tema_ia')
-    
-    api_key = current_app.config.get('GOOGLE_API_KEY')
-    if not api_key:
-        flash('A chave da API do Google AI não está configurada.', 'danger')
-        return redirect(url_for('planos.planejamento', id_turma=id_turma))
 
-    prompt = f"""
+CAMPOS_PLANO_IA = (
+    'titulo', 'conteudo', 'habilidades_bncc', 'objetivos', 'duracao',
+    'recursos', 'metodologia', 'avaliacao', 'referencias'
+)
+
+GENERATION_CONFIG_PLANO = {
+    "responseMimeType": "application/json",
+    "temperature": 0.7,
+    "maxOutputTokens": 8192,
+}
+
+def _prompt_plano_ia(turma, tema_ia):
+    return f"""
     Aja como um professor especialista em pedagogia.
     Gere um plano de aula detalhado para a turma '{turma.nome}'.
     O tema da aula é: '{tema_ia}'.
@@ -149,56 +156,74 @@ def gerar_plano_ia(id_turma):
     - "referencias": (string, sugestões de leitura)
     """
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
+def _interpretar_plano_ia(dados_ia_bruto, tema_ia):
+    """Converte a resposta da IA no dicionário de campos do plano (json.JSONDecodeError se inválida)."""
+    texto_json_limpo = dados_ia_bruto.strip()
+    # Remove blocos de código markdown se existirem
+    if texto_json_limpo.startswith('```json'):
+        texto_json_limpo = texto_json_limpo[7:]
+    if texto_json_limpo.endswith('```'):
+        texto_json_limpo = texto_json_limpo[:-3]
+
+    dados_ia = json.loads(texto_json_limpo)
+    plano = {campo: dados_ia.get(campo, '') for campo in CAMPOS_PLANO_IA}
+    plano['titulo'] = dados_ia.get('titulo', tema_ia)
+    return plano
+
+@planos_bp.route('/turma/<int:id_turma>/gerar_plano_ia', methods=['POST'])
+@login_required
+@limitar_ia()
+def gerar_plano_ia(id_turma):
+    turma = Turma.query.get_or_404(id_turma)
+    streaming = pede_sse()
+    if turma.autor != current_user:
+        if streaming:
+            return jsonify({"status": "error", "message": "Não autorizado."}), 403
+        flash('Não autorizado.', 'danger')
+        return redirect(url_for('planos.planejamento', id_turma=id_turma))
     
-    data = {
-        "contents": [{"parts": [{"text": prompt}]}],
-        "generationConfig": {
-            "responseMimeType": "application/json",
-            "temperature": 0.7,
-            "maxOutputTokens": 8192,
-        }
-    }
+    tema_ia = request.form.get('tema_ia')
+    
+    api_key = current_app.config.get('GOOGLE_API_KEY')
+    if not api_key:
+        if streaming:
+            return jsonify({"status": "error", "message": "API Key não configurada."}), 500
+        flash('A chave da API do Google AI não está configurada.', 'danger')
+        return redirect(url_for('planos.planejamento', id_turma=id_turma))
+
+    prompt = _prompt_plano_ia(turma, tema_ia)
+
+    # Streaming: o JSON chega aos pedaços ('parcial') e o evento 'fim' traz os campos
+    # prontos para o formulário; o timeout vale como intervalo máximo entre pedaços.
+    if streaming:
+        def _concluir(texto):
+            try:
+                return {"status": "success", "plano": _interpretar_plano_ia(texto, tema_ia)}
+            except (json.JSONDecodeError, AttributeError):
+                raise ValueError('Erro ao analisar a resposta da IA. Tente novamente.')
+
+        pedacos = obter_cliente_ia().gerar_texto_stream(prompt, generation_config=GENERATION_CONFIG_PLANO, timeout=20)
+        return resposta_sse(eventos_ia_sse(pedacos, _concluir))
+
+    planos = PlanoDeAula.query.filter_by(id_turma=id_turma).order_by(PlanoDeAula.data_prevista.desc()).all()
     
     dados_ia_bruto = "" 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data), timeout=20)
-        response.raise_for_status() 
-        
-        dados_ia_bruto = response.json()['candidates'][0]['content']['parts'][0]['text']
-        
-        if isinstance(dados_ia_bruto, str):
-            texto_json_limpo = dados_ia_bruto.strip()
-            # Remove blocos de código markdown se existirem
-            if texto_json_limpo.startswith('```json'):
-                texto_json_limpo = texto_json_limpo[7:]
-            if texto_json_limpo.endswith('```'):
-                texto_json_limpo = texto_json_limpo[:-3]
-                
-            dados_ia = json.loads(texto_json_limpo)
-        else:
-            dados_ia = dados_ia_bruto 
+        dados_ia_bruto = obter_cliente_ia().gerar_texto(prompt, generation_config=GENERATION_CONFIG_PLANO, timeout=20)
+        dados_ia = _interpretar_plano_ia(dados_ia_bruto, tema_ia)
 
         form = PlanoDeAulaForm()
         
         form.data_prevista.data = date.today()
-        form.titulo.data = dados_ia.get('titulo', tema_ia)
-        form.conteudo.data = dados_ia.get('conteudo', '')
-        form.habilidades_bncc.data = dados_ia.get('habilidades_bncc', '')
-        form.objetivos.data = dados_ia.get('objetivos', '')
-        form.duracao.data = dados_ia.get('duracao', '')
-        form.recursos.data = dados_ia.get('recursos', '')
-        form.metodologia.data = dados_ia.get('metodologia', '')
-        form.avaliacao.data = dados_ia.get('avaliacao', '')
-        form.referencias.data = dados_ia.get('referencias', '')
+        for campo, valor in dados_ia.items():
+            getattr(form, campo).data = valor
         
         flash('Plano de aula gerado pela IA! Revise os dados e clique em Salvar.', 'success')
 
-    except requests.exceptions.RequestException as e:
+    except ErroIA as e:
         flash(f'Erro ao conectar com a API de IA: {e}', 'danger')
         form = PlanoDeAulaForm() 
-    except (KeyError, IndexError, json.JSONDecodeError) as e:
+    except (KeyError, IndexError, AttributeError, json.JSONDecodeError) as e:
         flash(f'Erro ao analisar a resposta da IA. Tente novamente. Resposta: {dados_ia_bruto}', 'danger')
         form = PlanoDeAulaForm() 
 
@@ -296,6 +321,7 @@ def add_material(id_plano):
             
             filepath = os.path.join(docs_folder, filename_final)
             arquivo.save(filepath)
+            indexar_arquivo(filepath, arquivo.filename)  # Texto pronto para os prompts da IA
             
             novo_material = Material(id_plano_aula=id_plano, nome_arquivo=arquivo.filename, path_arquivo=filename_final)
             db.session.add(novo_material)
@@ -337,11 +363,13 @@ def deletar_material(id_material):
             
             if os.path.exists(filepath):
                 os.remove(filepath)
+                remover_texto_extraido(filepath)
             else:
                 # Fallback para arquivos antigos na raiz
                 filepath_root = os.path.join(current_app.config['UPLOAD_FOLDER'], material.path_arquivo)
                 if os.path.exists(filepath_root):
                     os.remove(filepath_root)
+                    remover_texto_extraido(filepath_root)
         
         db.session.delete(material)
         db.session.commit()
@@ -372,14 +400,18 @@ def delete_atividade(atividade_id):
             filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], 'docs', atividade.path_arquivo_anexo)
             if os.path.exists(filepath):
                 os.remove(filepath)
+                remover_texto_extraido(filepath)
             else:
                 # Fallback
                 filepath_root = os.path.join(current_app.config['UPLOAD_FOLDER'], atividade.path_arquivo_anexo)
                 if os.path.exists(filepath_root):
                     os.remove(filepath_root)
+                    remover_texto_extraido(filepath_root)
                 
         # 2. Deletar a Atividade (e suas Presenças via cascade)
+        chave_resumo = unidade_da_atividade(atividade)
         db.session.delete(atividade)
+        atualizar_resumos([chave_resumo])
         db.session.commit()
         
         flash(f'Atividade "{atividade.titulo}" deletada com sucesso.', 'success')
@@ -551,6 +583,7 @@ def salvar_bloco_horario():
 
 @planos_bp.route('/plano/<int:id_plano>/analisar_acessibilidade', methods=['POST'])
 @login_required
+@limitar_ia()
 def analisar_acessibilidade_ia(id_plano):
     plano = PlanoDeAula.query.get_or_404(id_plano)
     if plano.turma.autor != current_user:
@@ -576,14 +609,8 @@ def analisar_acessibilidade_ia(id_plano):
     Responda APENAS com as sugestões (use \n para listas).
     """
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=20)
-        response.raise_for_status() 
-        texto_analise = response.json()['candidates'][0]['content']['parts'][0]['text']
+        texto_analise = obter_cliente_ia().gerar_texto(prompt, timeout=20)
         return jsonify({"status": "success", "analise": texto_analise.strip()})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -615,15 +642,135 @@ def api_fontes_turma(id_turma):
     })
 
 
+# ------------------- PROVAS/QUESTÕES COM IA (SÍNCRONAS OU VIA JOB) -------------------
+# Com fetch (Accept JSON) a chamada à IA (até 120s) roda no pool de jobs e a rota
+# responde 202 na hora; o cliente acompanha por GET /jobs/<id> ou GET /jobs/<id>/eventos (SSE).
+# O formulário/link sem JavaScript continua gerando o arquivo no próprio request.
+
+def _escrever_prova_docx(parametros, destino):
+    """Resume as fontes, chama a IA e grava a prova em destino (no request ou no worker do job)."""
+    id_user = parametros['id_user']
+    try:
+        turma = db.session.get(Turma, parametros['id_turma'])
+        if not turma or turma.autor_id != id_user:
+            raise ValueError("Turma não encontrada.")
+        professor = db.session.get(User, id_user)
+        instrucoes_prova = parametros.get('instrucoes_prova')
+
+        api_key = current_app.config.get('GOOGLE_API_KEY')
+
+        # Cálculo da Média da Turma
+        total_max_score = sum(a.peso for a in turma.atividades if a.peso is not None)
+        
+        desempenho_medio_turma = calcular_media_desempenho_turma(turma.id)
+
+        # 2. Construir o "Mega-Prompt" (AGORA COM RESUMOS)
+        # Coleta as fontes em ordem e resume todas de uma vez (em paralelo) no passo 2d
+        fontes = []  # (título da seção, texto-fonte, tipo da fonte, origem no cache de resumos)
+        
+        # 2a. Dados do DB (Planos)
+        if parametros.get('planos_ids'):
+            planos = PlanoDeAula.query.filter(PlanoDeAula.id.in_(parametros['planos_ids'])).all()
+            for plano in planos:
+                if plano.turma.autor_id == id_user: # Segurança
+                    texto_fonte = f"Plano: {plano.titulo}\nConteúdo: {plano.conteudo}\nObjetivos: {plano.objetivos}"
+                    fontes.append((f"RESUMO DO PLANO '{plano.titulo}'", texto_fonte, f"Plano de Aula '{plano.titulo}'", origem_resumo(plano)))
+
+        # 2b. Dados do DB (Atividades)
+        if parametros.get('atividades_ids'):
+            atividades = Atividade.query.filter(Atividade.id.in_(parametros['atividades_ids'])).all()
+            for atividade in atividades:
+                if atividade.turma.autor_id == id_user: # Segurança
+                    texto_fonte = f"Atividade: {atividade.titulo}\nDescrição: {atividade.descricao or 'N/A'}"
+                    
+                    if atividade.path_arquivo_anexo:
+                        # --- CORREÇÃO: Caminho correto para docs ---
+                        # Tenta primeiro em docs, depois na raiz
+                        docs_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'docs')
+                        filepath = os.path.join(docs_folder, atividade.path_arquivo_anexo)
+                        
+                        if not os.path.exists(filepath):
+                            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], atividade.path_arquivo_anexo)
+
+                        if os.path.exists(filepath):
+                            texto_extraido = texto_do_arquivo(filepath, atividade.nome_arquivo_anexo)
+                            texto_fonte += f"\nConteúdo do Anexo (Questões): {texto_extraido[:2000]}..."
+
+                    fontes.append((f"RESUMO DO PLANO '{atividade.titulo}'", texto_fonte, f"Atividade '{atividade.titulo}'", origem_resumo(atividade)))
+
+        # 2c. Dados de Ficheiros (Upload, salvos em disco pela rota)
+        for caminho, filename in parametros.get('arquivos', []):
+            texto_extraido = extrair_texto_de_ficheiro(caminho, filename, LIMITE_TEXTO_RESUMO)
+            
+            if texto_extraido:
+                fontes.append((f"RESUMO DO FICHEIRO '{filename}'", texto_extraido, f"Ficheiro Anexado '{filename}'", None))
+
+        # 2d. Resumos em paralelo (tempo total ~ o do resumo mais lento), montados na ordem das fontes.
+        # Fontes inalteradas desde a última prova vêm do cache persistente, sem chamar a IA.
+        resumos = obter_resumos_ia([fonte[1:] for fonte in fontes], api_key)
+
+        prompt_contexto = "--- INÍCIO DO CONTEXTO DA AULA (Resumido pela IA) ---\n"
+        for (titulo, _, _, _), resumo in zip(fontes, resumos):
+            prompt_contexto += f"\n{titulo}:\n{resumo}\n"
+        prompt_contexto += "\n--- FIM DO CONTEXTO DA AULA ---\n"
+        
+        # 3. Criar o Prompt Final para a IA
+        prompt_final = f"""
+        Aja como um professor experiente criando uma prova de avaliação.
+        
+        --- CONTEXTO DA TURMA ---
+        Nome da Turma: '{turma.nome}'
+        Descrição da Turma (Série, Idade, Nível): '{turma.descricao or 'Nível não informado.'}'
+        Desempenho Médio Atual da Turma (0-100%): {desempenho_medio_turma:.1f}%
+        Pontuação Máxima Total da Turma (Total de Pontos): {total_max_score:.1f}
+        --- FIM DO CONTEXTO DA TURMA ---
+
+        Use o CONTEXTO RESUMIDO DA AULA abaixo como sua principal fonte de informação.
+        {prompt_contexto}
+        
+        Sua tarefa é criar uma nova prova que sintetize o material da aula, MAS que seja **adaptada para o nível e o desempenho atual da turma** descrito acima.
+        (Por exemplo, se a média for baixa, foque em revisão. Se for alta, adicione desafios).
+        
+        Siga estas instruções específicas:
+        {instrucoes_prova}
+        
+        Responda APENAS com o texto da prova (título, campos para nome/data, e as questões).
+        Não inclua 'Aqui está a prova:' ou qualquer outro texto introdutório.
+        Formate bem as questões.
+        """
+
+        # 4. Chamar a API Gemini
+        texto_prova = obter_cliente_ia().gerar_texto(prompt_final, timeout=120)
+    finally:
+        if parametros.get('pasta_entrada'):
+            remover_arquivos_entrada(parametros['pasta_entrada'])
+
+    # 5. Criar o DOCX
+    document = Document()
+    document.add_heading(f'Avaliação: {turma.nome}', level=1)
+    document.add_paragraph(f"Professor(a): {professor.username if professor else ''}")
+    document.add_paragraph("Nome: __________________________________________________ Data: ___/___/____")
+    document.add_paragraph(f"Turma: {turma.nome} ({turma.descricao or 'N/A'})")
+    document.add_heading('Instruções', level=2)
+    document.add_paragraph(instrucoes_prova)
+    document.add_heading('Questões', level=2)
+    
+    for linha in texto_prova.strip().split('\n'):
+        document.add_paragraph(linha)
+
+    document.save(destino)
+
+@registrar_tarefa('planos.prova_docx', ia=True)
+def _job_prova_docx(parametros, destino):
+    _escrever_prova_docx(parametros, destino)
+
 @planos_bp.route('/gerar_prova_docx', methods=['POST'])
 @login_required
+@limitar_ia()
 def gerar_prova_docx():
     # 1. Obter dados do formulário
     id_turma = request.form.get('turma')
-    planos_ids = request.form.getlist('planos_ids')
-    atividades_ids = request.form.getlist('atividades_ids')
-    fontes_externas = request.files.getlist('fontes_externas')
-    instrucoes_prova = request.form.get('instrucoes_prova')
+    fontes_externas = [f for f in request.files.getlist('fontes_externas') if f and f.filename != '']
 
     turma = Turma.query.get_or_404(id_turma)
     if turma.autor != current_user:
@@ -635,141 +782,36 @@ def gerar_prova_docx():
         flash('A chave da API do Google AI não está configurada.', 'danger')
         return redirect(url_for('planos.gerar_prova'))
 
-    # Cálculo da Média da Turma
-    atividades_turma_max_score = Turma.query.get_or_404(id_turma).atividades
-    total_max_score = sum(a.peso for a in atividades_turma_max_score if a.peso is not None)
-    
-    desempenho_medio_turma = calcular_media_desempenho_turma(id_turma)
-
-    # 2. Construir o "Mega-Prompt" (AGORA COM RESUMOS)
-    prompt_contexto = "--- INÍCIO DO CONTEXTO DA AULA (Resumido pela IA) ---\n"
-    
-    # 2a. Dados do DB (Planos)
-    if planos_ids:
-        planos = PlanoDeAula.query.filter(PlanoDeAula.id.in_(planos_ids)).all()
-        for plano in planos:
-            if plano.turma.autor == current_user: # Segurança
-                texto_fonte = f"Plano: {plano.titulo}\nConteúdo: {plano.conteudo}\nObjetivos: {plano.objetivos}"
-                resumo = obter_resumo_ia(texto_fonte, api_key, f"Plano de Aula '{plano.titulo}'")
-                prompt_contexto += f"\nRESUMO DO PLANO '{plano.titulo}':\n{resumo}\n"
-
-    # 2b. Dados do DB (Atividades)
-    if atividades_ids:
-        atividades = Atividade.query.filter(Atividade.id.in_(atividades_ids)).all()
-        for atividade in atividades:
-            if atividade.turma.autor == current_user: # Segurança
-                texto_fonte = f"Atividade: {atividade.titulo}\nDescrição: {atividade.descricao or 'N/A'}"
-                
-                if atividade.path_arquivo_anexo:
-                    # --- CORREÇÃO: Caminho correto para docs ---
-                    # Tenta primeiro em docs, depois na raiz
-                    docs_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'docs')
-                    filepath = os.path.join(docs_folder, atividade.path_arquivo_anexo)
-                    
-                    if not os.path.exists(filepath):
-                        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], atividade.path_arquivo_anexo)
-
-                    if os.path.exists(filepath):
-                        texto_extraido = extrair_texto_de_ficheiro(filepath, atividade.nome_arquivo_anexo)
-                        texto_fonte += f"\nConteúdo do Anexo (Questões): {texto_extraido[:2000]}..."
-
-                resumo = obter_resumo_ia(texto_fonte, api_key, f"Atividade '{atividade.titulo}'")
-                prompt_contexto += f"\nRESUMO DO PLANO '{atividade.titulo}':\n{resumo}\n"
-
-    # 2c. Dados de Ficheiros (Upload)
+    parametros = {
+        'id_turma': turma.id,
+        'id_user': current_user.id,
+        'planos_ids': [int(i) for i in request.form.getlist('planos_ids') if i.isdigit()],
+        'atividades_ids': [int(i) for i in request.form.getlist('atividades_ids') if i.isdigit()],
+        'instrucoes_prova': request.form.get('instrucoes_prova'),
+    }
+    # Uploads vão para o disco: o job lê depois do fim do request (e apaga ao terminar)
     if fontes_externas:
-        for ficheiro in fontes_externas:
-            if ficheiro and ficheiro.filename != '':
-                filename = secure_filename(ficheiro.filename)
-                
-                file_stream = BytesIO(ficheiro.read())
-                texto_extraido = extrair_texto_de_ficheiro(file_stream, filename)
-                
-                if texto_extraido:
-                    resumo = obter_resumo_ia(texto_extraido, api_key, f"Ficheiro Anexado '{filename}'")
-                    prompt_contexto += f"\nRESUMO DO FICHEIRO '{filename}':\n{resumo}\n"
-
-    prompt_contexto += "\n--- FIM DO CONTEXTO DA AULA ---\n"
-    
-    # 3. Criar o Prompt Final para a IA
-    prompt_final = f"""
-    Aja como um professor experiente criando uma prova de avaliação.
-    
-    --- CONTEXTO DA TURMA ---
-    Nome da Turma: '{turma.nome}'
-    Descrição da Turma (Série, Idade, Nível): '{turma.descricao or 'Nível não informado.'}'
-    Desempenho Médio Atual da Turma (0-100%): {desempenho_medio_turma:.1f}%
-    Pontuação Máxima Total da Turma (Total de Pontos): {total_max_score:.1f}
-    --- FIM DO CONTEXTO DA TURMA ---
-
-    Use o CONTEXTO RESUMIDO DA AULA abaixo como sua principal fonte de informação.
-    
-    Sua tarefa é criar uma nova prova que sintetize o material da aula, MAS que seja **adaptada para o nível e o desempenho atual da turma** descrito acima.
-    (Por exemplo, se a média for baixa, foque em revisão. Se for alta, adicione desafios).
-    
-    Siga estas instruções específicas:
-    {instrucoes_prova}
-    
-    Responda APENAS com o texto da prova (título, campos para nome/data, e as questões).
-    Não inclua 'Aqui está a prova:' ou qualquer outro texto introdutório.
-    Formate bem as questões.
-    """
-
-    # 4. Chamar a API Gemini
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"parts": [{"text": prompt_final}]}]}
+        pasta, caminhos = guardar_arquivos_entrada(fontes_externas)
+        parametros['pasta_entrada'] = pasta
+        parametros['arquivos'] = [
+            [caminho, secure_filename(f.filename)] for caminho, f in zip(caminhos, fontes_externas)
+        ]
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=120) 
-        response.raise_for_status() 
-        texto_prova = response.json()['candidates'][0]['content']['parts'][0]['text']
-
-        # 5. Criar o DOCX
-        document = Document()
-        document.add_heading(f'Avaliação: {turma.nome}', level=1)
-        document.add_paragraph(f"Professor(a): {current_user.username}")
-        document.add_paragraph("Nome: __________________________________________________ Data: ___/___/____")
-        document.add_paragraph(f"Turma: {turma.nome} ({turma.descricao or 'N/A'})")
-        document.add_heading('Instruções', level=2)
-        document.add_paragraph(instrucoes_prova)
-        document.add_heading('Questões', level=2)
-        
-        for linha in texto_prova.strip().split('\n'):
-            document.add_paragraph(linha)
-
-        # 6. Enviar Ficheiro
-        f = BytesIO()
-        document.save(f)
-        f.seek(0)
-        
-        return send_file(
-            f, 
-            download_name=f"Prova_{turma.nome.replace(' ', '_')}.docx", 
-            as_attachment=True,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        return responder_exportacao(
+            'planos.prova_docx', parametros,
+            f"Prova_{turma.nome.replace(' ', '_')}.docx",
+            MIMETYPE_DOCX
         )
-
     except Exception as e:
         flash(f"Erro ao gerar a prova com IA: {e}", "danger")
         return redirect(url_for('planos.gerar_prova'))
 
 
-@planos_bp.route('/plano/<int:id_plano>/gerar_questoes_docx')
-@login_required
-def gerar_questoes_docx(id_plano):
-    plano = PlanoDeAula.query.get_or_404(id_plano)
-    if plano.turma.autor != current_user:
-        flash('Não autorizado.', 'danger')
-        return redirect(url_for('core.index'))
-    
+def _escrever_questoes_docx(plano, destino):
+    """Chama a IA com o contexto do plano e grava as questões em destino."""
     id_turma = plano.id_turma 
 
-    api_key = current_app.config.get('GOOGLE_API_KEY')
-    if not api_key:
-        flash('A chave da API do Google AI não está configurada.', 'danger')
-        return redirect(url_for('planos.planejamento', id_turma=id_turma))
-
     atividades_turma_max_score = Turma.query.get_or_404(id_turma).atividades
     total_max_score = sum(a.peso for a in atividades_turma_max_score if a.peso is not None)
     
@@ -806,43 +848,85 @@ def gerar_questoes_docx(id_plano):
     """
 
     # 3. Chamar a API Gemini
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"parts": [{"text": prompt_final}]}]}
+    texto_questoes = obter_cliente_ia().gerar_texto(prompt_final, timeout=120)
+
+    # 4. Criar o DOCX
+    document = Document()
+    document.add_heading(f'Questões Sugeridas: {plano.titulo}', level=1)
+    document.add_paragraph(f"Turma: {plano.turma.nome} ({plano.turma.descricao or 'N/A'})")
+    document.add_paragraph("Professor(a): _________________")
+    document.add_paragraph("Nome: __________________________________________________ Data: ___/___/____")
+    document.add_heading('Questões', level=2)
+    
+    for linha in texto_questoes.strip().split('\n'):
+        document.add_paragraph(linha)
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=120) 
-        response.raise_for_status() 
-        texto_questoes = response.json()['candidates'][0]['content']['parts'][0]['text']
-
-        # 4. Criar o DOCX
-        document = Document()
-        document.add_heading(f'Questões Sugeridas: {plano.titulo}', level=1)
-        document.add_paragraph(f"Turma: {plano.turma.nome} ({plano.turma.descricao or 'N/A'})")
-        document.add_paragraph("Professor(a): _________________")
-        document.add_paragraph("Nome: __________________________________________________ Data: ___/___/____")
-        document.add_heading('Questões', level=2)
-        
-        for linha in texto_questoes.strip().split('\n'):
-            document.add_paragraph(linha)
+    document.save(destino)
 
-        # 5. Enviar Ficheiro
-        f = BytesIO()
-        document.save(f)
-        f.seek(0)
-        
-        return send_file(
-            f, 
-            download_name=f"Questoes_{plano.titulo.replace(' ', '_')}.docx", 
-            as_attachment=True,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        )
+@registrar_tarefa('planos.questoes_docx', ia=True)
+def _job_questoes_docx(parametros, destino):
+    _escrever_questoes_docx(_plano_do_job(parametros), destino)
+
+@planos_bp.route('/plano/<int:id_plano>/gerar_questoes_docx')
+@login_required
+@limitar_ia()
+def gerar_questoes_docx(id_plano):
+    plano = PlanoDeAula.query.get_or_404(id_plano)
+    if plano.turma.autor != current_user:
+        flash('Não autorizado.', 'danger')
+        return redirect(url_for('core.index'))
+    
+    api_key = current_app.config.get('GOOGLE_API_KEY')
+    if not api_key:
+        flash('A chave da API do Google AI não está configurada.', 'danger')
+        return redirect(url_for('planos.planejamento', id_turma=plano.id_turma))
 
+    try:
+        return responder_exportacao(
+            'planos.questoes_docx', {'id_plano': plano.id},
+            f"Questoes_{plano.titulo.replace(' ', '_')}.docx",
+            MIMETYPE_DOCX
+        )
     except Exception as e:
         flash(f"Erro ao gerar as questões com IA: {e}", "danger")
         return redirect(url_for('planos.planejamento', id_turma=plano.id_turma))
 
 
+# ------------------- EXPORTAÇÕES DO PLANO (SÍNCRONAS OU VIA JOB) -------------------
+
+def _plano_do_job(parametros):
+    plano = db.session.get(PlanoDeAula, parametros['id_plano'])
+    if not plano:
+        raise ValueError("Plano não encontrado.")
+    return plano
+
+def _escrever_plano_docx(plano, destino):
+    document = Document()
+    document.add_heading(plano.titulo, level=1)
+    document.add_paragraph(f"Data Prevista: {plano.data_prevista.strftime('%d/%m/%Y') if plano.data_prevista else 'N/A'}")
+    document.add_paragraph(f"Duração: {plano.duracao or 'N/A'}")
+
+    document.add_heading('Habilidades BNCC', level=2)
+    document.add_paragraph(plano.habilidades_bncc or 'N/A')
+    document.add_heading('Objetivos', level=2)
+    document.add_paragraph(plano.objetivos or 'N/A')
+    document.add_heading('Conteúdo', level=2)
+    document.add_paragraph(plano.conteudo or 'N/A')
+    document.add_heading('Metodologia', level=2)
+    document.add_paragraph(plano.metodologia or 'N/A')
+    document.add_heading('Recursos', level=2)
+    document.add_paragraph(plano.recursos or 'N/A')
+    document.add_heading('Avaliação', level=2)
+    document.add_paragraph(plano.avaliacao or 'N/A')
+    document.add_heading('Referências', level=2)
+    document.add_paragraph(plano.referencias or 'N/A')
+
+    document.save(destino)
+
+@registrar_tarefa('planos.plano_docx')
+def _job_plano_docx(parametros, destino):
+    _escrever_plano_docx(_plano_do_job(parametros), destino)
+
 @planos_bp.route('/plano/<int:id_plano>/exportar_docx')
 @login_required
 def exportar_docx(id_plano):
@@ -852,41 +936,52 @@ def exportar_docx(id_plano):
         return redirect(url_for('core.index'))
     
     try:
-        document = Document()
-        document.add_heading(plano.titulo, level=1)
-        document.add_paragraph(f"Data Prevista: {plano.data_prevista.strftime('%d/%m/%Y') if plano.data_prevista else 'N/A'}")
-        document.add_paragraph(f"Duração: {plano.duracao or 'N/A'}")
-
-        document.add_heading('Habilidades BNCC', level=2)
-        document.add_paragraph(plano.habilidades_bncc or 'N/A')
-        document.add_heading('Objetivos', level=2)
-        document.add_paragraph(plano.objetivos or 'N/A')
-        document.add_heading('Conteúdo', level=2)
-        document.add_paragraph(plano.conteudo or 'N/A')
-        document.add_heading('Metodologia', level=2)
-        document.add_paragraph(plano.metodologia or 'N/A')
-        document.add_heading('Recursos', level=2)
-        document.add_paragraph(plano.recursos or 'N/A')
-        document.add_heading('Avaliação', level=2)
-        document.add_paragraph(plano.avaliacao or 'N/A')
-        document.add_heading('Referências', level=2)
-        document.add_paragraph(plano.referencias or 'N/A')
-
-        f = BytesIO()
-        document.save(f)
-        f.seek(0)
-        
-        return send_file(
-            f, 
-            download_name=f"Plano_de_Aula_{plano.titulo.replace(' ', '_')}.docx", 
-            as_attachment=True,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        return responder_exportacao(
+            'planos.plano_docx', {'id_plano': plano.id},
+            f"Plano_de_Aula_{plano.titulo.replace(' ', '_')}.docx",
+            MIMETYPE_DOCX
         )
     except Exception as e:
         flash(f"Erro ao gerar DOCX: {e}", "danger")
         return redirect(url_for('planos.planejamento', id_turma=plano.id_turma))
 
 
+def _escrever_plano_pdf(plano, destino):
+    doc = SimpleDocTemplate(destino, pagesize=A4, rightMargin=inch, leftMargin=inch, topMargin=inch, bottomMargin=inch)
+    story = []
+    styles = getSampleStyleSheet()
+    
+    style_h1 = ParagraphStyle(name='Heading1', fontSize=16, alignment=TA_CENTER, spaceAfter=20)
+    style_h2 = ParagraphStyle(name='Heading2', fontSize=12, fontName="Helvetica-Bold", spaceAfter=6, spaceBefore=12)
+    style_body = ParagraphStyle(name='BodyText', fontSize=10, alignment=TA_LEFT, spaceAfter=10)
+    style_body_justify = ParagraphStyle(name='BodyTextJustify', fontSize=10, alignment=TA_JUSTIFY, spaceAfter=10)
+
+    story.append(Paragraph(plano.titulo, style_h1))
+    story.append(Paragraph(f"<b>Data Prevista:</b> {plano.data_prevista.strftime('%d/%m/%Y') if plano.data_prevista else 'N/A'}", style_body))
+    story.append(Paragraph(f"<b>Duração:</b> {plano.duracao or 'N/A'}", style_body))
+    
+    story.append(Paragraph('Habilidades BNCC', style_h2))
+    story.append(Paragraph(format_text_for_pdf(plano.habilidades_bncc), style_body_justify))
+    story.append(Paragraph('Objetivos', style_h2))
+    story.append(Paragraph(format_text_for_pdf(plano.objetivos), style_body_justify))
+    story.append(Paragraph('Conteúdo', style_h2))
+    story.append(Paragraph(format_text_for_pdf(plano.conteudo), style_body_justify))
+    story.append(Paragraph('Metodologia', style_h2))
+    story.append(Paragraph(format_text_for_pdf(plano.metodologia), style_body_justify))
+    story.append(Paragraph('Recursos', style_h2))
+    story.append(Paragraph(format_text_for_pdf(plano.recursos), style_body_justify))
+    story.append(Paragraph('Avaliação', style_h2))
+    story.append(Paragraph(format_text_for_pdf(plano.avaliacao), style_body_justify))
+    
+    story.append(Paragraph('Referências', style_h2))
+    story.append(Paragraph(format_text_for_pdf(plano.referencias), style_body_justify))
+
+    doc.build(story)
+
+@registrar_tarefa('planos.plano_pdf')
+def _job_plano_pdf(parametros, destino):
+    _escrever_plano_pdf(_plano_do_job(parametros), destino)
+
 @planos_bp.route('/plano/<int:id_plano>/exportar_pdf')
 @login_required
 def exportar_pdf(id_plano):
@@ -896,44 +991,10 @@ def exportar_pdf(id_plano):
         return redirect(url_for('core.index'))
     
     try:
-        f = BytesIO()
-        doc = SimpleDocTemplate(f, pagesize=A4, rightMargin=inch, leftMargin=inch, topMargin=inch, bottomMargin=inch)
-        story = []
-        styles = getSampleStyleSheet()
-        
-        style_h1 = ParagraphStyle(name='Heading1', fontSize=16, alignment=TA_CENTER, spaceAfter=20)
-        style_h2 = ParagraphStyle(name='Heading2', fontSize=12, fontName="Helvetica-Bold", spaceAfter=6, spaceBefore=12)
-        style_body = ParagraphStyle(name='BodyText', fontSize=10, alignment=TA_LEFT, spaceAfter=10)
-        style_body_justify = ParagraphStyle(name='BodyTextJustify', fontSize=10, alignment=TA_JUSTIFY, spaceAfter=10)
-
-        story.append(Paragraph(plano.titulo, style_h1))
-        story.append(Paragraph(f"<b>Data Prevista:</b> {plano.data_prevista.strftime('%d/%m/%Y') if plano.data_prevista else 'N/A'}", style_body))
-        story.append(Paragraph(f"<b>Duração:</b> {plano.duracao or 'N/A'}", style_body))
-        
-        story.append(Paragraph('Habilidades BNCC', style_h2))
-        story.append(Paragraph(format_text_for_pdf(plano.habilidades_bncc), style_body_justify))
-        story.append(Paragraph('Objetivos', style_h2))
-        story.append(Paragraph(format_text_for_pdf(plano.objetivos), style_body_justify))
-        story.append(Paragraph('Conteúdo', style_h2))
-        story.append(Paragraph(format_text_for_pdf(plano.conteudo), style_body_justify))
-        story.append(Paragraph('Metodologia', style_h2))
-        story.append(Paragraph(format_text_for_pdf(plano.metodologia), style_body_justify))
-        story.append(Paragraph('Recursos', style_h2))
-        story.append(Paragraph(format_text_for_pdf(plano.recursos), style_body_justify))
-        story.append(Paragraph('Avaliação', style_h2))
-        story.append(Paragraph(format_text_for_pdf(plano.avaliacao), style_body_justify))
-        
-        story.append(Paragraph('Referências', style_h2))
-        story.append(Paragraph(format_text_for_pdf(plano.referencias), style_body_justify))
-        
-        doc.build(story)
-        f.seek(0)
-        
-        return send_file(
-            f, 
-            download_name=f"Plano_de_Aula_{plano.titulo.replace(' ', '_')}.pdf", 
-            as_attachment=True,
-            mimetype='application/pdf'
+        return responder_exportacao(
+            'planos.plano_pdf', {'id_plano': plano.id},
+            f"Plano_de_Aula_{plano.titulo.replace(' ', '_')}.pdf",
+            MIMETYPE_PDF
         )
     except Exception as e:
         flash(f"Erro ao gerar PDF: {e}", "danger")
@@ -942,6 +1003,7 @@ def exportar_pdf(id_plano):
 
 @planos_bp.route('/diario/sugerir_ia', methods=['POST'])
 @login_required
+@limitar_ia()
 def sugerir_diario_ia():
     data_json = request.json
     id_turma = data_json.get('id_turma')
@@ -954,8 +1016,6 @@ def sugerir_diario_ia():
     if not turma or turma.autor != current_user:
         return jsonify({"status": "error", "message": "Turma inválida."}), 403
 
-    api_key = current_app.config.get('GOOGLE_API_KEY')
-    
     # 1. Buscar Contexto (O que estava planejado vs O que foi feito)
     planos = PlanoDeAula.query.filter_by(id_turma=id_turma, data_prevista=data_diario).all()
     atividades = Atividade.query.filter_by(id_turma=id_turma, data=data_diario).all()
@@ -983,14 +1043,8 @@ def sugerir_diario_ia():
     """
     
     # 3. Chamada à API
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    data = {"contents": [{"parts": [{"text": prompt}]}]}
-
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data), timeout=30)
-        response.raise_for_status()
-        sugestao = response.json()['candidates'][0]['content']['parts'][0]['text']
+        sugestao = obter_cliente_ia().gerar_texto(prompt, timeout=30)
         return jsonify({"status": "success", "sugestao": sugestao.strip()})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
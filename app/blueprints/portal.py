@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, flash
 from flask_login import login_required, current_user
 # CORREÇÃO: app.models em vez de app.models.base_legacy
-from app.models import Aluno, Presenca, Atividade, Turma, Notificacao, db
+from app.models import Aluno, Presenca, Atividade, Turma, Notificacao, ResumoNota, db
 from sqlalchemy import func
 
 portal_bp = Blueprint('portal', __name__, url_prefix='/portal')
@@ -23,9 +23,13 @@ def dashboard():
     # 2. Coletar Dados da Turma
     turma = aluno.turma
     
-    # 3. Calcular Frequência
-    total_presencas = Presenca.query.filter_by(id_aluno=aluno.id, status='Presente').count()
-    total_faltas = Presenca.query.filter_by(id_aluno=aluno.id, status='Ausente').count()
+    # 3. Calcular Frequência e média a partir do resumo materializado (resumo_notas)
+    total_presencas, total_faltas, soma_notas, total_notas = db.session.query(
+        func.coalesce(func.sum(ResumoNota.total_presentes), 0),
+        func.coalesce(func.sum(ResumoNota.total_ausentes), 0),
+        func.coalesce(func.sum(ResumoNota.soma_notas), 0.0),
+        func.coalesce(func.sum(ResumoNota.total_notas), 0)
+    ).filter(ResumoNota.id_aluno == aluno.id).one()
     total_aulas = total_presencas + total_faltas
     freq_percent = round((total_presencas / total_aulas * 100), 1) if total_aulas > 0 else 100
 
@@ -46,8 +50,7 @@ def dashboard():
         proximas_atividades = []
 
     # 6. Calcular Média Geral (Simples)
-    notas = [p.nota for p in aluno.presencas if p.nota is not None]
-    media_geral = round(sum(notas) / len(notas), 1) if notas else 0.0
+    media_geral = round(soma_notas / total_notas, 1) if total_notas else 0.0
 
     return render_template('aluno/dashboard.html', 
                            aluno=aluno,
@@ -1,5 +1,6 @@
 from .users import User, Role, Escola, Notificacao, Habilidade, Lembrete
 from .academic import Turma, Aluno, Horario, BlocoAula
-from .pedagogical import Atividade, Presenca, PlanoDeAula, Material, DiarioBordo
+from .pedagogical import Atividade, Presenca, PlanoDeAula, Material, DiarioBordo, ResumoNota, ResumoIA, TextoExtraido
+from .jobs import Job
 from .financial import * # Deixamos o financeiro genérico por simplicidade
 from app.extensions import db
\ No newline at end of file
@@ -7,11 +7,14 @@ class Turma(db.Model):
     nome = db.Column(db.String(100), nullable=False)
     descricao = db.Column(db.Text)
     turno = db.Column(db.String(50)) 
-    autor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False) 
+    autor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True) 
+    # Carimbo trocado a cada alteração de notas/atividades/alunos (ver versao_dados_service)
+    versao_dados = db.Column(db.String(32), nullable=True)
     
     alunos = db.relationship('Aluno', backref='turma', lazy=True)
     atividades = db.relationship('Atividade', backref='turma', lazy=True, cascade='all, delete-orphan')
     planos_de_aula = db.relationship('PlanoDeAula', backref='turma', lazy=True, cascade='all, delete-orphan')
+    resumos_notas = db.relationship('ResumoNota', lazy=True, cascade='all, delete-orphan')
 
     def __repr__(self):
         return f'<Turma {self.nome}>'
@@ -27,12 +30,13 @@ class Aluno(db.Model):
     email_responsavel = db.Column(db.String(120), nullable=True)
     telefone_responsavel = db.Column(db.String(20), nullable=True)
 
-    id_turma = db.Column(db.Integer, db.ForeignKey('turmas.id'), nullable=True) 
+    id_turma = db.Column(db.Integer, db.ForeignKey('turmas.id'), nullable=True, index=True) 
     id_user_conta = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True) 
 
     # --- ADICIONE ESTA LINHA ABAIXO PARA CORRIGIR O ERRO ---
     presencas = db.relationship('Presenca', backref='aluno', lazy=True, cascade='all, delete-orphan')
     # -------------------------------------------------------
+    resumos_notas = db.relationship('ResumoNota', lazy=True, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Aluno {self.nome}>'
@@ -0,0 +1,41 @@
+from app.extensions import db
+from datetime import datetime
+import json
+
+
+class Job(db.Model):
+    """
+    Tarefa executada fora do request (exportações, etc.).
+    Criada por app.services.job_service; o cliente consulta o status por polling
+    e baixa o arquivo gerado enquanto ele não expira.
+    """
+    __tablename__ = 'jobs'
+    id = db.Column(db.String(32), primary_key=True) # uuid4 hex
+    tipo = db.Column(db.String(50), nullable=False) # Nome da tarefa registrada (ex: 'alunos.matriz_pdf')
+    status = db.Column(db.String(20), nullable=False, default='pendente', index=True) # pendente, executando, concluido, erro
+    id_user = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+
+    parametros = db.Column(db.Text, nullable=True) # JSON
+    mensagem_erro = db.Column(db.Text, nullable=True)
+
+    # Arquivo gerado (caminho relativo a JOBS_FOLDER)
+    arquivo_path = db.Column(db.String(255), nullable=True)
+    download_name = db.Column(db.String(255), nullable=True)
+    mimetype = db.Column(db.String(100), nullable=True)
+
+    # Progresso de tarefas em lote (ex.: correção de várias provas); vazio nas demais
+    total_itens = db.Column(db.Integer, nullable=True)
+    itens_concluidos = db.Column(db.Integer, nullable=True)
+
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    iniciado_em = db.Column(db.DateTime, nullable=True)
+    atualizado_em = db.Column(db.DateTime, nullable=True) # Batimento do worker enquanto 'executando'
+    concluido_em = db.Column(db.DateTime, nullable=True)
+    expira_em = db.Column(db.DateTime, nullable=True, index=True)
+
+    @property
+    def parametros_dict(self):
+        return json.loads(self.parametros) if self.parametros else {}
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.tipo} {self.status}>'
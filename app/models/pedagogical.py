@@ -15,7 +15,7 @@ plano_habilidade = db.Table('plano_habilidade',
 class Atividade(db.Model):
     __tablename__ = 'atividades'
     id = db.Column(db.Integer, primary_key=True)
-    id_turma = db.Column(db.Integer, db.ForeignKey('turmas.id'), nullable=True) 
+    id_turma = db.Column(db.Integer, db.ForeignKey('turmas.id'), nullable=True, index=True) 
     titulo = db.Column(db.String(100))
     tipo = db.Column(db.String(50), default='Atividade') 
     peso = db.Column(db.Float) 
@@ -35,6 +35,10 @@ class Atividade(db.Model):
 
 class Presenca(db.Model):
     __tablename__ = 'presencas'
+    # Um único registro por (aluno, atividade): o gradebook faz upsert por este par
+    __table_args__ = (
+        db.Index('uq_presencas_aluno_atividade', 'id_aluno', 'id_atividade', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     id_aluno = db.Column(db.Integer, db.ForeignKey('alunos.id'))
     id_atividade = db.Column(db.Integer, db.ForeignKey('atividades.id'))
@@ -115,4 +119,71 @@ class DiarioBordo(db.Model):
     autor_diario = db.relationship('User', foreign_keys=[id_user], backref='diarios')
 
     nome_arquivo_anexo = db.Column(db.String(255), nullable=True)
-    path_arquivo_anexo = db.Column(db.String(255), nullable=True)
\ No newline at end of file
+    path_arquivo_anexo = db.Column(db.String(255), nullable=True)
+
+class ResumoNota(db.Model):
+    """
+    Resumo materializado das presenças por (aluno, turma da atividade, unidade).
+    Mantido por app.services.resumo_notas_service a cada escrita de nota;
+    os dashboards leem daqui em vez de varrer todas as presenças.
+    """
+    __tablename__ = 'resumo_notas'
+    id_aluno = db.Column(db.Integer, db.ForeignKey('alunos.id'), primary_key=True)
+    id_turma = db.Column(db.Integer, db.ForeignKey('turmas.id'), primary_key=True)
+    unidade = db.Column(db.String(20), primary_key=True) # '' quando a atividade não tem unidade
+
+    # Notas (apenas presenças com nota lançada)
+    soma_notas = db.Column(db.Float, nullable=False, default=0.0)
+    total_notas = db.Column(db.Integer, nullable=False, default=0)
+    soma_notas_ponderadas = db.Column(db.Float, nullable=False, default=0.0) # nota * peso (peso vazio = 1)
+    soma_pesos = db.Column(db.Float, nullable=False, default=0.0)
+    media = db.Column(db.Float, nullable=False, default=0.0) # média ponderada da unidade (1 casa)
+
+    # Todas as presenças registradas
+    total_registros = db.Column(db.Integer, nullable=False, default=0)
+    soma_pesos_registros = db.Column(db.Float, nullable=False, default=0.0) # peso das atividades com registro
+    total_presentes = db.Column(db.Integer, nullable=False, default=0)
+    total_ausentes = db.Column(db.Integer, nullable=False, default=0)
+    total_justificados = db.Column(db.Integer, nullable=False, default=0)
+    soma_desempenho = db.Column(db.Float, nullable=False, default=0.0)
+    total_desempenho = db.Column(db.Integer, nullable=False, default=0)
+
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ResumoNota Aluno:{self.id_aluno} Turma:{self.id_turma} {self.unidade}>'
+
+
+class ResumoIA(db.Model):
+    """
+    Cache persistente dos resumos da IA (obter_resumo_ia), endereçado pelo hash do
+    texto-fonte + tipo + modelo. Mantido por app.services.resumo_ia_cache_service
+    com limite de tamanho e descarte LRU (usado_em).
+    """
+    __tablename__ = 'resumos_ia'
+    chave = db.Column(db.String(64), primary_key=True) # sha256 hex
+    origem = db.Column(db.String(50), nullable=True, index=True) # 'plano:<id>', 'atividade:<id>' ou vazio (upload avulso)
+    modelo = db.Column(db.String(100), nullable=False)
+    resumo = db.Column(db.Text, nullable=False)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    usado_em = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<ResumoIA {self.chave[:12]} {self.origem}>'
+
+
+class TextoExtraido(db.Model):
+    """
+    Texto já extraído de um arquivo enviado (PDF/DOCX/TXT), para não reprocessar o
+    arquivo a cada prompt. Chave = caminho relativo a UPLOAD_FOLDER; mtime/tamanho
+    detectam arquivo substituído. Mantido por app.services.texto_extraido_service.
+    """
+    __tablename__ = 'textos_extraidos'
+    caminho = db.Column(db.String(255), primary_key=True)
+    mtime = db.Column(db.Float, nullable=False)
+    tamanho = db.Column(db.Integer, nullable=False)
+    texto = db.Column(db.Text, nullable=False, default='')
+    extraido_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TextoExtraido {self.caminho}>'
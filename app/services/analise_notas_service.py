@@ -0,0 +1,131 @@
+# app/services/analise_notas_service.py
+# Centraliza as análises de notas dos dashboards e boletins (médias, frequência, rankings).
+#
+# Uma única query traz as linhas do resumo materializado (resumo_notas: uma por
+# aluno × turma × unidade, já com somas de nota, peso, desempenho e status) para
+# arrays NumPy. Os totais por aluno, turma ou unidade saem de np.bincount sobre os
+# códigos de grupo, sem laços Python sobre objetos do ORM.
+
+import numpy as np
+
+from app.extensions import db
+from app.models import Aluno, ResumoNota
+
+# Colunas numéricas de resumo_notas carregadas em arrays (float64)
+COLUNAS_RESUMO = (
+    'soma_notas', 'total_notas', 'soma_notas_ponderadas', 'soma_pesos',
+    'total_registros', 'soma_pesos_registros', 'total_presentes', 'total_ausentes',
+    'total_justificados', 'soma_desempenho', 'total_desempenho'
+)
+
+
+def dividir(numerador, denominador):
+    """Divisão elemento a elemento; onde o denominador é 0 o resultado é 0."""
+    numerador = np.asarray(numerador, dtype=float)
+    denominador = np.asarray(denominador, dtype=float)
+    return np.divide(numerador, denominador, out=np.zeros(np.broadcast(numerador, denominador).shape),
+                     where=denominador != 0)
+
+
+def media_ponderada(notas, pesos):
+    """
+    Média ponderada de arrays de notas e pesos. Nota None/NaN é ignorada e peso
+    vazio/0 conta como 1 (mesma regra do resumo_notas). Sem notas, retorna 0.0.
+    """
+    notas = np.asarray(notas, dtype=float)
+    pesos = np.asarray(pesos, dtype=float)
+    pesos = np.where(np.isnan(pesos) | (pesos == 0), 1.0, pesos)
+    validas = ~np.isnan(notas)
+    soma_pesos = pesos[validas].sum()
+    if soma_pesos == 0:
+        return 0.0
+    return float(np.dot(notas[validas], pesos[validas]) / soma_pesos)
+
+
+def percentis(valores, mascara=None):
+    """
+    Percentil de cada valor (0-100): % dos valores considerados que são menores ou iguais.
+    mascara: só esses valores formam a distribuição; os demais recebem 0.
+    """
+    valores = np.asarray(valores, dtype=float)
+    base = np.sort(valores[mascara] if mascara is not None else valores)
+    if not base.size:
+        return np.zeros(valores.shape)
+    resultado = np.searchsorted(base, valores, side='right') * 100.0 / base.size
+    if mascara is not None:
+        resultado[~mascara] = 0.0
+    return resultado
+
+
+class AnaliseNotas:
+    """
+    Linhas de resumo_notas em arrays. Alunos sem resumo entram com uma linha zerada
+    (unidade None), para aparecerem nos totais por aluno e por turma.
+    Atributos por linha: aluno, turma (turma do aluno), unidade (código em self.unidades)
+    e uma coluna float para cada nome em COLUNAS_RESUMO.
+    """
+
+    def __init__(self, linhas):
+        codigos = {}
+        colunas = list(zip(*linhas)) if linhas else [()] * (3 + len(COLUNAS_RESUMO))
+
+        self.aluno = np.array(colunas[0], dtype=np.int64)
+        self.turma = np.array([t or 0 for t in colunas[1]], dtype=np.int64)
+        self.unidade = np.array(
+            [codigos.setdefault(u, len(codigos)) for u in colunas[2]], dtype=np.int64
+        )
+        self.unidades = list(codigos)
+        for nome, valores in zip(COLUNAS_RESUMO, colunas[3:]):
+            setattr(self, nome, np.array(valores, dtype=float))
+
+        # Alunos em ordem de id e, para cada linha, a posição do seu aluno
+        self.ids_alunos, self.indice_aluno = np.unique(self.aluno, return_inverse=True)
+
+    def __len__(self):
+        return len(self.aluno)
+
+    def posicoes_alunos(self):
+        """{id_aluno: posição nos arrays por aluno}."""
+        return {int(id_aluno): i for i, id_aluno in enumerate(self.ids_alunos)}
+
+    def por_aluno(self, valores, mascara=None):
+        """Soma de valores (array por linha) para cada aluno, na ordem de self.ids_alunos."""
+        return self._somar(self.indice_aluno, len(self.ids_alunos), valores, mascara)
+
+    def por_unidade(self, valores, mascara=None):
+        """Soma de valores para cada unidade, na ordem de self.unidades."""
+        return self._somar(self.unidade, len(self.unidades), valores, mascara)
+
+    def por_grupo(self, codigos, total, valores, mascara=None):
+        """Soma de valores para códigos de grupo arbitrários (0 <= código < total)."""
+        return self._somar(np.asarray(codigos, dtype=np.int64), total, valores, mascara)
+
+    @staticmethod
+    def _somar(codigos, total, valores, mascara):
+        if mascara is not None:
+            codigos, valores = codigos[mascara], valores[mascara]
+        return np.bincount(codigos, weights=valores, minlength=total)
+
+    def frequentes(self):
+        """Registros que contam como frequência (presente + justificado), por linha."""
+        return self.total_presentes + self.total_justificados
+
+
+def carregar_analise(*filtros, id_turma=None):
+    """
+    Uma query (alunos LEFT JOIN resumo_notas) com os filtros sobre Aluno.
+    id_turma: considera só os resumos daquela turma (senão, todos os do aluno).
+    """
+    condicao = ResumoNota.id_aluno == Aluno.id
+    if id_turma is not None:
+        condicao = db.and_(condicao, ResumoNota.id_turma == id_turma)
+
+    linhas = db.session.query(
+        Aluno.id, Aluno.id_turma, ResumoNota.unidade,
+        *[db.func.coalesce(getattr(ResumoNota, coluna), 0) for coluna in COLUNAS_RESUMO]
+    ).select_from(Aluno)\
+     .outerjoin(ResumoNota, condicao)\
+     .filter(*filtros)\
+     .all()
+
+    return AnaliseNotas(linhas)
@@ -0,0 +1,110 @@
+# app/services/cache_service.py
+# Centraliza o cache de curta duração da aplicação (memória do processo ou Redis compartilhado).
+#
+# Backend escolhido por configuração:
+#   CACHE_BACKEND = 'memoria' (padrão, por processo) | 'redis' (compartilhado entre workers do gunicorn)
+#   CACHE_REDIS_URL = 'redis://localhost:6379/0'
+# Qualquer objeto com get/set/delete também pode ser passado em CACHE_BACKEND.
+
+import pickle
+import threading
+import time
+
+from flask import current_app
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+PREFIXO_CHAVES = 'cortex:'
+
+
+class CacheMemoria:
+    """Cache com TTL em um dicionário do processo (cada worker tem o seu)."""
+
+    def __init__(self, max_itens=5000):
+        self.max_itens = max_itens
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em < time.monotonic():
+                del self._dados[chave]
+                return None
+            return valor
+
+    def set(self, chave, valor, ttl):
+        with self._lock:
+            if len(self._dados) >= self.max_itens:
+                self._remover_expirados()
+            if len(self._dados) >= self.max_itens:
+                # Ainda cheio: descarta a entrada mais antiga (ordem de inserção)
+                self._dados.pop(next(iter(self._dados)))
+            self._dados[chave] = (time.monotonic() + ttl, valor)
+
+    def delete(self, chave):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def _remover_expirados(self):
+        agora = time.monotonic()
+        for chave in [c for c, (expira_em, _) in self._dados.items() if expira_em < agora]:
+            del self._dados[chave]
+
+
+class CacheRedis:
+    """Cache compartilhado entre processos; valores serializados com pickle."""
+
+    def __init__(self, url):
+        self._cliente = redis.Redis.from_url(url)
+
+    def get(self, chave):
+        try:
+            bruto = self._cliente.get(PREFIXO_CHAVES + chave)
+        except redis.RedisError as e:
+            print(f"Erro ao ler cache Redis: {e}")
+            return None
+        return pickle.loads(bruto) if bruto is not None else None
+
+    def set(self, chave, valor, ttl):
+        try:
+            self._cliente.set(PREFIXO_CHAVES + chave, pickle.dumps(valor), ex=max(int(ttl), 1))
+        except redis.RedisError as e:
+            print(f"Erro ao gravar cache Redis: {e}")
+
+    def delete(self, chave):
+        try:
+            self._cliente.delete(PREFIXO_CHAVES + chave)
+        except redis.RedisError as e:
+            print(f"Erro ao invalidar cache Redis: {e}")
+
+
+def init_cache(app):
+    """Cria o backend configurado e o registra em app.extensions['cache']."""
+    backend = app.config.get('CACHE_BACKEND', 'memoria')
+
+    if backend == 'redis':
+        if redis is None:
+            print("AVISO: redis não instalado. Usando cache em memória. Instale com: pip install redis")
+            backend = CacheMemoria()
+        else:
+            backend = CacheRedis(app.config.get('CACHE_REDIS_URL') or 'redis://localhost:6379/0')
+    elif backend == 'memoria' or backend is None:
+        backend = CacheMemoria()
+
+    app.extensions['cache'] = backend
+    return backend
+
+
+def obter_cache():
+    """Backend de cache da aplicação atual."""
+    cache = current_app.extensions.get('cache')
+    if cache is None:
+        cache = init_cache(current_app)
+    return cache
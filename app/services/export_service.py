@@ -0,0 +1,109 @@
+# app/services/export_service.py
+# Centraliza a geração de planilhas XLSX em streaming (openpyxl write-only).
+#
+# As linhas são consumidas de um iterável (ex.: query com yield_per) e gravadas
+# direto no arquivo, sem montar lista/DataFrame em memória.
+
+import glob
+import os
+import re
+import tempfile
+import uuid
+
+from flask import current_app
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MIMETYPE_DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+MIMETYPE_PDF = 'application/pdf'
+
+# Linhas buscadas por vez no cursor do banco
+TAMANHO_LOTE_EXPORT = 500
+
+# Entra na chave do cache: incremente ao mudar o layout dos documentos gerados
+VERSAO_LAYOUT_EXPORT = 1
+
+
+def nome_planilha_valido(nome):
+    """Nome de aba aceito pelo Excel (máx. 31 caracteres, sem []:*?/\\)."""
+    nome = re.sub(r'[\[\]:*?/\\]', '-', nome or '').strip()
+    return nome[:31] or 'Planilha'
+
+
+def escrever_xlsx_streaming(cabecalho, linhas, nome_planilha='Planilha'):
+    """
+    Grava cabecalho + linhas em uma planilha write-only e devolve um arquivo
+    temporário (posicionado no início) pronto para send_file.
+    O arquivo é apagado automaticamente ao ser fechado.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(nome_planilha_valido(nome_planilha))
+
+    fonte_cabecalho = Font(bold=True)
+    celulas_cabecalho = []
+    for titulo in cabecalho:
+        celula = WriteOnlyCell(ws, value=titulo)
+        celula.font = fonte_cabecalho
+        celulas_cabecalho.append(celula)
+    ws.append(celulas_cabecalho)
+
+    for linha in linhas:
+        ws.append(linha)
+
+    arquivo = tempfile.TemporaryFile(suffix='.xlsx')
+    wb.save(arquivo)
+    arquivo.seek(0)
+    return arquivo
+
+
+# --- CACHE DE EXPORTAÇÕES (endereçado pela versão dos dados) ---
+
+def chave_exportacao_turma(turma, formato):
+    """
+    Chave do arquivo exportado: turma + formato + carimbo Turma.versao_dados.
+    Qualquer alteração nos dados da turma troca o carimbo e, portanto, a chave.
+    Também serve de ETag.
+    """
+    return f"turma{turma.id}-{formato}-{turma.versao_dados or 'inicial'}-l{VERSAO_LAYOUT_EXPORT}"
+
+
+def _pasta_cache_exportacoes():
+    pasta = current_app.config.get('EXPORT_CACHE_FOLDER') or \
+        os.path.join(current_app.instance_path, 'export_cache')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def exportacao_em_cache(chave, gerar):
+    """
+    Caminho do arquivo em cache para a chave; se não existir, chama gerar(destino)
+    para criá-lo. Versões antigas do mesmo documento (mesmo prefixo) são apagadas.
+    """
+    pasta = _pasta_cache_exportacoes()
+    caminho = os.path.join(pasta, chave)
+    if os.path.exists(caminho):
+        return caminho
+
+    # Nome temporário único: dois workers gerando a mesma chave não colidem
+    temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporario, 'wb') as destino:
+            gerar(destino)
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+    prefixo = chave.rsplit('-', 2)[0] + '-'
+    for antigo in glob.glob(os.path.join(glob.escape(pasta), glob.escape(prefixo) + '*')):
+        if antigo != caminho and not antigo.endswith('.tmp'):
+            try:
+                os.remove(antigo)
+            except OSError as e:
+                print(f"Erro ao remover exportação antiga {antigo}: {e}")
+
+    return caminho
+
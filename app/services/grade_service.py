@@ -1,22 +1,16 @@
 # app/services/grade_service.py
 # Centraliza cálculos matemáticos de notas e médias.
 
+from app.services.analise_notas_service import media_ponderada
+
 def calcular_media_ponderada(notas_com_pesos):
     """
     Recebe lista de tuplas (nota, peso).
     Ex: [(8.0, 2), (5.0, 1)]
-    Retorna a média ponderada.
+    Retorna a média ponderada (vetorizada em analise_notas_service).
     """
-    soma_notas = 0
-    soma_pesos = 0
-    
-    for nota, peso in notas_com_pesos:
-        if nota is not None:
-            p = peso if peso else 1
-            soma_notas += nota * p
-            soma_pesos += p
-            
-    if soma_pesos == 0:
+    if not notas_com_pesos:
         return 0.0
-        
-    return round(soma_notas / soma_pesos, 2)
\ No newline at end of file
+
+    notas, pesos = zip(*notas_com_pesos)
+    return round(media_ponderada(notas, pesos), 2)
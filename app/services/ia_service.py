@@ -0,0 +1,360 @@
+# app/services/ia_service.py
+# Centraliza as chamadas à API Gemini (generateContent).
+#
+# - Sessões HTTP keep-alive reaproveitadas (uma por thread, sem novo handshake TLS a cada chamada);
+# - Timeout de conexão e de leitura configuráveis;
+# - Retry com backoff exponencial para falhas transitórias (conexão, 429, 5xx);
+# - Núcleo concorrente (pool de threads, enviar() -> Future) para lotes, e fachada síncrona
+#   (gerar_texto) que roda na thread de quem chama;
+# - Cache opcional de respostas (cache=True) para pedidos determinísticos, como correções:
+#   chave = hash do modelo + config + partes (inclui bytes das imagens), com TTL e limite
+#   de itens; pedidos idênticos em voo ao mesmo tempo compartilham a mesma chamada.
+# - Streaming (gerar_stream): streamGenerateContent?alt=sse, gera o texto aos pedaços;
+#   o timeout de leitura vale para o intervalo entre pedaços, não para a resposta inteira.
+# IA_BASE_URL permite apontar para um servidor stub local em testes.
+
+import hashlib
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+from app.services.cache_service import CacheMemoria, CacheRedis, obter_cache
+
+MODELO_PADRAO = 'gemini-2.5-flash-preview-09-2025'
+MODELO_RESUMO = 'gemini-2.0-flash-exp'
+BASE_URL_PADRAO = 'https://generativelanguage.googleapis.com/v1beta'
+
+# Status HTTP que valem nova tentativa
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+
+class ErroIA(Exception):
+    """Falha ao obter resposta da IA (rede, HTTP ou resposta sem texto)."""
+
+
+class ClienteIA:
+    def __init__(self, api_key=None, base_url=BASE_URL_PADRAO, timeout_conexao=5.0,
+                 max_tentativas=3, backoff_base=0.5, max_workers=8,
+                 cache_respostas=None, cache_ttl=600):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout_conexao = timeout_conexao
+        self.max_tentativas = max(1, max_tentativas)
+        self.backoff_base = backoff_base
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ia')
+        self.cache_respostas = cache_respostas
+        self.cache_ttl = cache_ttl
+        self._em_voo = {}
+        self._em_voo_lock = threading.Lock()
+
+    # --- Núcleo concorrente ---
+
+    def enviar(self, partes, modelo=MODELO_PADRAO, generation_config=None, timeout=30, api_key=None,
+               cache=False):
+        """
+        Agenda uma chamada generateContent no pool e retorna um Future com o texto.
+        cache=True: reaproveita a resposta de um pedido idêntico recente (ou em andamento).
+        cache também pode ser uma função de validação: a resposta só entra no cache se
+        cache(texto) não levantar exceção (ex.: JSON inválido não fica gravado).
+        """
+        if not self._usa_cache(cache):
+            return self._executor.submit(self._gerar, partes, modelo, generation_config, timeout, api_key)
+
+        futuro, dono = self._futuro_em_voo(partes, modelo, generation_config, cache)
+        if dono:
+            self._executor.submit(self._executar, futuro, partes, modelo, generation_config, timeout, api_key)
+        return futuro
+
+    def gerar_em_lote(self, itens, max_paralelo=4, preparar=None, **kwargs):
+        """
+        Processa vários pedidos com no máximo max_paralelo em voo ao mesmo tempo.
+        itens são listas de partes, ou qualquer valor convertido por preparar(item)
+        no momento do envio (ex.: ler uma imagem só quando ela entra em voo).
+        Gera (indice, texto, erro) na ordem em que cada pedido termina.
+        """
+        limite = max(1, max_paralelo)
+        em_voo = {}
+        proximo = 0
+
+        def _enviar_proximo():
+            nonlocal proximo
+            indice = proximo
+            proximo += 1
+            try:
+                partes = preparar(itens[indice]) if preparar else itens[indice]
+                em_voo[self.enviar(partes, **kwargs)] = indice
+            except Exception as e:
+                return indice, e
+            return None
+
+        while proximo < len(itens) and len(em_voo) < limite:
+            falha = _enviar_proximo()
+            if falha:
+                yield falha[0], None, falha[1]
+
+        while em_voo:
+            concluidos, _ = wait(list(em_voo), return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                indice = em_voo.pop(futuro)
+                while proximo < len(itens) and len(em_voo) < limite:
+                    falha = _enviar_proximo()
+                    if falha:
+                        yield falha[0], None, falha[1]
+                try:
+                    yield indice, futuro.result(), None
+                except Exception as e:
+                    yield indice, None, e
+
+    def gerar_varios(self, prompts, **kwargs):
+        """Dispara vários prompts em paralelo; retorna os textos (ou a exceção) na mesma ordem."""
+        futures = [self.enviar([{"text": p}], **kwargs) for p in prompts]
+        resultados = []
+        for f in futures:
+            try:
+                resultados.append(f.result())
+            except Exception as e:
+                resultados.append(e)
+        return resultados
+
+    # --- Fachada síncrona ---
+
+    def gerar_texto(self, prompt, modelo=MODELO_PADRAO, generation_config=None, timeout=30, api_key=None,
+                    cache=False):
+        """Envia um prompt de texto e devolve o texto da primeira resposta."""
+        return self.gerar_conteudo([{"text": prompt}], modelo, generation_config, timeout, api_key, cache)
+
+    def gerar_conteudo(self, partes, modelo=MODELO_PADRAO, generation_config=None, timeout=30, api_key=None,
+                       cache=False):
+        """
+        Como gerar_texto, mas com partes livres (ex.: texto + inline_data de imagem).
+        Roda na thread de quem chama (o pool fica para enviar/gerar_em_lote): uma chamada
+        interativa não espera atrás dos lotes, e o timeout da rota continua valendo.
+        """
+        if not self._usa_cache(cache):
+            return self._gerar(partes, modelo, generation_config, timeout, api_key)
+
+        futuro, dono = self._futuro_em_voo(partes, modelo, generation_config, cache)
+        if dono:
+            self._executar(futuro, partes, modelo, generation_config, timeout, api_key)
+            return futuro.result()
+        try:
+            # Pedido idêntico em andamento: espera no máximo o que a própria chamada levaria
+            return futuro.result(timeout=timeout * self.max_tentativas)
+        except FuturesTimeout:
+            return self._gerar(partes, modelo, generation_config, timeout, api_key)
+
+    # --- Streaming ---
+
+    def gerar_stream(self, partes, modelo=MODELO_PADRAO, generation_config=None, timeout=30, api_key=None):
+        """
+        Gera os pedaços de texto à medida que a IA os produz (streamGenerateContent, SSE).
+        Roda na thread de quem consome; as novas tentativas só acontecem antes do primeiro pedaço.
+        """
+        chave = api_key or self.api_key
+        if not chave:
+            raise ErroIA("API Key não configurada.")
+
+        url = f"{self.base_url}/models/{modelo}:streamGenerateContent?alt=sse"
+        resposta = self._post_com_retry(url, chave, self._corpo(partes, generation_config), timeout, stream=True)
+
+        resposta.encoding = 'utf-8'  # text/event-stream sem charset seria lido como latin-1
+        try:
+            # chunk_size=None: entrega cada pedaço assim que chega (sem esperar encher um buffer)
+            for linha in resposta.iter_lines(chunk_size=None, decode_unicode=True):
+                if not linha or not linha.startswith('data:'):
+                    continue
+                try:
+                    dados = json.loads(linha[5:])
+                except ValueError:
+                    raise ErroIA("Pedaço inválido no streaming da IA.")
+                if 'error' in dados:
+                    raise ErroIA(f"Erro da IA: {dados['error'].get('message', dados['error'])}")
+                texto = self._texto_do_pedaco(dados)
+                if texto:
+                    yield texto
+        except requests.Timeout:
+            raise ErroIA(f"A IA ficou {timeout}s sem enviar conteúdo.")
+        except requests.RequestException as e:
+            raise ErroIA(f"Streaming da IA interrompido: {e}")
+        finally:
+            resposta.close()
+
+    def gerar_texto_stream(self, prompt, modelo=MODELO_PADRAO, generation_config=None, timeout=30, api_key=None):
+        """Como gerar_stream, para um prompt de texto."""
+        return self.gerar_stream([{"text": prompt}], modelo, generation_config, timeout, api_key)
+
+    # --- Internos ---
+
+    @staticmethod
+    def _corpo(partes, generation_config):
+        payload = {"contents": [{"parts": partes}]}
+        if generation_config:
+            payload["generationConfig"] = generation_config
+        return json.dumps(payload)
+
+    @staticmethod
+    def _texto_do_pedaco(dados):
+        # Pedaços finais podem vir só com finishReason/usageMetadata (sem texto)
+        try:
+            partes = dados['candidates'][0]['content']['parts']
+        except (KeyError, IndexError, TypeError):
+            return ""
+        return "".join(p.get('text', '') for p in partes if isinstance(p, dict))
+
+    @staticmethod
+    def _chave_cache(partes, modelo, generation_config):
+        corpo = json.dumps([modelo, generation_config, partes], sort_keys=True, ensure_ascii=False)
+        return 'ia:resposta:' + hashlib.sha256(corpo.encode('utf-8')).hexdigest()
+
+    def _usa_cache(self, cache):
+        return bool(cache) and self.cache_respostas is not None and bool(self.cache_ttl)
+
+    def _futuro_em_voo(self, partes, modelo, generation_config, cache):
+        """
+        Future da resposta em cache, do pedido idêntico em andamento ou um novo.
+        Retorna (futuro, dono): o dono é quem deve executar a chamada (_executar).
+        """
+        chave = self._chave_cache(partes, modelo, generation_config)
+        texto = self.cache_respostas.get(chave)
+        if texto is not None:
+            futuro = Future()
+            futuro.set_result(texto)
+            return futuro, False
+
+        with self._em_voo_lock:
+            futuro = self._em_voo.get(chave)
+            if futuro is not None:
+                return futuro, False
+            futuro = Future()
+            self._em_voo[chave] = futuro
+        validar = cache if callable(cache) else None
+        futuro.add_done_callback(lambda f: self._guardar_resposta(chave, f, validar))
+        return futuro, True
+
+    def _executar(self, futuro, partes, modelo, generation_config, timeout, api_key):
+        try:
+            futuro.set_result(self._gerar(partes, modelo, generation_config, timeout, api_key))
+        except Exception as e:
+            futuro.set_exception(e)
+
+    def _guardar_resposta(self, chave, futuro, validar=None):
+        with self._em_voo_lock:
+            self._em_voo.pop(chave, None)
+        if futuro.exception() is not None:
+            return
+        texto = futuro.result()
+        if validar is not None:
+            try:
+                validar(texto)
+            except Exception:
+                return
+        self.cache_respostas.set(chave, texto, self.cache_ttl)
+
+    def _sessao(self):
+        sessao = getattr(self._local, 'sessao', None)
+        if sessao is None:
+            sessao = requests.Session()
+            sessao.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+            sessao.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+            sessao.headers.update({"Content-Type": "application/json"})
+            self._local.sessao = sessao
+        return sessao
+
+    def _gerar(self, partes, modelo, generation_config, timeout, api_key):
+        chave = api_key or self.api_key
+        if not chave:
+            raise ErroIA("API Key não configurada.")
+
+        url = f"{self.base_url}/models/{modelo}:generateContent"
+        resposta = self._post_com_retry(url, chave, self._corpo(partes, generation_config), timeout)
+
+        try:
+            return resposta.json()['candidates'][0]['content']['parts'][0]['text']
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise ErroIA("Resposta da IA sem conteúdo de texto.")
+
+    def _post_com_retry(self, url, chave, corpo, timeout, stream=False):
+        ultimo_erro = None
+        for tentativa in range(self.max_tentativas):
+            try:
+                resposta = self._sessao().post(
+                    url, data=corpo,
+                    headers={"x-goog-api-key": chave},
+                    timeout=(self.timeout_conexao, timeout),
+                    stream=stream
+                )
+            except requests.ConnectionError as e:
+                # Inclui conexão recusada/derrubada; timeout de leitura não é repetido
+                ultimo_erro = ErroIA(f"Falha de conexão com a IA: {e}")
+                self._esperar(tentativa)
+                continue
+            except requests.Timeout:
+                raise ErroIA(f"A IA não respondeu em {timeout}s.")
+
+            if resposta.status_code in STATUS_TRANSITORIOS:
+                ultimo_erro = ErroIA(f"IA indisponível (HTTP {resposta.status_code}).")
+                resposta.close()
+                self._esperar(tentativa, resposta.headers.get('Retry-After'))
+                continue
+
+            if resposta.status_code >= 400:
+                erro = ErroIA(f"Erro da IA (HTTP {resposta.status_code}): {resposta.text[:300]}")
+                resposta.close()
+                raise erro
+            return resposta
+
+        raise ultimo_erro
+
+    def _esperar(self, tentativa, retry_after=None):
+        if tentativa >= self.max_tentativas - 1:
+            return
+        if retry_after and retry_after.isdigit():
+            espera = float(retry_after)
+        else:
+            espera = self.backoff_base * (2 ** tentativa)
+        time.sleep(espera + random.uniform(0, espera / 4))
+
+
+def _cache_respostas(cfg):
+    """Redis configurado: compartilha as respostas entre workers; senão, cache próprio limitado."""
+    cache = obter_cache()
+    if isinstance(cache, CacheRedis):
+        return cache
+    return CacheMemoria(max_itens=cfg.get('IA_CACHE_RESPOSTAS_MAX', 500))
+
+
+_cliente_lock = threading.Lock()
+
+
+def obter_cliente_ia():
+    """Cliente da aplicação atual (criado uma vez por processo a partir do config)."""
+    cliente = current_app.extensions.get('cliente_ia')
+    if cliente is not None:
+        return cliente
+
+    # Sob lock: chamadas simultâneas não criam (e vazam) pools extras
+    with _cliente_lock:
+        cliente = current_app.extensions.get('cliente_ia')
+        if cliente is not None:
+            return cliente
+        cfg = current_app.config
+        cliente = ClienteIA(
+            api_key=cfg.get('GOOGLE_API_KEY'),
+            base_url=cfg.get('IA_BASE_URL') or BASE_URL_PADRAO,
+            timeout_conexao=cfg.get('IA_TIMEOUT_CONEXAO', 5.0),
+            max_tentativas=cfg.get('IA_MAX_TENTATIVAS', 3),
+            backoff_base=cfg.get('IA_BACKOFF_BASE', 0.5),
+            max_workers=cfg.get('IA_MAX_WORKERS', 8),
+            cache_respostas=_cache_respostas(cfg),
+            cache_ttl=cfg.get('IA_CACHE_RESPOSTAS_TTL', 600)
+        )
+        current_app.extensions['cliente_ia'] = cliente
+    return cliente
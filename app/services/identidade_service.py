@@ -0,0 +1,119 @@
+# app/services/identidade_service.py
+# Centraliza o carregamento do usuário logado (user_loader do Flask-Login) com cache de identidade.
+#
+# Cada worker guarda um LRU com TTL de usuários já carregados (com role e escola).
+# A cada request o objeto é anexado à sessão com merge(load=False), sem SQL.
+# A invalidação grava um token de versão no backend de cache (cache_service), então
+# com CACHE_BACKEND=redis uma edição em um worker derruba o cache dos outros também.
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy.orm import joinedload
+
+from app.extensions import db
+from app.models import User
+from app.services.cache_service import obter_cache
+
+TTL_PADRAO = 300
+MAX_PADRAO = 1000
+
+CHAVE_VERSAO_GLOBAL = 'identidade:versao'
+
+
+def _chave_versao(id_user):
+    return f'identidade:{id_user}:versao'
+
+
+class _LRUIdentidades:
+    """LRU com TTL: id_user -> (expira_em, tokens, usuario desanexado)."""
+
+    def __init__(self):
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, id_user, tokens):
+        with self._lock:
+            entrada = self._dados.get(id_user)
+            if entrada is None:
+                return None
+            expira_em, tokens_entrada, usuario = entrada
+            if expira_em < time.monotonic() or tokens_entrada != tokens:
+                del self._dados[id_user]
+                return None
+            self._dados.move_to_end(id_user)
+            return usuario
+
+    def set(self, id_user, tokens, usuario, ttl, max_itens):
+        with self._lock:
+            self._dados[id_user] = (time.monotonic() + ttl, tokens, usuario)
+            self._dados.move_to_end(id_user)
+            while len(self._dados) > max_itens:
+                self._dados.popitem(last=False)
+
+    def delete(self, id_user):
+        with self._lock:
+            self._dados.pop(id_user, None)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+
+_identidades = _LRUIdentidades()
+
+
+def _tokens(id_user):
+    cache = obter_cache()
+    return (cache.get(CHAVE_VERSAO_GLOBAL), cache.get(_chave_versao(id_user)))
+
+
+def carregar_usuario(id_user):
+    """
+    Retorna o User (com role e escola) anexado à sessão atual.
+    Acerto no cache: nenhuma query. Falha: uma única query com JOIN em roles e escolas.
+    """
+    tokens = _tokens(id_user)
+    usuario = _identidades.get(id_user, tokens)
+
+    if usuario is None:
+        usuario = db.session.query(User).options(
+            joinedload(User.role),
+            joinedload(User.escola)
+        ).filter(User.id == id_user).first()
+        if usuario is None:
+            return None
+
+        # A cópia em cache fica fora de qualquer sessão (e nunca é expirada por commit)
+        for obj in (usuario, usuario.role, usuario.escola):
+            if obj is not None:
+                db.session.expunge(obj)
+
+        _identidades.set(
+            id_user, tokens, usuario,
+            current_app.config.get('IDENTIDADE_CACHE_TTL', TTL_PADRAO),
+            current_app.config.get('IDENTIDADE_CACHE_MAX', MAX_PADRAO)
+        )
+
+    # Cópia anexada à sessão do request; o objeto em cache não é alterado
+    return db.session.merge(usuario, load=False)
+
+
+def invalidar_usuario(id_user):
+    """Descarta o usuário do cache (chamar após editar perfil, role, escola ou senha)."""
+    _identidades.delete(id_user)
+    obter_cache().set(_chave_versao(id_user), uuid.uuid4().hex, _ttl_versao())
+
+
+def invalidar_todos_usuarios():
+    """Descarta todo o cache de identidade (ex.: edição de uma Escola compartilhada)."""
+    _identidades.clear()
+    obter_cache().set(CHAVE_VERSAO_GLOBAL, uuid.uuid4().hex, _ttl_versao())
+
+
+def _ttl_versao():
+    # O token precisa viver pelo menos tanto quanto as entradas que ele invalida
+    return current_app.config.get('IDENTIDADE_CACHE_TTL', TTL_PADRAO)
@@ -0,0 +1,59 @@
+# app/services/imagem_service.py
+# Centraliza o pré-processamento de imagens enviadas à IA (multimodal).
+#
+# Fotos de celular (8-12 MB) são reduzidas para IA_IMAGEM_LADO_MAX pixels no maior
+# lado, convertidas para tons de cinza e recodificadas (JPEG/WebP, IA_IMAGEM_QUALIDADE)
+# antes do base64: payload menor, menos memória por requisição e resposta mais rápida.
+# A recodificação descarta os metadados EXIF (GPS, aparelho, etc.).
+
+from io import BytesIO
+
+from flask import current_app
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    print("AVISO: Pillow não instalado. As imagens serão enviadas à IA sem redução. Instale com: pip install Pillow")
+    Image = None
+
+MIMETYPES_FORMATO = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+def preparar_imagem_ia(arquivo, mime_type):
+    """
+    Reduz e recodifica uma imagem para envio à IA.
+    arquivo: bytes ou stream (ex.: FileStorage.stream). Retorna (bytes, mime_type).
+    Se a imagem não puder ser lida, devolve o conteúdo original.
+    """
+    stream = BytesIO(arquivo) if isinstance(arquivo, (bytes, bytearray)) else arquivo
+    stream.seek(0, 2)
+    tamanho_original = stream.tell()
+    stream.seek(0)
+
+    if Image is None:
+        return stream.read(), mime_type
+
+    cfg = current_app.config
+    lado_max = cfg.get('IA_IMAGEM_LADO_MAX', 1600)
+    qualidade = cfg.get('IA_IMAGEM_QUALIDADE', 70)
+    formato = cfg.get('IA_IMAGEM_FORMATO', 'JPEG').upper()
+
+    try:
+        with Image.open(stream) as original:
+            # JPEG: decodifica já em escala reduzida (bem menos memória que a foto inteira)
+            original.draft('L', (lado_max, lado_max))
+            imagem = ImageOps.exif_transpose(original)  # Aplica a rotação do EXIF antes de descartá-lo
+            imagem = imagem.convert('L')
+            imagem.thumbnail((lado_max, lado_max), Image.LANCZOS)
+
+            saida = BytesIO()
+            imagem.save(saida, format=formato, quality=qualidade, optimize=True)
+    except Exception as e:
+        print(f"Imagem não reprocessada para a IA ({e}); enviando o original.")
+        stream.seek(0)
+        return stream.read(), mime_type
+
+    dados = saida.getvalue()
+    economia = 100 - (len(dados) * 100 / tamanho_original) if tamanho_original else 0
+    print(f"Imagem para IA: {tamanho_original} -> {len(dados)} bytes ({economia:.0f}% menor)")
+    return dados, MIMETYPES_FORMATO.get(formato, mime_type)
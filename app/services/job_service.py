@@ -0,0 +1,383 @@
+# app/services/job_service.py
+# Centraliza a fila de tarefas em segundo plano (tabela jobs + pool local de threads).
+#
+# Fluxo: a rota chama enfileirar_job -> responde 202 com o id -> o cliente consulta
+# GET /jobs/<id> até 'concluido' (ou escuta GET /jobs/<id>/eventos, SSE) -> baixa em
+# GET /jobs/<id>/download.
+# O arquivo fica em JOBS_FOLDER até JOBS_TTL_ARQUIVOS segundos após a conclusão.
+# Jobs em execução renovam jobs.atualizado_em (batimento); 'executando' sem batimento há
+# mais de JOBS_TIMEOUT_EXECUCAO segundos (worker perdido) vira 'erro'.
+# Tarefas que esperam a IA (registrar_tarefa(..., ia=True)) rodam num pool próprio
+# (JOBS_MAX_WORKERS_IA): chamadas longas não atrasam as exportações comuns.
+
+import json
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import click
+from flask import current_app, jsonify, request, send_file, url_for
+from flask.cli import with_appcontext
+from sqlalchemy import update
+from flask_login import current_user
+
+from app.extensions import db
+from app.models import Job
+from app.services.export_service import exportacao_em_cache
+from app.services.limite_ia_service import transferir_chamada_ia
+
+STATUS_PENDENTE = 'pendente'
+STATUS_EXECUTANDO = 'executando'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_ERRO = 'erro'
+
+# tipo -> função(parametros: dict, destino: arquivo binário aberto[, progresso])
+_TAREFAS = {}
+_TAREFAS_COM_PROGRESSO = set()
+_TAREFAS_IA = set()
+
+# Parâmetros de job que apontam para pastas de upload (guardar_arquivos_entrada)
+PARAMETROS_PASTAS = ('pasta', 'pasta_entrada')
+
+_executores = {}
+_executor_lock = threading.Lock()
+
+
+def registrar_tarefa(tipo, com_progresso=False, ia=False):
+    """
+    Decorator: registra a função que gera o arquivo de um tipo de job.
+    com_progresso=True: a função recebe também progresso(concluidos, total),
+    exposto no status do job.
+    ia=True: a tarefa passa a maior parte do tempo esperando a IA e roda no pool 'ia'.
+    """
+    def decorator(func):
+        _TAREFAS[tipo] = func
+        if com_progresso:
+            _TAREFAS_COM_PROGRESSO.add(tipo)
+        if ia:
+            _TAREFAS_IA.add(tipo)
+        return func
+    return decorator
+
+
+def quer_job():
+    """True quando o cliente pediu execução em segundo plano (fetch com Accept JSON ou ?async=1)."""
+    return request.args.get('async') == '1' or \
+        request.accept_mimetypes.best == 'application/json'
+
+
+def _obter_executor(tipo):
+    nome = 'ia' if tipo in _TAREFAS_IA else 'jobs'
+    with _executor_lock:
+        if nome not in _executores:
+            if nome == 'ia':
+                max_workers = current_app.config.get('JOBS_MAX_WORKERS_IA', 4)
+            else:
+                max_workers = current_app.config.get('JOBS_MAX_WORKERS', 2)
+            _executores[nome] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"jobs-{nome}")
+        return _executores[nome]
+
+
+def _pasta_jobs():
+    pasta = current_app.config.get('JOBS_FOLDER') or os.path.join(current_app.instance_path, 'jobs')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def guardar_arquivos_entrada(arquivos):
+    """
+    Salva uploads que o job vai processar depois do request (o FileStorage não
+    sobrevive ao request). Retorna (pasta, [caminhos]); a tarefa apaga a pasta
+    com remover_arquivos_entrada ao terminar.
+    """
+    pasta = os.path.join(_pasta_jobs(), f"entrada_{uuid.uuid4().hex}")
+    os.makedirs(pasta)
+    caminhos = []
+    for i, arquivo in enumerate(arquivos):
+        extensao = os.path.splitext(arquivo.filename or '')[1].lower()
+        caminho = os.path.join(pasta, f"{i:04d}{extensao}")
+        arquivo.save(caminho)
+        caminhos.append(caminho)
+    return pasta, caminhos
+
+
+def remover_arquivos_entrada(pasta):
+    shutil.rmtree(pasta, ignore_errors=True)
+
+
+def _funcao_progresso(job_id):
+    """Callback de progresso: grava em conexão própria, sem commitar o trabalho da tarefa."""
+    def progresso(concluidos, total):
+        with db.engine.begin() as conn:
+            conn.execute(
+                update(Job.__table__).where(Job.__table__.c.id == job_id)
+                .values(itens_concluidos=concluidos, total_itens=total, atualizado_em=datetime.utcnow())
+            )
+    return progresso
+
+
+def _iniciar_batimento(job_id):
+    """
+    Thread que renova jobs.atualizado_em a cada JOBS_BATIMENTO_INTERVALO segundos enquanto
+    o job roda (morre junto com o processo: é o que prova que o worker está vivo).
+    Retorna o Event que encerra o batimento.
+    """
+    motor = db.engine
+    intervalo = current_app.config.get('JOBS_BATIMENTO_INTERVALO', 60)
+    parar = threading.Event()
+    tabela = Job.__table__
+
+    def bater():
+        while not parar.wait(intervalo):
+            try:
+                with motor.begin() as conn:
+                    conn.execute(
+                        update(tabela)
+                        .where(tabela.c.id == job_id, tabela.c.status == STATUS_EXECUTANDO)
+                        .values(atualizado_em=datetime.utcnow())
+                    )
+            except Exception as e:
+                print(f"Erro no batimento do job {job_id}: {e}")
+
+    threading.Thread(target=bater, name=f"job-batimento-{job_id[:8]}", daemon=True).start()
+    return parar
+
+
+def _finalizar_job(job_id, **valores):
+    """
+    Grava o resultado só se o job ainda está 'executando' (UPDATE condicional).
+    False: o job foi encerrado como travado ou removido enquanto rodava.
+    """
+    finalizado = Job.query.filter_by(id=job_id, status=STATUS_EXECUTANDO).update(valores)
+    db.session.commit()
+    return bool(finalizado)
+
+
+def enfileirar_job(tipo, id_user, parametros=None, download_name=None, mimetype=None, total_itens=None):
+    """Grava o job como pendente e o envia ao pool local. Retorna o Job."""
+    if tipo not in _TAREFAS:
+        raise ValueError(f"Tarefa de job desconhecida: {tipo}")
+
+    limpar_jobs_expirados()
+
+    job = Job(
+        id=uuid.uuid4().hex,
+        tipo=tipo,
+        status=STATUS_PENDENTE,
+        id_user=id_user,
+        parametros=json.dumps(parametros or {}),
+        download_name=download_name,
+        mimetype=mimetype,
+        total_itens=total_itens,
+        itens_concluidos=0 if total_itens is not None else None
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    # Job de IA enfileirado por uma rota limitar_ia: segue contando como em voo até terminar
+    encerrar_ia = transferir_chamada_ia() if tipo in _TAREFAS_IA else None
+    _obter_executor(tipo).submit(_executar_job, app, job.id, encerrar_ia)
+    return job
+
+
+def _executar_job(app, job_id, encerrar_ia=None):
+    with app.app_context():
+        try:
+            executar_job(job_id)
+        finally:
+            db.session.remove()
+            if encerrar_ia:
+                encerrar_ia()
+
+
+def executar_job(job_id):
+    """Executa um job pendente (no worker do pool ou via `flask processar-jobs`)."""
+    # Reserva atômica: só um executor pega o job, mesmo com vários processos
+    agora = datetime.utcnow()
+    reservado = Job.query.filter_by(id=job_id, status=STATUS_PENDENTE).update(
+        {'status': STATUS_EXECUTANDO, 'iniciado_em': agora, 'atualizado_em': agora}
+    )
+    db.session.commit()
+    if not reservado:
+        return
+
+    job = db.session.get(Job, job_id)
+    tipo = job.tipo
+    extensao = os.path.splitext(job.download_name or '')[1] or '.bin'
+    nome_arquivo = f"{job.id}{extensao}"
+    caminho = os.path.join(_pasta_jobs(), nome_arquivo)
+    ttl = timedelta(seconds=current_app.config.get('JOBS_TTL_ARQUIVOS', 3600))
+
+    parar_batimento = _iniciar_batimento(job_id)
+    try:
+        # Grava em .tmp e renomeia: o download nunca vê um arquivo pela metade
+        parametros = job.parametros_dict
+        chave_cache = parametros.pop('_chave_cache', None)
+        if chave_cache:
+            # Mesmo cache do download direto: só gera se os dados mudaram
+            em_cache = exportacao_em_cache(chave_cache, lambda destino: _executar_tarefa(job, parametros, destino))
+            shutil.copyfile(em_cache, caminho + '.tmp')
+        else:
+            with open(caminho + '.tmp', 'wb') as destino:
+                _executar_tarefa(job, parametros, destino)
+        os.replace(caminho + '.tmp', caminho)
+
+        agora = datetime.utcnow()
+        if not _finalizar_job(job_id, status=STATUS_CONCLUIDO, arquivo_path=nome_arquivo,
+                              concluido_em=agora, expira_em=agora + ttl):
+            print(f"Job {job_id} ({tipo}) encerrado durante a execução; resultado descartado.")
+            os.remove(caminho)
+    except Exception as e:
+        print(f"Erro no job {job_id} ({tipo}): {e}")
+        db.session.rollback()
+        if os.path.exists(caminho + '.tmp'):
+            os.remove(caminho + '.tmp')
+        agora = datetime.utcnow()
+        _finalizar_job(job_id, status=STATUS_ERRO, mensagem_erro=str(e), concluido_em=agora, expira_em=agora + ttl)
+    finally:
+        parar_batimento.set()
+
+
+def _executar_tarefa(job, parametros, destino):
+    if job.tipo in _TAREFAS_COM_PROGRESSO:
+        _TAREFAS[job.tipo](parametros, destino, _funcao_progresso(job.id))
+    else:
+        _TAREFAS[job.tipo](parametros, destino)
+
+
+def caminho_arquivo_job(job):
+    """Caminho absoluto do arquivo gerado, ou None se não existe mais."""
+    if not job.arquivo_path:
+        return None
+    caminho = os.path.join(_pasta_jobs(), job.arquivo_path)
+    return caminho if os.path.exists(caminho) else None
+
+
+def resposta_job(job):
+    """Dados do job para o cliente (JSON do enfileiramento e do polling)."""
+    dados = {
+        "status": "success",
+        "job_id": job.id,
+        "job_status": job.status,
+        "status_url": url_for('jobs.status_job', id_job=job.id),
+        "eventos_url": url_for('jobs.eventos_job', id_job=job.id)
+    }
+    if job.total_itens is not None:
+        dados["progresso"] = {"concluidos": job.itens_concluidos or 0, "total": job.total_itens}
+    if job.status == STATUS_CONCLUIDO:
+        dados["download_url"] = url_for('jobs.download_job', id_job=job.id)
+    elif job.status == STATUS_ERRO:
+        dados["message"] = job.mensagem_erro or "Erro ao gerar o arquivo."
+    return dados
+
+
+def responder_exportacao(tipo, parametros, download_name, mimetype, chave_cache=None):
+    """
+    Resposta padrão das rotas de exportação:
+    - cliente pediu job (quer_job): enfileira e responde 202 com o id para polling;
+    - link direto (sem JS): gera no próprio request, como antes.
+    Com chave_cache (ver export_service.chave_exportacao_turma) o arquivo é servido
+    do cache em disco quando os dados não mudaram, com ETag/If-None-Match.
+    """
+    if quer_job():
+        if chave_cache:
+            parametros = dict(parametros, _chave_cache=chave_cache)
+        job = enfileirar_job(tipo, current_user.id, parametros, download_name, mimetype)
+        return jsonify(resposta_job(job)), 202
+
+    if chave_cache:
+        if request.if_none_match.contains(chave_cache):
+            return '', 304
+        caminho = exportacao_em_cache(chave_cache, lambda destino: _TAREFAS[tipo](parametros, destino))
+        return send_file(
+            caminho, download_name=download_name, as_attachment=True, mimetype=mimetype,
+            etag=chave_cache, conditional=True, max_age=0
+        )
+
+    arquivo = BytesIO()
+    _TAREFAS[tipo](parametros, arquivo)
+    arquivo.seek(0)
+    return send_file(arquivo, download_name=download_name, as_attachment=True, mimetype=mimetype)
+
+def _encerrar_jobs_travados():
+    """
+    Jobs 'executando' sem batimento (atualizado_em) há mais de JOBS_TIMEOUT_EXECUCAO
+    segundos perderam o worker (o pool é do processo: restart/queda). Viram 'erro',
+    ganham prazo de expiração e só então as pastas de upload (PARAMETROS_PASTAS) e o
+    .tmp são removidos. Um worker vivo renova o batimento e nunca cai aqui; se cair
+    (ex.: banco indisponível), o UPDATE condicional dele descarta o resultado.
+    """
+    agora = datetime.utcnow()
+    limite = agora - timedelta(seconds=current_app.config.get('JOBS_TIMEOUT_EXECUCAO', 600))
+    sem_batimento = db.or_(
+        Job.atualizado_em < limite,
+        db.and_(Job.atualizado_em.is_(None), Job.iniciado_em < limite)
+    )
+    candidatos = Job.query.filter(Job.status == STATUS_EXECUTANDO, sem_batimento).all()
+    if not candidatos:
+        return 0
+
+    expira_em = agora + timedelta(seconds=current_app.config.get('JOBS_TTL_ARQUIVOS', 3600))
+    pasta_jobs = os.path.realpath(_pasta_jobs())
+    encerrados = 0
+    for job in candidatos:
+        # Condicional: um batimento (ou a conclusão) entre o SELECT e aqui mantém o job vivo
+        marcado = Job.query.filter(Job.id == job.id, Job.status == STATUS_EXECUTANDO, sem_batimento).update(
+            {'status': STATUS_ERRO, 'mensagem_erro': "A tarefa foi interrompida. Tente novamente.",
+             'concluido_em': agora, 'expira_em': expira_em},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if not marcado:
+            continue
+
+        encerrados += 1
+        print(f"Job {job.id} ({job.tipo}) sem batimento desde {job.atualizado_em or job.iniciado_em}; marcado como erro.")
+        parametros = job.parametros_dict
+        for nome in PARAMETROS_PASTAS:
+            pasta = parametros.get(nome)
+            # Só apaga o que está dentro de JOBS_FOLDER
+            if pasta and os.path.dirname(os.path.realpath(pasta)) == pasta_jobs:
+                remover_arquivos_entrada(pasta)
+        extensao = os.path.splitext(job.download_name or '')[1] or '.bin'
+        temporario = os.path.join(pasta_jobs, f"{job.id}{extensao}.tmp")
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return encerrados
+
+
+def limpar_jobs_expirados():
+    """Encerra jobs travados e remove jobs (e arquivos) cujo prazo de download terminou."""
+    _encerrar_jobs_travados()
+    expirados = Job.query.filter(Job.expira_em < datetime.utcnow()).all()
+    if not expirados:
+        return 0
+
+    for job in expirados:
+        caminho = caminho_arquivo_job(job)
+        if caminho:
+            try:
+                os.remove(caminho)
+            except OSError as e:
+                print(f"Erro ao remover arquivo do job {job.id}: {e}")
+        db.session.delete(job)
+    db.session.commit()
+    return len(expirados)
+
+
+@click.command('processar-jobs')
+@with_appcontext
+def processar_jobs_command():
+    """Executa jobs pendentes (ex.: enfileirados antes de um restart), encerra os travados e limpa os expirados."""
+    travados = _encerrar_jobs_travados()
+    pendentes = [j.id for j in Job.query.filter_by(status=STATUS_PENDENTE).order_by(Job.criado_em)]
+    for job_id in pendentes:
+        executar_job(job_id)
+    removidos = limpar_jobs_expirados()
+    click.echo(f">>> Jobs processados: {len(pendentes)}; travados encerrados: {travados}; expirados removidos: {removidos}.")
+
@@ -0,0 +1,305 @@
+# app/services/limite_ia_service.py
+# Centraliza o controle de uso das rotas de IA (token bucket por usuário e por escola).
+#
+# Cada chamada consome fichas de dois baldes: 'usuario:<id>' e 'escola:<id>'. Os baldes
+# reabastecem a IA_LIMITE_*_POR_MINUTO e acumulam no máximo IA_LIMITE_*_RAJADA fichas.
+# Sem ficha disponível, a chamada espera na fila se a próxima ficha sair em até
+# IA_LIMITE_ESPERA_MAX segundos; senão falha na hora (HTTP 429 + Retry-After).
+# Rotas em lote pagam uma ficha por chamada à IA: um lote maior que a rajada passa
+# com o balde cheio e deixa o saldo negativo até ser reposto.
+#
+# Backend escolhido por configuração (compartilhado entre workers com Redis):
+#   IA_LIMITE_BACKEND = 'memoria' | 'redis' (padrão: o mesmo de CACHE_BACKEND)
+# Qualquer objeto com reservar/devolver/incrementar/contadores também pode ser passado.
+# Contadores exportados: em_voo, na_fila, rejeitados e concluidos (GET /api/ia/limites).
+
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, flash, g, jsonify, make_response, redirect, request, url_for
+from flask_login import current_user
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+PREFIXO_CHAVES = 'cortex:ia:limite:'
+CONTADORES = ('em_voo', 'na_fila', 'rejeitados', 'concluidos')
+
+
+class LimiteExcedido(Exception):
+    """Sem ficha no balde (nem dentro da espera máxima)."""
+
+    def __init__(self, escopo, retry_after):
+        self.escopo = escopo
+        self.retry_after = retry_after
+        super().__init__(f"Limite de uso da IA atingido ({escopo}).")
+
+
+class LimitadorMemoria:
+    """Baldes e contadores no processo (cada worker tem os seus)."""
+
+    def __init__(self):
+        self._baldes = {}
+        self._contadores = dict.fromkeys(CONTADORES, 0)
+        self._lock = threading.Lock()
+
+    def reservar(self, chave, taxa, capacidade, custo, espera_max):
+        """
+        Reserva custo fichas; retorna (True, espera) ou (False, retry_after).
+        A ficha pode ser reservada "a prazo" (saldo negativo): quem reservou espera
+        o tempo até ela existir, o que forma uma fila justa sem polling.
+        Um lote maior que a capacidade passa com o balde cheio, mas debita o custo
+        inteiro: o saldo fica negativo e as próximas chamadas esperam a reposição.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            fichas, ultimo = self._baldes.get(chave, (capacidade, agora))
+            fichas = min(capacidade, fichas + (agora - ultimo) * taxa)
+            espera = max(0.0, (min(custo, capacidade) - fichas) / taxa)
+            if espera > espera_max:
+                self._baldes[chave] = (fichas, agora)
+                return False, espera
+            self._baldes[chave] = (fichas - custo, agora)
+            return True, espera
+
+    def devolver(self, chave, taxa, capacidade, custo):
+        with self._lock:
+            if chave in self._baldes:
+                fichas, ultimo = self._baldes[chave]
+                self._baldes[chave] = (min(capacidade, fichas + custo), ultimo)
+
+    def incrementar(self, contador, valor=1):
+        with self._lock:
+            self._contadores[contador] += valor
+
+    def contadores(self):
+        with self._lock:
+            return dict(self._contadores)
+
+
+# Executado atomicamente no Redis (relógio do próprio Redis, comum a todos os workers)
+_SCRIPT_RESERVAR = """
+local taxa = tonumber(ARGV[1])
+local capacidade = tonumber(ARGV[2])
+local custo = tonumber(ARGV[3])
+local espera_max = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local agora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local balde = redis.call('HMGET', KEYS[1], 'fichas', 'ultimo')
+local fichas = tonumber(balde[1]) or capacidade
+local ultimo = tonumber(balde[2]) or agora
+fichas = math.min(capacidade, fichas + (agora - ultimo) * taxa)
+local espera = math.max(0, (math.min(custo, capacidade) - fichas) / taxa)
+local ok = 0
+if espera <= espera_max then
+    fichas = fichas - custo
+    ok = 1
+end
+redis.call('HSET', KEYS[1], 'fichas', tostring(fichas), 'ultimo', tostring(agora))
+redis.call('EXPIRE', KEYS[1], math.ceil((capacidade - fichas) / taxa + espera_max) + 1)
+return {ok, tostring(espera)}
+"""
+
+_SCRIPT_DEVOLVER = """
+local fichas = tonumber(redis.call('HGET', KEYS[1], 'fichas'))
+if fichas then
+    redis.call('HSET', KEYS[1], 'fichas', tostring(math.min(tonumber(ARGV[1]), fichas + tonumber(ARGV[2]))))
+end
+return 1
+"""
+
+
+class LimitadorRedis:
+    """Baldes e contadores compartilhados entre processos. Falhas do Redis liberam a chamada."""
+
+    def __init__(self, url):
+        self._cliente = redis.Redis.from_url(url)
+        self._reservar = self._cliente.register_script(_SCRIPT_RESERVAR)
+        self._devolver = self._cliente.register_script(_SCRIPT_DEVOLVER)
+
+    def reservar(self, chave, taxa, capacidade, custo, espera_max):
+        try:
+            ok, espera = self._reservar(keys=[PREFIXO_CHAVES + chave], args=[taxa, capacidade, custo, espera_max])
+        except redis.RedisError as e:
+            print(f"Erro no limitador Redis (chamada liberada): {e}")
+            return True, 0.0
+        return bool(ok), float(espera)
+
+    def devolver(self, chave, taxa, capacidade, custo):
+        try:
+            self._devolver(keys=[PREFIXO_CHAVES + chave], args=[capacidade, custo])
+        except redis.RedisError as e:
+            print(f"Erro ao devolver ficha no Redis: {e}")
+
+    def incrementar(self, contador, valor=1):
+        try:
+            self._cliente.hincrby(PREFIXO_CHAVES + 'contadores', contador, valor)
+        except redis.RedisError as e:
+            print(f"Erro ao atualizar contador no Redis: {e}")
+
+    def contadores(self):
+        try:
+            brutos = self._cliente.hgetall(PREFIXO_CHAVES + 'contadores')
+        except redis.RedisError as e:
+            print(f"Erro ao ler contadores no Redis: {e}")
+            brutos = {}
+        valores = {k.decode(): int(v) for k, v in brutos.items()}
+        return {c: valores.get(c, 0) for c in CONTADORES}
+
+
+def init_limitador_ia(app):
+    """Cria o backend configurado e o registra em app.extensions['limitador_ia']."""
+    backend = app.config.get('IA_LIMITE_BACKEND') or app.config.get('CACHE_BACKEND', 'memoria')
+
+    if backend == 'redis':
+        if redis is None:
+            print("AVISO: redis não instalado. Limite da IA por processo. Instale com: pip install redis")
+            backend = LimitadorMemoria()
+        else:
+            backend = LimitadorRedis(app.config.get('CACHE_REDIS_URL') or 'redis://localhost:6379/0')
+    elif not hasattr(backend, 'reservar'):
+        backend = LimitadorMemoria()
+
+    app.extensions['limitador_ia'] = backend
+    return backend
+
+
+def obter_limitador_ia():
+    """Backend do limitador da aplicação atual."""
+    limitador = current_app.extensions.get('limitador_ia')
+    if limitador is None:
+        limitador = init_limitador_ia(current_app)
+    return limitador
+
+
+def _baldes_do_usuario():
+    """(escopo, chave, fichas por segundo, capacidade) de cada balde aplicável; limite 0 desliga o escopo."""
+    cfg = current_app.config
+    baldes = []
+    por_minuto = cfg.get('IA_LIMITE_USUARIO_POR_MINUTO', 10)
+    if por_minuto:
+        baldes.append(('usuário', f"usuario:{current_user.id}", por_minuto / 60.0,
+                       cfg.get('IA_LIMITE_USUARIO_RAJADA', 5)))
+    por_minuto = cfg.get('IA_LIMITE_ESCOLA_POR_MINUTO', 60)
+    escola_id = getattr(current_user, 'escola_id', None)
+    if por_minuto and escola_id:
+        baldes.append(('escola', f"escola:{escola_id}", por_minuto / 60.0,
+                       cfg.get('IA_LIMITE_ESCOLA_RAJADA', 20)))
+    return baldes
+
+
+def adquirir_ia(custo=1):
+    """
+    Reserva fichas em todos os baldes do usuário (esperando na fila se preciso).
+    Levanta LimiteExcedido sem consumir nada quando algum balde não atende a tempo.
+    Retorna as reservas [(chave, taxa, capacidade, custo)], para devolver_ia.
+    """
+    limitador = obter_limitador_ia()
+    espera_max = current_app.config.get('IA_LIMITE_ESPERA_MAX', 5)
+
+    reservados = []
+    espera = 0.0
+    for escopo, chave, taxa, capacidade in _baldes_do_usuario():
+        # O lote paga todas as chamadas (o saldo pode ficar negativo e é reposto com o tempo)
+        ok, segundos = limitador.reservar(chave, taxa, capacidade, custo, espera_max)
+        if not ok:
+            devolver_ia(reservados, limitador)
+            limitador.incrementar('rejeitados')
+            raise LimiteExcedido(escopo, segundos)
+        reservados.append((chave, taxa, capacidade, custo))
+        espera = max(espera, segundos)
+
+    if espera > 0:
+        limitador.incrementar('na_fila')
+        try:
+            time.sleep(espera)
+        finally:
+            limitador.incrementar('na_fila', -1)
+    limitador.incrementar('em_voo')
+    return reservados
+
+
+def devolver_ia(reservados, limitador=None):
+    """Devolve aos baldes as fichas de uma reserva que não chegou a usar a IA."""
+    limitador = limitador or obter_limitador_ia()
+    for chave, taxa, capacidade, custo in reservados:
+        limitador.devolver(chave, taxa, capacidade, custo)
+
+
+def liberar_ia(limitador=None):
+    """Encerra a chamada em voo (limitador explícito quando chamado fora do contexto da app)."""
+    limitador = limitador or obter_limitador_ia()
+    limitador.incrementar('em_voo', -1)
+    limitador.incrementar('concluidos')
+
+
+def transferir_chamada_ia():
+    """
+    Passa a chamada em voo do request atual para quem vai terminá-la depois (ex.: um job
+    que chama a IA após o 202). Retorna a função que a encerra, ou None fora de limitar_ia.
+    """
+    if not g.get('ia_em_voo'):
+        return None
+    g.ia_em_voo = False
+    limitador = obter_limitador_ia()
+    return lambda: liberar_ia(limitador)
+
+
+def _resposta_limite(erro):
+    segundos = max(1, math.ceil(erro.retry_after))
+    mensagem = f"{erro} Tente novamente em {segundos}s."
+    # Formulários comuns (navegação HTML) voltam para a página; fetch/SSE recebem JSON
+    if request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html':
+        flash(mensagem, 'warning')
+        resposta = redirect(request.referrer or url_for('core.index'))
+    else:
+        resposta = make_response(
+            jsonify({"status": "error", "message": mensagem, "retry_after": segundos}), 429
+        )
+    resposta.headers['Retry-After'] = str(segundos)
+    return resposta
+
+
+def limitar_ia(custo=None):
+    """
+    Decorator das rotas de IA: aplica os baldes e conta a chamada como em voo até
+    a resposta terminar (inclusive respostas em streaming/SSE) ou, se a rota enfileirou
+    um job de IA, até o job terminar. Respostas com status >= 400 devolvem as fichas.
+    custo: função que recebe o request e devolve quantas chamadas à IA a rota fará (lotes).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                reservados = adquirir_ia(max(1, custo(request)) if custo else 1)
+            except LimiteExcedido as e:
+                return _resposta_limite(e)
+
+            g.ia_em_voo = True
+            try:
+                resposta = make_response(view(*args, **kwargs))
+            except Exception:
+                devolver_ia(reservados)
+                if g.ia_em_voo:
+                    liberar_ia()
+                raise
+
+            if resposta.status_code >= 400:
+                # Recusada pela própria rota (404, 403, validação, sem API key...): não consome a cota
+                devolver_ia(reservados)
+
+            if not g.ia_em_voo:
+                pass  # Transferida para um job (transferir_chamada_ia), que a encerra ao terminar
+            elif resposta.is_streamed:
+                # O stream termina depois do request (sem contexto da app ao fechar)
+                limitador = obter_limitador_ia()
+                resposta.call_on_close(lambda: liberar_ia(limitador))
+            else:
+                liberar_ia()
+            return resposta
+        return wrapper
+    return decorator
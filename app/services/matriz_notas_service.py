@@ -0,0 +1,103 @@
+# app/services/matriz_notas_service.py
+# Centraliza a matriz aluno × atividade por unidade usada nas exportações (XLSX, DOCX, PDF).
+#
+# Uma query para as atividades (cabeçalhos) e uma única passada sobre o resultado
+# ordenado de alunos LEFT JOIN presenças: cada nota cai direto na sua célula, sem
+# mapa de presenças nem refiltrar as atividades a cada unidade. As notas ficam em
+# array('d') (uma linha por aluno), e linhas_matriz() gera as linhas prontas para
+# qualquer escritor.
+
+from array import array
+
+from app.extensions import db
+from app.models import Aluno, Atividade, Presenca
+from app.services.export_service import TAMANHO_LOTE_EXPORT
+
+# Ordem lógica das unidades; as demais entram depois, em ordem alfabética
+ORDEM_UNIDADES = ['1ª Unidade', '2ª Unidade', '3ª Unidade', '4ª Unidade', 'Recuperação', 'Exame Final']
+
+PREFIXOS_TIPO = {
+    'Prova': 'PROVA', 'Atividade': 'ATIV', 'Trabalho': 'TRAB',
+    'Seminario': 'SEM', 'Visto': 'VISTO', 'Participacao': 'PART'
+}
+
+# Total mínimo da unidade para "APROVADO"
+MEDIA_APROVACAO_UNIDADE = 5.0
+
+
+def _cabecalho_atividade(atividade):
+    prefixo = PREFIXOS_TIPO.get(atividade.tipo, atividade.tipo[:4].upper() if atividade.tipo else 'ATIV')
+    data_str = atividade.data.strftime('%d/%m') if atividade.data else "S/D"
+    return f"{prefixo} {data_str}"
+
+
+def montar_matriz_notas(id_turma):
+    """
+    Matriz de notas da turma por unidade: {unidade: dados}, na ordem das unidades.
+    dados = {
+        'atividades': [Atividade, ...]    (colunas, por data)
+        'cabecalhos': ["ALUNO", "PROVA 10/03", ..., "TOTAL", "SITUAÇÃO"],
+        'alunos':     [nome, ...]         (linhas, por nome)
+        'notas':      [array('d'), ...]   (uma por aluno; nota ausente = 0.0)
+        'totais':     array('d'),
+        'situacoes':  ["APROVADO" | "REPROVADO", ...]
+    }
+    """
+    atividades = Atividade.query.filter_by(id_turma=id_turma).order_by(Atividade.data).all()
+
+    presentes = {a.unidade for a in atividades if a.unidade}
+    unidades = [u for u in ORDEM_UNIDADES if u in presentes] + sorted(presentes - set(ORDEM_UNIDADES))
+
+    dados_unidades = {}
+    # id_atividade -> (dados da unidade, coluna)
+    posicao = {}
+    for unidade in unidades:
+        dados = {'atividades': [], 'alunos': [], 'notas': [], 'totais': array('d'), 'situacoes': []}
+        for atividade in atividades:
+            if atividade.unidade == unidade:
+                posicao[atividade.id] = (dados, len(dados['atividades']))
+                dados['atividades'].append(atividade)
+        dados['cabecalhos'] = ["ALUNO"] + [_cabecalho_atividade(a) for a in dados['atividades']] + ["TOTAL", "SITUAÇÃO"]
+        dados_unidades[unidade] = dados
+
+    if not dados_unidades:
+        return dados_unidades
+
+    ids_atividades = db.session.query(Atividade.id).filter(Atividade.id_turma == id_turma)
+    linhas_query = db.session.query(
+        Aluno.id, Aluno.nome, Presenca.id_atividade, Presenca.nota
+    ).select_from(Aluno)\
+     .outerjoin(Presenca, db.and_(
+         Presenca.id_aluno == Aluno.id,
+         Presenca.id_atividade.in_(ids_atividades.scalar_subquery())
+     ))\
+     .filter(Aluno.id_turma == id_turma)\
+     .order_by(Aluno.nome, Aluno.id)\
+     .yield_per(TAMANHO_LOTE_EXPORT)
+
+    linhas_unidades = list(dados_unidades.values())
+    aluno_atual = None
+    for id_aluno, nome, id_atividade, nota in linhas_query:
+        if id_aluno != aluno_atual:
+            aluno_atual = id_aluno
+            for dados in linhas_unidades:
+                dados['alunos'].append(nome)
+                dados['notas'].append(array('d', bytes(8 * len(dados['atividades']))))
+
+        if nota is not None and id_atividade in posicao:
+            dados, coluna = posicao[id_atividade]
+            dados['notas'][-1][coluna] = float(nota)
+
+    for dados in linhas_unidades:
+        for notas in dados['notas']:
+            total = sum(notas)
+            dados['totais'].append(total)
+            dados['situacoes'].append("APROVADO" if total >= MEDIA_APROVACAO_UNIDADE else "REPROVADO")
+
+    return dados_unidades
+
+
+def linhas_matriz(dados):
+    """Linhas [nome, notas..., total, situação] de uma unidade da matriz."""
+    for nome, notas, total, situacao in zip(dados['alunos'], dados['notas'], dados['totais'], dados['situacoes']):
+        yield [nome, *notas, total, situacao]
@@ -0,0 +1,62 @@
+# app/services/notificacao_service.py
+# Centraliza o resumo de notificações do topo (contador + últimas 5) com cache por usuário.
+# Quem cria ou marca notificações como lidas deve chamar invalidar_resumo_notificacoes.
+
+from flask import current_app, g, has_request_context
+
+from app.extensions import db
+from app.models import Notificacao
+from app.services.cache_service import obter_cache
+
+TTL_PADRAO = 60  # segundos; rede de segurança caso alguma escrita não invalide
+
+
+def _chave(id_user):
+    return f'notificacoes:{id_user}'
+
+
+def resumo_notificacoes(id_user):
+    """
+    Retorna {'num_notificacoes': n, 'notificacoes_topo': [...]} do usuário.
+    As notificações vêm como dicts (id, texto, link, lida, data_criacao) para
+    poderem ser compartilhadas entre workers; o template acessa notif.campo igual.
+    Memoizado por request em g e, entre requests, no backend de cache.
+    """
+    memo = g.setdefault('_resumo_notificacoes', {}) if has_request_context() else {}
+    if id_user in memo:
+        return memo[id_user]
+
+    cache = obter_cache()
+    resumo = cache.get(_chave(id_user))
+    if resumo is None:
+        resumo = _consultar_resumo(id_user)
+        cache.set(_chave(id_user), resumo, current_app.config.get('CACHE_TTL_NOTIFICACOES', TTL_PADRAO))
+
+    memo[id_user] = resumo
+    return resumo
+
+
+def invalidar_resumo_notificacoes(id_user):
+    """Descarta o resumo em cache do usuário (chamar após o commit)."""
+    obter_cache().delete(_chave(id_user))
+    if has_request_context():
+        g.get('_resumo_notificacoes', {}).pop(id_user, None)
+
+
+def _consultar_resumo(id_user):
+    # Pega o número de notificações não lidas
+    num_notificacoes = db.session.query(db.func.count(Notificacao.id)).filter(
+        Notificacao.id_user == id_user, Notificacao.lida == False
+    ).scalar() or 0
+
+    # Pega as últimas 5 notificações para o dropdown (lidas e não lidas)
+    ultimas = db.session.query(
+        Notificacao.id, Notificacao.texto, Notificacao.link, Notificacao.lida, Notificacao.data_criacao
+    ).filter(Notificacao.id_user == id_user)\
+     .order_by(Notificacao.data_criacao.desc())\
+     .limit(5).all()
+
+    return {
+        'num_notificacoes': num_notificacoes,
+        'notificacoes_topo': [dict(n._mapping) for n in ultimas]
+    }
@@ -0,0 +1,103 @@
+# app/services/presenca_service.py
+# Centraliza a gravação de presenças/notas em lote (upsert set-based).
+
+from sqlalchemy import insert, literal_column, select, func, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models import Presenca
+
+# Chave natural de Presenca (índice único uq_presencas_aluno_atividade)
+CHAVE_PRESENCA = ['id_aluno', 'id_atividade']
+
+# Limite de linhas por statement (o SQLite limita o número de parâmetros)
+TAMANHO_LOTE = 500
+
+
+def upsert_presencas(linhas, campos_atualizar):
+    """
+    Grava várias presenças com INSERT ... ON CONFLICT (Postgres/SQLite).
+    - linhas: lista de dicts com 'id_aluno', 'id_atividade' e os valores
+      usados quando o registro ainda não existe (todas com as mesmas chaves).
+    - campos_atualizar: colunas sobrescritas quando o par já existe.
+    Não faz commit; o chamador controla a transação.
+    Retorna {'inseridos': n, 'atualizados': m}.
+    """
+    resultado = {'inseridos': 0, 'atualizados': 0}
+    if not linhas:
+        return resultado
+
+    dialeto = db.session.get_bind().dialect.name
+
+    for inicio in range(0, len(linhas), TAMANHO_LOTE):
+        lote = linhas[inicio:inicio + TAMANHO_LOTE]
+
+        if dialeto == 'postgresql':
+            inseridos, atualizados = _upsert_postgres(lote, campos_atualizar)
+        elif dialeto == 'sqlite':
+            inseridos, atualizados = _upsert_sqlite(lote, campos_atualizar)
+        else:
+            inseridos, atualizados = _upsert_generico(lote, campos_atualizar)
+
+        resultado['inseridos'] += inseridos
+        resultado['atualizados'] += atualizados
+
+    return resultado
+
+
+def _upsert_postgres(lote, campos_atualizar):
+    """Um único round trip: xmax = 0 identifica as linhas recém-inseridas."""
+    stmt = postgresql.insert(Presenca.__table__).values(lote)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=CHAVE_PRESENCA,
+        set_={c: stmt.excluded[c] for c in campos_atualizar}
+    ).returning(literal_column('(xmax = 0)').label('inserido'))
+
+    flags = db.session.execute(stmt).scalars().all()
+    inseridos = sum(1 for f in flags if f)
+    return inseridos, len(flags) - inseridos
+
+
+def _upsert_sqlite(lote, campos_atualizar):
+    """SQLite não expõe insert/update no RETURNING; conta os existentes antes (banco local)."""
+    existentes = _contar_existentes(lote)
+
+    stmt = sqlite.insert(Presenca.__table__).values(lote)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=CHAVE_PRESENCA,
+        set_={c: stmt.excluded[c] for c in campos_atualizar}
+    )
+    db.session.execute(stmt)
+    return len(lote) - existentes, existentes
+
+
+def _upsert_generico(lote, campos_atualizar):
+    """Fallback para outros bancos: um SELECT dos pares + insert/update em lote."""
+    pares = [(l['id_aluno'], l['id_atividade']) for l in lote]
+    ids_existentes = {
+        (id_aluno, id_atividade): id_presenca
+        for id_aluno, id_atividade, id_presenca in db.session.execute(
+            select(Presenca.id_aluno, Presenca.id_atividade, Presenca.id)
+            .where(tuple_(Presenca.id_aluno, Presenca.id_atividade).in_(pares))
+        )
+    }
+
+    novos = [l for l in lote if (l['id_aluno'], l['id_atividade']) not in ids_existentes]
+    atualizar = [
+        {'id': ids_existentes[(l['id_aluno'], l['id_atividade'])], **{c: l[c] for c in campos_atualizar}}
+        for l in lote if (l['id_aluno'], l['id_atividade']) in ids_existentes
+    ]
+
+    if novos:
+        db.session.execute(insert(Presenca.__table__), novos)
+    if atualizar:
+        db.session.bulk_update_mappings(Presenca, atualizar)
+    return len(novos), len(atualizar)
+
+
+def _contar_existentes(lote):
+    pares = [(l['id_aluno'], l['id_atividade']) for l in lote]
+    return db.session.execute(
+        select(func.count(Presenca.id))
+        .where(tuple_(Presenca.id_aluno, Presenca.id_atividade).in_(pares))
+    ).scalar() or 0
@@ -0,0 +1,106 @@
+# app/services/resumo_ia_cache_service.py
+# Centraliza o cache persistente dos resumos da IA (tabela resumos_ia).
+#
+# Chave = sha256(modelo + tipo da fonte + texto-fonte): o mesmo plano/anexo não é
+# resumido de novo enquanto o texto não mudar. O tamanho é limitado a
+# IA_CACHE_RESUMOS_MAX linhas com descarte LRU (coluna usado_em).
+# Cada resumo guarda a origem ('plano:<id>', 'atividade:<id>'); editar ou apagar a
+# origem descarta seus resumos (before_flush), e um resumo novo substitui o antigo.
+#
+# As leituras/gravações usam uma conexão própria (db.engine.begin()), sem commitar
+# a sessão da rota.
+
+import hashlib
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import Atividade, PlanoDeAula, ResumoIA
+
+_tabela = ResumoIA.__table__
+
+
+def chave_resumo(texto_fonte, tipo_fonte, modelo):
+    h = hashlib.sha256()
+    for parte in (modelo, tipo_fonte, texto_fonte):
+        h.update((parte or '').encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def origem_resumo(obj):
+    """Identificador da origem de um resumo (usado na invalidação)."""
+    if isinstance(obj, PlanoDeAula):
+        return f"plano:{obj.id}"
+    if isinstance(obj, Atividade):
+        return f"atividade:{obj.id}"
+    return None
+
+
+def buscar_resumos(chaves):
+    """Resumos já em cache para as chaves informadas ({chave: resumo}); marca-os como usados."""
+    chaves = list(set(chaves))
+    if not chaves:
+        return {}
+
+    with db.engine.begin() as conn:
+        encontrados = dict(conn.execute(
+            select(_tabela.c.chave, _tabela.c.resumo).where(_tabela.c.chave.in_(chaves))
+        ).all())
+        if encontrados:
+            conn.execute(
+                update(_tabela).where(_tabela.c.chave.in_(list(encontrados))).values(usado_em=datetime.utcnow())
+            )
+    return encontrados
+
+
+def salvar_resumo(chave, resumo, modelo, origem=None):
+    """Grava um resumo no cache, substituindo resumos antigos da mesma origem e aplicando o limite LRU."""
+    agora = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            if origem:
+                conn.execute(delete(_tabela).where(_tabela.c.origem == origem, _tabela.c.chave != chave))
+            conn.execute(insert(_tabela).values(
+                chave=chave, origem=origem, modelo=modelo, resumo=resumo, criado_em=agora, usado_em=agora
+            ))
+    except IntegrityError:
+        # Outra requisição gravou a mesma chave ao mesmo tempo: o conteúdo é o mesmo
+        return
+
+    _aplicar_limite()
+
+
+def _aplicar_limite():
+    limite = current_app.config.get('IA_CACHE_RESUMOS_MAX', 2000)
+    with db.engine.begin() as conn:
+        excesso = conn.execute(select(func.count()).select_from(_tabela)).scalar() - limite
+        if excesso > 0:
+            mais_antigos = select(_tabela.c.chave).order_by(_tabela.c.usado_em).limit(excesso)
+            conn.execute(delete(_tabela).where(_tabela.c.chave.in_(mais_antigos.scalar_subquery())))
+
+
+def invalidar_resumos(origens, session=None):
+    """Descarta os resumos das origens informadas (na transação da sessão, sem commit)."""
+    origens = [o for o in origens if o]
+    if origens:
+        (session or db.session).execute(delete(_tabela).where(_tabela.c.origem.in_(origens)))
+
+
+def _before_flush(session, flush_context, instances):
+    alterados = [o for o in session.dirty if session.is_modified(o)]
+    origens = {
+        origem_resumo(obj) for obj in alterados + list(session.deleted)
+        if isinstance(obj, (PlanoDeAula, Atividade))
+    }
+    invalidar_resumos(origens, session=session)
+
+
+def registrar_eventos_resumos_ia():
+    """Liga a invalidação automática no before_flush (uma vez por processo)."""
+    if not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
@@ -0,0 +1,133 @@
+# app/services/resumo_notas_service.py
+# Mantém a tabela resumo_notas: notas/frequência agregadas por (aluno, turma, unidade).
+# Toda rota que grava Presenca (ou altera peso/unidade de Atividade) chama
+# atualizar_resumos* antes do commit; só as chaves afetadas são recalculadas.
+
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Numeric, case, cast, delete, func, insert, literal, literal_column, select, tuple_
+
+from app.extensions import db
+from app.models import Atividade, Presenca, ResumoNota
+from app.services.versao_dados_service import marcar_turmas_alteradas
+
+
+def unidade_da_atividade(atividade):
+    """Chave (id_turma, unidade) do resumo onde as notas da atividade entram."""
+    return (atividade.id_turma, atividade.unidade or '')
+
+
+def _select_agregado(*filtros):
+    """SELECT agregado de presenças no formato das colunas de resumo_notas."""
+    # Literal (não bind param) para o GROUP BY casar com o SELECT em prepared statements
+    unidade = func.coalesce(Atividade.unidade, literal_column("''"))
+    # Mesma regra do boletim: atividade sem peso (ou peso 0) vale 1
+    peso_efetivo = func.coalesce(func.nullif(Atividade.peso, 0), 1.0)
+    soma_ponderada = func.coalesce(func.sum(Presenca.nota * peso_efetivo), 0.0)
+    soma_pesos = func.coalesce(func.sum(case((Presenca.nota.isnot(None), peso_efetivo), else_=0.0)), 0.0)
+
+    def contar_status(status):
+        return func.coalesce(func.sum(case((Presenca.status == status, 1), else_=0)), 0)
+
+    return select(
+        Presenca.id_aluno,
+        Atividade.id_turma,
+        unidade,
+        func.coalesce(func.sum(Presenca.nota), 0.0),
+        func.count(Presenca.nota),
+        soma_ponderada,
+        soma_pesos,
+        case((soma_pesos > 0, func.round(cast(soma_ponderada / soma_pesos, Numeric), 1)), else_=0.0),
+        func.count(Presenca.id),
+        func.coalesce(func.sum(Atividade.peso), 0.0),
+        contar_status('Presente'),
+        contar_status('Ausente'),
+        contar_status('Justificado'),
+        func.coalesce(func.sum(Presenca.desempenho), 0.0),
+        func.count(Presenca.desempenho),
+        literal(datetime.utcnow(), db.DateTime),
+    ).select_from(Presenca).join(Atividade, Atividade.id == Presenca.id_atividade).where(
+        Presenca.id_aluno.isnot(None),
+        Atividade.id_turma.isnot(None),
+        *filtros
+    ).group_by(Presenca.id_aluno, Atividade.id_turma, unidade)
+
+
+_COLUNAS_RESUMO = [
+    'id_aluno', 'id_turma', 'unidade',
+    'soma_notas', 'total_notas', 'soma_notas_ponderadas', 'soma_pesos', 'media',
+    'total_registros', 'soma_pesos_registros',
+    'total_presentes', 'total_ausentes', 'total_justificados',
+    'soma_desempenho', 'total_desempenho',
+    'atualizado_em',
+]
+
+
+def atualizar_resumos(chaves, ids_alunos=None):
+    """
+    Recalcula as linhas de resumo das chaves (id_turma, unidade) informadas.
+    ids_alunos restringe o recálculo a esses alunos (None = todos os alunos).
+    Não faz commit; roda na mesma transação da escrita das notas.
+    """
+    chaves = [(id_turma, unidade or '') for id_turma, unidade in set(chaves) if id_turma is not None]
+    if not chaves or (ids_alunos is not None and not ids_alunos):
+        return
+
+    db.session.flush()
+
+    filtro_resumo = [tuple_(ResumoNota.id_turma, ResumoNota.unidade).in_(chaves)]
+    filtro_presenca = [tuple_(Atividade.id_turma, func.coalesce(Atividade.unidade, '')).in_(chaves)]
+    if ids_alunos is not None:
+        ids_alunos = list(set(ids_alunos))
+        filtro_resumo.append(ResumoNota.id_aluno.in_(ids_alunos))
+        filtro_presenca.append(Presenca.id_aluno.in_(ids_alunos))
+
+    db.session.execute(
+        delete(ResumoNota).where(*filtro_resumo).execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        insert(ResumoNota.__table__).from_select(_COLUNAS_RESUMO, _select_agregado(*filtro_presenca))
+    )
+
+    # Escritas em lote (Core) não passam pelo before_flush: troca o carimbo aqui
+    marcar_turmas_alteradas({id_turma for id_turma, _ in chaves})
+
+
+def atualizar_resumos_presencas(pares):
+    """Atualiza o resumo a partir de pares (id_aluno, id_atividade) gravados."""
+    pares = set(pares)
+    if not pares:
+        return
+
+    ids_atividades = {id_atividade for _, id_atividade in pares}
+    chave_por_atividade = {
+        id_atividade: (id_turma, unidade or '')
+        for id_atividade, id_turma, unidade in db.session.query(
+            Atividade.id, Atividade.id_turma, Atividade.unidade
+        ).filter(Atividade.id.in_(ids_atividades))
+    }
+
+    atualizar_resumos(
+        chave_por_atividade.values(),
+        ids_alunos=[id_aluno for id_aluno, _ in pares]
+    )
+
+
+def reconstruir_resumos():
+    """Apaga e recalcula todo o resumo a partir das presenças (reparo/carga inicial)."""
+    db.session.execute(delete(ResumoNota).execution_options(synchronize_session=False))
+    db.session.execute(
+        insert(ResumoNota.__table__).from_select(_COLUNAS_RESUMO, _select_agregado())
+    )
+    db.session.commit()
+    return db.session.query(func.count()).select_from(ResumoNota).scalar()
+
+
+@click.command('reconstruir-resumos')
+@with_appcontext
+def reconstruir_resumos_command():
+    """Reconstrói a tabela resumo_notas a partir de todas as presenças."""
+    total = reconstruir_resumos()
+    click.echo(f">>> Resumo de notas reconstruído: {total} linhas.")
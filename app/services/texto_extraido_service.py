@@ -0,0 +1,93 @@
+# app/services/texto_extraido_service.py
+# Centraliza o índice de textos extraídos dos anexos (tabela textos_extraidos).
+#
+# PDF/DOCX são lidos uma vez (no upload ou no primeiro uso) e o texto fica gravado;
+# as montagens de prompt seguintes leem texto puro. Só é extraído/gravado o trecho
+# que pode chegar à IA (LIMITE_TEXTO_RESUMO caracteres). Um arquivo substituído no mesmo
+# caminho (mtime/tamanho diferentes) é extraído de novo.
+# Leituras/gravações usam uma conexão própria (db.engine.begin()), sem commitar a
+# sessão da rota.
+
+import os
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import TextoExtraido
+from app.utils.helpers import extrair_texto_de_ficheiro, LIMITE_TEXTO_RESUMO
+
+_tabela = TextoExtraido.__table__
+
+# Extensões das quais extrair_texto_de_ficheiro sabe extrair texto
+EXTENSOES_COM_TEXTO = {'.pdf', '.docx', '.txt'}
+
+
+def _chave(filepath):
+    """Caminho relativo a UPLOAD_FOLDER (estável entre máquinas/deploys)."""
+    base = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    caminho = os.path.abspath(filepath)
+    if caminho.startswith(base + os.sep):
+        caminho = os.path.relpath(caminho, base)
+    return caminho.replace(os.sep, '/')
+
+
+def texto_do_arquivo(filepath, filename):
+    """
+    Texto do arquivo em disco, lido do índice quando o arquivo não mudou;
+    caso contrário extrai (PDF/DOCX/TXT) e atualiza o índice.
+    """
+    if os.path.splitext(filename or filepath)[1].lower() not in EXTENSOES_COM_TEXTO:
+        return ""
+    try:
+        info = os.stat(filepath)
+    except OSError:
+        print(f"Ficheiro não encontrado: {filepath}")
+        return ""
+
+    chave = _chave(filepath)
+    try:
+        with db.engine.connect() as conn:
+            registro = conn.execute(
+                select(_tabela.c.mtime, _tabela.c.tamanho, _tabela.c.texto).where(_tabela.c.caminho == chave)
+            ).first()
+        if registro and registro.mtime == info.st_mtime and registro.tamanho == info.st_size:
+            return registro.texto
+    except Exception as e:
+        print(f"Erro ao ler índice de textos: {e}")
+        registro = None
+
+    texto = extrair_texto_de_ficheiro(filepath, filename or filepath, LIMITE_TEXTO_RESUMO)
+
+    valores = dict(mtime=info.st_mtime, tamanho=info.st_size, texto=texto, extraido_em=datetime.utcnow())
+    try:
+        with db.engine.begin() as conn:
+            if registro:
+                conn.execute(update(_tabela).where(_tabela.c.caminho == chave).values(**valores))
+            else:
+                conn.execute(insert(_tabela).values(caminho=chave, **valores))
+    except IntegrityError:
+        pass  # Outra requisição indexou o mesmo arquivo ao mesmo tempo
+    except Exception as e:
+        print(f"Erro ao gravar índice de textos: {e}")
+
+    return texto
+
+
+def indexar_arquivo(filepath, filename):
+    """Extrai e indexa o texto logo após o upload (falhas não interrompem o upload)."""
+    try:
+        texto_do_arquivo(filepath, filename)
+    except Exception as e:
+        print(f"Erro ao indexar texto de {filename}: {e}")
+
+
+def remover_texto_extraido(filepath):
+    """Remove a entrada do índice de um arquivo apagado."""
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(delete(_tabela).where(_tabela.c.caminho == _chave(filepath)))
+    except Exception as e:
+        print(f"Erro ao remover índice de textos: {e}")
@@ -0,0 +1,76 @@
+# app/services/versao_dados_service.py
+# Centraliza o carimbo de versão dos dados de cada turma (Turma.versao_dados).
+#
+# O carimbo é um token aleatório trocado a cada alteração em notas, atividades ou
+# alunos da turma; caches derivados (ex.: exportações da matriz) usam o token na chave.
+# Escritas pelo ORM são detectadas no before_flush; escritas em lote (Core) chamam
+# marcar_turmas_alteradas diretamente (ver resumo_notas_service.atualizar_resumos).
+
+import uuid
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models import Aluno, Atividade, Presenca, Turma
+
+
+def marcar_turmas_alteradas(ids_turmas, session=None):
+    """Troca o carimbo de versão das turmas informadas (não faz commit)."""
+    from app.extensions import db
+    session = session or db.session
+
+    ids_turmas = {i for i in ids_turmas if i is not None}
+    if not ids_turmas:
+        return
+
+    session.execute(
+        Turma.__table__.update()
+        .where(Turma.__table__.c.id.in_(ids_turmas))
+        .values(versao_dados=uuid.uuid4().hex)
+    )
+
+    # Turmas já carregadas nesta sessão releem o carimbo no próximo acesso
+    for id_turma in ids_turmas:
+        turma = session.identity_map.get(inspect(Turma).identity_key_from_primary_key((id_turma,)))
+        if turma is not None and turma not in session.deleted:
+            session.expire(turma, ['versao_dados'])
+
+
+def _valores_coluna(obj, coluna):
+    """Valor atual e anterior (se alterado nesta transação) de uma coluna."""
+    historico = inspect(obj).attrs[coluna].history
+    return set(historico.added or ()) | set(historico.deleted or ()) | {getattr(obj, coluna)}
+
+
+def _turmas_afetadas(session):
+    ids_turmas = set()
+    ids_atividades = set()
+
+    # Objetos apenas "tocados" (sem mudança real de coluna/coleção) não contam
+    alterados = [o for o in session.dirty if session.is_modified(o)]
+
+    for obj in list(session.new) + alterados + list(session.deleted):
+        if isinstance(obj, Presenca):
+            ids_atividades |= _valores_coluna(obj, 'id_atividade')
+        elif isinstance(obj, (Atividade, Aluno)):
+            ids_turmas |= _valores_coluna(obj, 'id_turma')
+        elif isinstance(obj, Turma) and obj in alterados:
+            ids_turmas.add(obj.id)
+
+    ids_atividades.discard(None)
+    if ids_atividades:
+        ids_turmas.update(session.execute(
+            select(Atividade.id_turma).where(Atividade.id.in_(ids_atividades))
+        ).scalars())
+
+    return ids_turmas
+
+
+def _before_flush(session, flush_context, instances):
+    marcar_turmas_alteradas(_turmas_afetadas(session), session=session)
+
+
+def registrar_eventos_versao():
+    """Liga a detecção automática no before_flush (uma vez por processo)."""
+    if not event.contains(Session, 'before_flush', _before_flush):
+        event.listen(Session, 'before_flush', _before_flush)
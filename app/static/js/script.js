@@ -30,6 +30,36 @@ function confirmMaterialDelete(event) {
     }
 }
 
+/**
+ * Lê uma resposta SSE (text/event-stream) de um fetch POST e chama
+ * aoEvento(nome, dados) para cada evento recebido ('parcial', 'fim', 'erro').
+ */
+async function lerEventosSSE(response, aoEvento) {
+    const leitor = response.body.getReader();
+    const decodificador = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await leitor.read();
+        if (done) break;
+        buffer += decodificador.decode(value, { stream: true });
+
+        let fim;
+        while ((fim = buffer.indexOf('\n\n')) !== -1) {
+            const bloco = buffer.slice(0, fim);
+            buffer = buffer.slice(fim + 2);
+
+            let nome = 'message';
+            let dados = '';
+            bloco.split('\n').forEach(linha => {
+                if (linha.startsWith('event:')) nome = linha.slice(6).trim();
+                else if (linha.startsWith('data:')) dados += linha.slice(5).trim();
+            });
+            if (dados) aoEvento(nome, JSON.parse(dados));
+        }
+    }
+}
+
 
 // ==========================================================
 // RENDERIZAÇÃO DE GRÁFICOS (CHART.JS)
@@ -616,4 +646,94 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-}); // Fim do DOMContentLoaded
\ No newline at end of file
+}); // Fim do DOMContentLoaded
+
+/**
+ * Acompanha um job em segundo plano (resposta 202 com status_url/eventos_url):
+ * escuta o SSE de eventos quando disponível e cai para polling do status se a
+ * conexão falhar. Chama aoConcluir(dados) ou aoFalhar(mensagem) uma única vez.
+ */
+function acompanharJob(job, aoConcluir, aoFalhar, aoProgresso) {
+    let encerrado = false;
+    const terminar = (dados) => {
+        if (encerrado) return;
+        encerrado = true;
+        if (dados.job_status === 'concluido') aoConcluir(dados);
+        else aoFalhar(dados.message || 'tente novamente.');
+    };
+
+    const consultar = () => {
+        if (encerrado) return;
+        fetch(job.status_url, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(data => {
+                if (data.job_status === 'concluido' || data.job_status === 'erro' || data.status === 'error') {
+                    terminar(data);
+                } else {
+                    if (aoProgresso) aoProgresso(data);
+                    setTimeout(consultar, 1500);
+                }
+            })
+            .catch(() => {
+                encerrado = true;
+                aoFalhar('Erro ao conectar com o servidor.');
+            });
+    };
+
+    if (!job.eventos_url || !window.EventSource) {
+        consultar();
+        return;
+    }
+
+    const fonte = new EventSource(job.eventos_url);
+    fonte.addEventListener('progresso', (e) => {
+        if (aoProgresso) aoProgresso(JSON.parse(e.data));
+    });
+    fonte.addEventListener('fim', (e) => {
+        fonte.close();
+        terminar(JSON.parse(e.data));
+    });
+    fonte.onerror = () => {
+        // Cada conexão traz um status e fecha (reconecta após o 'retry:' do servidor); falha real vira polling
+        if (fonte.readyState === EventSource.CLOSED && !encerrado) consultar();
+    };
+}
+
+/**
+ * Exportações em segundo plano: links com data-export-job enfileiram o arquivo
+ * (resposta 202 com job_id), acompanham o job e iniciam o download quando pronto.
+ * Sem JavaScript o link continua gerando o arquivo direto.
+ */
+document.addEventListener('click', function(event) {
+    const link = event.target.closest('a[data-export-job]');
+    if (!link) return;
+    event.preventDefault();
+
+    if (link.dataset.exportando === '1') return;
+    link.dataset.exportando = '1';
+    const iconeOriginal = link.innerHTML;
+    link.innerHTML = '<i class="fas fa-spinner fa-spin"></i>';
+
+    const finalizar = () => {
+        link.dataset.exportando = '';
+        link.innerHTML = iconeOriginal;
+    };
+    const falhar = (mensagem) => {
+        finalizar();
+        alert('Erro ao gerar o arquivo: ' + mensagem);
+    };
+
+    fetch(link.href, { headers: { 'Accept': 'application/json' } })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status === 'success' && data.status_url) {
+                acompanharJob(data, (pronto) => {
+                    finalizar();
+                    window.location.href = pronto.download_url;
+                }, falhar);
+            } else {
+                falhar(data.message || 'tente novamente.');
+            }
+        })
+        .catch(() => falhar('Erro ao conectar com o servidor.'));
+});
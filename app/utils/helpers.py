@@ -1,13 +1,17 @@
 import os
-import requests 
 import json     
-from io import BytesIO
 import docx
+import numpy as np
 from datetime import datetime
-from flask import current_app
+from flask import current_app, request, Response, stream_with_context
 
 # CORREÇÃO: Importar de app.models em vez de app.models.base_legacy
-from app.models import db, Notificacao, Presenca, Atividade 
+from app.models import db, Notificacao, Aluno
+from app.services.notificacao_service import invalidar_resumo_notificacoes
+from app.services.ia_service import obter_cliente_ia, MODELO_RESUMO
+from app.services.resumo_ia_cache_service import chave_resumo, buscar_resumos, salvar_resumo
+from app.services.analise_notas_service import carregar_analise
+from app.services.matriz_notas_service import ORDEM_UNIDADES
 
 # Import condicional do PyPDF2, essencial para ler PDFs
 try:
@@ -35,6 +39,7 @@ def enviar_notificacao(id_user, texto, link=None):
         )
         db.session.add(nova_notificacao)
         db.session.commit()
+        invalidar_resumo_notificacoes(id_user)
         return True
     except Exception as e:
         print(f"Erro ao enviar notificação: {e}")
@@ -58,56 +63,87 @@ def allowed_file(filename):
 
 # --- Funções de Extração de Texto (File I/O) ---
 
-def extrair_texto_docx(file_stream):
+# Maior trecho de texto-fonte enviado à IA (ver _prompt_resumo): extrair além disso é desperdício
+LIMITE_TEXTO_RESUMO = 8000
+
+
+def _juntar_ate_limite(partes, separador, limite_caracteres):
+    """Junta os textos de um iterável, parando de consumi-lo quando o limite é atingido."""
+    trechos = []
+    total = 0
+    for parte in partes:
+        if not parte:
+            continue
+        trechos.append(parte)
+        total += len(parte) + len(separador)
+        if limite_caracteres is not None and total >= limite_caracteres:
+            break
+    texto = separador.join(trechos)
+    return texto[:limite_caracteres] if limite_caracteres is not None else texto
+
+def extrair_texto_docx(file_stream, limite_caracteres=None):
     """Extrai texto de um ficheiro .docx a partir de um stream de bytes."""
     try:
         doc = docx.Document(file_stream)
-        return "\n".join([para.text for para in doc.paragraphs if para.text])
+        return _juntar_ate_limite((para.text for para in doc.paragraphs), "\n", limite_caracteres)
     except Exception as e:
         print(f"Erro ao ler DOCX da memória: {e}")
         return ""
 
-def extrair_texto_pdf(file_stream):
-    """Extrai texto de um ficheiro .pdf a partir de um stream de bytes."""
+def iterar_paginas_pdf(file_stream):
+    """
+    Gera o texto de cada página do PDF, uma por vez. O chamador pode parar a
+    iteração a qualquer momento: páginas seguintes nem chegam a ser processadas.
+    """
     if PdfReader is None:
         print("Erro: PyPDF2 não está instalado, não é possível ler PDF.")
-        return ""
+        return
+    reader = PdfReader(file_stream)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+def extrair_texto_pdf(file_stream, limite_caracteres=None):
+    """
+    Extrai texto de um ficheiro .pdf a partir de um stream de bytes.
+    Com limite_caracteres, para de ler páginas assim que o limite é atingido.
+    """
     try:
-        text = ""
-        reader = PdfReader(file_stream)
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
+        return _juntar_ate_limite(iterar_paginas_pdf(file_stream), "", limite_caracteres)
     except Exception as e:
         print(f"Erro ao ler PDF da memória: {e}")
         return ""
 
-def extrair_texto_de_ficheiro(file_stream_or_path, filename):
+def extrair_texto_de_ficheiro(file_stream_or_path, filename, limite_caracteres=None):
     """
     Função principal que decide qual helper usar para extrair texto.
     Aceita um path (string) ou um stream de bytes (BytesIO).
+    limite_caracteres: devolve no máximo esse tamanho (e lê só o necessário do PDF/DOCX).
     """
     _, ext = os.path.splitext(filename)
     ext = ext.lower()
     
-    # Se for um path (string), abre como ficheiro
+    # Se for um path (string), abre como ficheiro (lido sob demanda, sem copiar para a memória)
     if isinstance(file_stream_or_path, str):
         if not os.path.exists(file_stream_or_path):
             print(f"Ficheiro não encontrado: {file_stream_or_path}")
             return ""
         with open(file_stream_or_path, 'rb') as f:
-            file_stream = BytesIO(f.read())
-    else: # Se já for um stream (BytesIO)
-        file_stream = file_stream_or_path
+            return extrair_texto_de_ficheiro(f, filename, limite_caracteres)
+
+    file_stream = file_stream_or_path
 
     if ext == '.docx':
-        return extrair_texto_docx(file_stream)
+        return extrair_texto_docx(file_stream, limite_caracteres)
     elif ext == '.pdf':
-        return extrair_texto_pdf(file_stream)
+        return extrair_texto_pdf(file_stream, limite_caracteres)
     elif ext == '.txt':
         try:
             # Volta ao início do stream para ler o conteúdo de texto
             file_stream.seek(0)
+            if limite_caracteres is not None:
+                # UTF-8 usa no máximo 4 bytes por caractere
+                conteudo = file_stream.read(limite_caracteres * 4).decode('utf-8', errors='ignore')
+                return conteudo[:limite_caracteres]
             return file_stream.read().decode('utf-8')
         except Exception as e:
             print(f"Erro ao ler TXT da memória: {e}")
@@ -117,38 +153,108 @@ def extrair_texto_de_ficheiro(file_stream_or_path, filename):
 
 # --- Função de Assistente IA (Networking) ---
 
-def obter_resumo_ia(texto_fonte, api_key, tipo_fonte):
-    """
-    Envia um texto grande para a IA e pede um resumo focado em avaliação.
-    A api_key é passada como argumento para evitar dependência direta de app.config.
-    """
-    if not texto_fonte or not texto_fonte.strip():
-        return ""
-
+def _prompt_resumo(texto_fonte, tipo_fonte):
     # O prompt solicita um resumo focado em conceitos úteis para gerar questões.
-    prompt = f"""
+    return f"""
     Aja como um assistente pedagógico. Resuma o seguinte texto de um(a) '{tipo_fonte}'.
     O seu resumo deve focar-se APENAS nos principais tópicos, conceitos, e factos que seriam úteis para criar uma questão de prova.
     Seja conciso. Responda apenas com o resumo.
 
     TEXTO-FONTE:
     ---
-    {texto_fonte[:8000]} 
+    {texto_fonte[:LIMITE_TEXTO_RESUMO]} 
     ---
     """
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp:generateContent?key={api_key}"
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    
+
+def obter_resumo_ia(texto_fonte, api_key, tipo_fonte, origem=None):
+    """
+    Envia um texto grande para a IA e pede um resumo focado em avaliação.
+    A api_key é passada como argumento para evitar dependência direta de app.config.
+    O resultado fica no cache persistente (resumos_ia); origem (ver
+    resumo_ia_cache_service.origem_resumo) permite descartá-lo quando a fonte mudar.
+    """
+    return obter_resumos_ia([(texto_fonte, tipo_fonte, origem)], api_key, max_paralelo=1)[0]
+
+
+def obter_resumos_ia(fontes, api_key, max_paralelo=None):
+    """
+    Versão em lote de obter_resumo_ia: fontes é uma lista de (texto_fonte, tipo_fonte)
+    ou (texto_fonte, tipo_fonte, origem). Resumos já em cache não chamam a IA; os demais
+    são pedidos em paralelo (no máximo max_paralelo em voo por requisição, padrão
+    IA_MAX_RESUMOS_PARALELOS) e devolvidos na mesma ordem das fontes.
+    """
+    limite = max(1, max_paralelo or current_app.config.get('IA_MAX_RESUMOS_PARALELOS', 4))
+    cliente = obter_cliente_ia()
+
+    fontes = [tuple(f) + (None,) * (3 - len(f)) for f in fontes]
+    resumos = [""] * len(fontes)
+    chaves = [chave_resumo(texto, tipo, MODELO_RESUMO) for texto, tipo, _ in fontes]
+
+    validas = [i for i, (texto, _, _) in enumerate(fontes) if texto and texto.strip()]
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=60) # 60s para resumir
-        response.raise_for_status()
-        resumo = response.json()['candidates'][0]['content']['parts'][0]['text']
-        return resumo.strip()
+        em_cache = buscar_resumos([chaves[i] for i in validas])
     except Exception as e:
-        print(f"Erro ao resumir: {e}")
-        return f"(Erro ao resumir {tipo_fonte})"
+        print(f"Erro ao ler cache de resumos: {e}")
+        em_cache = {}
+
+    fila = []
+    for i in validas:
+        if chaves[i] in em_cache:
+            resumos[i] = em_cache[chaves[i]]
+        else:
+            fila.append(i)
+
+    lote = cliente.gerar_em_lote(
+        [[{"text": _prompt_resumo(fontes[i][0], fontes[i][1])}] for i in fila],
+        max_paralelo=limite, modelo=MODELO_RESUMO, api_key=api_key, timeout=60
+    )
+    for posicao, resumo, erro in lote:
+        i = fila[posicao]
+        if erro is not None:
+            print(f"Erro ao resumir: {erro}")
+            resumos[i] = f"(Erro ao resumir {fontes[i][1]})"
+            continue
+        resumos[i] = resumo.strip()
+        try:
+            salvar_resumo(chaves[i], resumos[i], MODELO_RESUMO, fontes[i][2])
+        except Exception as e:
+            print(f"Erro ao gravar cache de resumos: {e}")
+
+    return resumos
+
+# --- Server-Sent Events (respostas em streaming) ---
+
+def evento_sse(dados, evento=None):
+    """Formata um evento SSE com dados JSON."""
+    linhas = f"event: {evento}\n" if evento else ""
+    return linhas + f"data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+def resposta_sse(gerador):
+    """Response text/event-stream que mantém o contexto do request (db.session, current_user)."""
+    return Response(
+        stream_with_context(gerador),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}  # sem buffer no nginx
+    )
+
+def pede_sse():
+    """True quando o cliente pediu a resposta em streaming (?stream=1 ou Accept: text/event-stream)."""
+    return request.args.get('stream') == '1' or 'text/event-stream' in request.headers.get('Accept', '')
+
+def eventos_ia_sse(pedacos, concluir):
+    """
+    Repassa os pedaços da IA como eventos 'parcial' ({"texto": ...}) e termina com um
+    evento 'fim' contendo concluir(texto_completo). Falhas viram um evento 'erro'.
+    """
+    recebidos = []
+    try:
+        for pedaco in pedacos:
+            recebidos.append(pedaco)
+            yield evento_sse({"texto": pedaco}, 'parcial')
+        yield evento_sse(concluir("".join(recebidos)), 'fim')
+    except Exception as e:
+        yield evento_sse({"status": "error", "message": str(e)}, 'erro')
 
 # --- CÁLCULO ACADÊMICO (NOVO) ---
 
@@ -165,60 +271,70 @@ def calcular_boletim_aluno(aluno_id):
         'media_final': 7.7
     }
     """
-    # 1. Buscar todas as notas lançadas para o aluno
-    # Fazemos um JOIN com Atividade para saber a qual Unidade a nota pertence
-    presencas = db.session.query(Presenca).join(Atividade).filter(
-        Presenca.id_aluno == aluno_id,
-        Presenca.nota != None  # Ignora atividades sem nota lançada
-    ).all()
-
-    boletim = {}
-
-    # 2. Agrupar notas por Unidade
-    for p in presencas:
-        # Pega a unidade da atividade (ou define 'Geral' se estiver vazio)
-        unidade = p.atividade.unidade if p.atividade.unidade else 'Geral'
-        
-        # Pega o peso (se não tiver peso, assume 1.0)
-        peso = p.atividade.peso if p.atividade.peso else 1.0
-        
-        # Pega a nota
-        nota = p.nota
-        
-        if unidade not in boletim:
-            boletim[unidade] = {
-                'soma_notas_ponderadas': 0, 
-                'soma_pesos': 0, 
+    return calcular_boletins([aluno_id]).get(aluno_id, {'detalhe': {}, 'media_final': 0})
+
+def calcular_boletins(ids_alunos):
+    """
+    Boletins de vários alunos de uma vez: {id_aluno: boletim}, cada um com a mesma
+    estrutura de calcular_boletim_aluno. Uma única query para todos (época de boletins).
+    """
+    ids_alunos = list(ids_alunos)
+    if not ids_alunos:
+        return {}
+    return _montar_boletins(carregar_analise(Aluno.id.in_(ids_alunos)))
+
+def calcular_boletins_turma(id_turma):
+    """Boletins de todos os alunos da turma: {id_aluno: boletim}, em uma query."""
+    return _montar_boletins(carregar_analise(Aluno.id_turma == id_turma))
+
+def _montar_boletins(analise):
+    # 1. Totais por unidade já agregados em resumo_notas, somados em arrays por (aluno, unidade)
+    # (somas ponderadas mantidas a cada gravação de nota; peso vazio/0 conta como 1.0;
+    # o aluno pode ter notas de mais de uma turma; atividades sem unidade ficam em 'Geral')
+    nomes = [u or 'Geral' for u in analise.unidades]
+    rotulos = [u for u in ORDEM_UNIDADES if u in nomes] + sorted(set(nomes) - set(ORDEM_UNIDADES))
+    codigo_rotulo = {rotulo: j for j, rotulo in enumerate(rotulos)}
+    rotulo_linha = np.array([codigo_rotulo[u] for u in nomes], dtype=np.int64)[analise.unidade]
+
+    formato = (len(analise.ids_alunos), len(rotulos))
+    grupos = analise.indice_aluno * len(rotulos) + rotulo_linha
+    com_notas = analise.total_notas > 0  # Ignora unidades sem nota lançada
+
+    def somar(valores):
+        return analise.por_grupo(grupos, formato[0] * formato[1], valores, com_notas).reshape(formato)
+
+    somas_ponderadas = somar(analise.soma_notas_ponderadas)
+    somas_pesos = somar(analise.soma_pesos)
+    tem_notas = somar(analise.total_notas) > 0
+
+    boletins = {}
+    for i, id_aluno in enumerate(analise.ids_alunos):
+        boletim = {}
+        soma_medias_unidades = 0
+        total_unidades_calculadas = 0
+
+        # 2. Calcular a Média de cada Unidade individualmente
+        for j in np.flatnonzero(tem_notas[i]):
+            dados = {
+                'soma_notas_ponderadas': float(somas_ponderadas[i, j]), 
+                'soma_pesos': float(somas_pesos[i, j]), 
                 'media': 0
             }
-        
-        # Acumula para o cálculo da média ponderada DAQUELA unidade
-        boletim[unidade]['soma_notas_ponderadas'] += (nota * peso)
-        boletim[unidade]['soma_pesos'] += peso
-
-    # 3. Calcular a Média de cada Unidade individualmente
-    soma_medias_unidades = 0
-    total_unidades_calculadas = 0
-
-    for unidade, dados in boletim.items():
-        if dados['soma_pesos'] > 0:
-            # Fórmula: Soma (Nota * Peso) / Soma (Pesos)
-            media_unidade = dados['soma_notas_ponderadas'] / dados['soma_pesos']
-            
-            # Arredonda para 1 casa decimal (ex: 7.56 vira 7.6)
-            dados['media'] = round(media_unidade, 1)
-            
-            # Adiciona ao acumulador para a média final
-            soma_medias_unidades += dados['media']
-            total_unidades_calculadas += 1
-
-    # 4. Calcular a Média Final Global (Média das Médias das Unidades)
-    media_final = 0
-    if total_unidades_calculadas > 0:
-        media_final = soma_medias_unidades / total_unidades_calculadas
-        media_final = round(media_final, 1)
-
-    return {
-        'detalhe': boletim,
-        'media_final': media_final
-    }
\ No newline at end of file
+            if dados['soma_pesos'] > 0:
+                # Fórmula: Soma (Nota * Peso) / Soma (Pesos), arredondada para 1 casa (7.56 vira 7.6)
+                dados['media'] = round(dados['soma_notas_ponderadas'] / dados['soma_pesos'], 1)
+                soma_medias_unidades += dados['media']
+                total_unidades_calculadas += 1
+            boletim[rotulos[j]] = dados
+
+        # 3. Calcular a Média Final Global (Média das Médias das Unidades)
+        media_final = 0
+        if total_unidades_calculadas > 0:
+            media_final = round(soma_medias_unidades / total_unidades_calculadas, 1)
+
+        boletins[int(id_aluno)] = {
+            'detalhe': boletim,
+            'media_final': media_final
+        }
+
+    return boletins
\ No newline at end of file
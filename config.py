@@ -44,4 +44,52 @@ class Config:
     MAX_CONTENT_LENGTH = 1024 * 1024 * 1024 
     
     # API Key IA
-    GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
\ No newline at end of file
+    GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
+
+    # Cliente Gemini compartilhado (ver app/services/ia_service.py)
+    IA_BASE_URL = os.environ.get('IA_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta') # aponte para um stub local em testes
+    IA_TIMEOUT_CONEXAO = float(os.environ.get('IA_TIMEOUT_CONEXAO', 5)) # o timeout de leitura é definido por rota
+    IA_MAX_TENTATIVAS = int(os.environ.get('IA_MAX_TENTATIVAS', 3))
+    IA_BACKOFF_BASE = float(os.environ.get('IA_BACKOFF_BASE', 0.5)) # segundos; dobra a cada tentativa
+    IA_MAX_WORKERS = int(os.environ.get('IA_MAX_WORKERS', 8))
+    IA_CACHE_RESPOSTAS_TTL = int(os.environ.get('IA_CACHE_RESPOSTAS_TTL', 600)) # correções repetidas; 0 desliga
+    IA_CACHE_RESPOSTAS_MAX = int(os.environ.get('IA_CACHE_RESPOSTAS_MAX', 500)) # itens no cache em memória
+    IA_MAX_RESUMOS_PARALELOS = int(os.environ.get('IA_MAX_RESUMOS_PARALELOS', 4)) # por requisição (ex.: gerar_prova_docx)
+    IA_CACHE_RESUMOS_MAX = int(os.environ.get('IA_CACHE_RESUMOS_MAX', 2000)) # linhas em resumos_ia (descarte LRU)
+    IA_MAX_CORRECOES_PARALELAS = int(os.environ.get('IA_MAX_CORRECOES_PARALELAS', 4)) # provas por lote em voo ao mesmo tempo
+    IA_MAX_FOTOS_LOTE = int(os.environ.get('IA_MAX_FOTOS_LOTE', 40)) # fotos por pedido de correção em lote (acima disso, 400)
+
+    # Limite de uso das rotas de IA (token bucket; ver app/services/limite_ia_service.py). 0 desliga o escopo.
+    IA_LIMITE_BACKEND = os.environ.get('IA_LIMITE_BACKEND') # padrão: o mesmo de CACHE_BACKEND
+    IA_LIMITE_USUARIO_POR_MINUTO = float(os.environ.get('IA_LIMITE_USUARIO_POR_MINUTO', 10))
+    IA_LIMITE_USUARIO_RAJADA = int(os.environ.get('IA_LIMITE_USUARIO_RAJADA', 5))
+    IA_LIMITE_ESCOLA_POR_MINUTO = float(os.environ.get('IA_LIMITE_ESCOLA_POR_MINUTO', 60))
+    IA_LIMITE_ESCOLA_RAJADA = int(os.environ.get('IA_LIMITE_ESCOLA_RAJADA', 20))
+    IA_LIMITE_ESPERA_MAX = float(os.environ.get('IA_LIMITE_ESPERA_MAX', 5)) # segundos na fila antes de responder 429
+
+    # Imagens enviadas à IA (ver app/services/imagem_service.py)
+    IA_IMAGEM_LADO_MAX = int(os.environ.get('IA_IMAGEM_LADO_MAX', 1600)) # pixels no maior lado
+    IA_IMAGEM_QUALIDADE = int(os.environ.get('IA_IMAGEM_QUALIDADE', 70))
+    IA_IMAGEM_FORMATO = os.environ.get('IA_IMAGEM_FORMATO', 'JPEG') # 'JPEG' ou 'WEBP'
+
+    # --- Cache ---
+    # 'memoria' (por processo) ou 'redis' (compartilhado entre workers do gunicorn)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memoria')
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    CACHE_TTL_NOTIFICACOES = int(os.environ.get('CACHE_TTL_NOTIFICACOES', 60))
+
+    # Cache de identidade do user_loader (por worker; invalidação via CACHE_BACKEND)
+    IDENTIDADE_CACHE_TTL = int(os.environ.get('IDENTIDADE_CACHE_TTL', 300))
+    IDENTIDADE_CACHE_MAX = int(os.environ.get('IDENTIDADE_CACHE_MAX', 1000))
+
+    # --- Tarefas em segundo plano (exportações) ---
+    JOBS_FOLDER = str(BASE_DIR / 'instance' / 'jobs')
+    JOBS_MAX_WORKERS = int(os.environ.get('JOBS_MAX_WORKERS', 2))
+    JOBS_MAX_WORKERS_IA = int(os.environ.get('JOBS_MAX_WORKERS_IA', 4)) # tarefas que esperam a IA (provas, correções em lote)
+    JOBS_TTL_ARQUIVOS = int(os.environ.get('JOBS_TTL_ARQUIVOS', 3600)) # segundos até o arquivo expirar
+    JOBS_TIMEOUT_EXECUCAO = int(os.environ.get('JOBS_TIMEOUT_EXECUCAO', 600)) # 'executando' sem batimento além disso = worker perdido, vira 'erro'
+    JOBS_BATIMENTO_INTERVALO = int(os.environ.get('JOBS_BATIMENTO_INTERVALO', 60)) # segundos entre batimentos de um job em execução
+    JOBS_SSE_INTERVALO = float(os.environ.get('JOBS_SSE_INTERVALO', 1.5)) # segundos até o EventSource reconsultar GET /jobs/<id>/eventos
+
+    # Cache das exportações da matriz (chave = turma + formato + versão dos dados)
+    EXPORT_CACHE_FOLDER = str(BASE_DIR / 'instance' / 'export_cache')
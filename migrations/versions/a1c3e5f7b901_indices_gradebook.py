@@ -0,0 +1,45 @@
+"""indices do gradebook: presencas(id_aluno, id_atividade) unico + FKs de turma
+
+Revision ID: a1c3e5f7b901
+Revises:
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f7b901'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Remove duplicatas (aluno, atividade) antes de criar o índice único,
+    # mantendo o registro mais recente de cada par.
+    op.execute(
+        """
+        DELETE FROM presencas
+        WHERE id NOT IN (
+            SELECT max_id FROM (
+                SELECT MAX(id) AS max_id
+                FROM presencas
+                GROUP BY id_aluno, id_atividade
+            ) AS manter
+        )
+        """
+    )
+
+    op.create_index('uq_presencas_aluno_atividade', 'presencas', ['id_aluno', 'id_atividade'], unique=True)
+    op.create_index(op.f('ix_atividades_id_turma'), 'atividades', ['id_turma'], unique=False)
+    op.create_index(op.f('ix_alunos_id_turma'), 'alunos', ['id_turma'], unique=False)
+    op.create_index(op.f('ix_turmas_autor_id'), 'turmas', ['autor_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_turmas_autor_id'), table_name='turmas')
+    op.drop_index(op.f('ix_alunos_id_turma'), table_name='alunos')
+    op.drop_index(op.f('ix_atividades_id_turma'), table_name='atividades')
+    op.drop_index('uq_presencas_aluno_atividade', table_name='presencas')
@@ -0,0 +1,28 @@
+"""jobs.total_itens/itens_concluidos: progresso de tarefas em lote
+
+Revision ID: a7c9e1f3b462
+Revises: f6b8d0e2a351
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1f3b462'
+down_revision = 'f6b8d0e2a351'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_itens', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('itens_concluidos', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_column('itens_concluidos')
+        batch_op.drop_column('total_itens')
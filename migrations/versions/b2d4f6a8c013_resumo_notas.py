@@ -0,0 +1,45 @@
+"""tabela resumo_notas: notas/frequência agregadas por (aluno, turma, unidade)
+
+Revision ID: b2d4f6a8c013
+Revises: a1c3e5f7b901
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d4f6a8c013'
+down_revision = 'a1c3e5f7b901'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A carga inicial é feita com `flask reconstruir-resumos` após o upgrade.
+    op.create_table('resumo_notas',
+    sa.Column('id_aluno', sa.Integer(), nullable=False),
+    sa.Column('id_turma', sa.Integer(), nullable=False),
+    sa.Column('unidade', sa.String(length=20), nullable=False),
+    sa.Column('soma_notas', sa.Float(), nullable=False),
+    sa.Column('total_notas', sa.Integer(), nullable=False),
+    sa.Column('soma_notas_ponderadas', sa.Float(), nullable=False),
+    sa.Column('soma_pesos', sa.Float(), nullable=False),
+    sa.Column('media', sa.Float(), nullable=False),
+    sa.Column('total_registros', sa.Integer(), nullable=False),
+    sa.Column('soma_pesos_registros', sa.Float(), nullable=False),
+    sa.Column('total_presentes', sa.Integer(), nullable=False),
+    sa.Column('total_ausentes', sa.Integer(), nullable=False),
+    sa.Column('total_justificados', sa.Integer(), nullable=False),
+    sa.Column('soma_desempenho', sa.Float(), nullable=False),
+    sa.Column('total_desempenho', sa.Integer(), nullable=False),
+    sa.Column('atualizado_em', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['id_aluno'], ['alunos.id'], ),
+    sa.ForeignKeyConstraint(['id_turma'], ['turmas.id'], ),
+    sa.PrimaryKeyConstraint('id_aluno', 'id_turma', 'unidade')
+    )
+
+
+def downgrade():
+    op.drop_table('resumo_notas')
@@ -0,0 +1,26 @@
+"""jobs.atualizado_em: batimento do worker de jobs em execução
+
+Revision ID: b8d0f2a4c573
+Revises: a7c9e1f3b462
+Create Date: 2026-10-17 23:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d0f2a4c573'
+down_revision = 'a7c9e1f3b462'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('atualizado_em', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('jobs', schema=None) as batch_op:
+        batch_op.drop_column('atualizado_em')
@@ -0,0 +1,46 @@
+"""tabela jobs: tarefas em segundo plano (exportações)
+
+Revision ID: c3e5a7b9d025
+Revises: b2d4f6a8c013
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7b9d025'
+down_revision = 'b2d4f6a8c013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('tipo', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('id_user', sa.Integer(), nullable=False),
+    sa.Column('parametros', sa.Text(), nullable=True),
+    sa.Column('mensagem_erro', sa.Text(), nullable=True),
+    sa.Column('arquivo_path', sa.String(length=255), nullable=True),
+    sa.Column('download_name', sa.String(length=255), nullable=True),
+    sa.Column('mimetype', sa.String(length=100), nullable=True),
+    sa.Column('criado_em', sa.DateTime(), nullable=True),
+    sa.Column('iniciado_em', sa.DateTime(), nullable=True),
+    sa.Column('concluido_em', sa.DateTime(), nullable=True),
+    sa.Column('expira_em', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['id_user'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_jobs_status'), 'jobs', ['status'], unique=False)
+    op.create_index(op.f('ix_jobs_id_user'), 'jobs', ['id_user'], unique=False)
+    op.create_index(op.f('ix_jobs_expira_em'), 'jobs', ['expira_em'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_jobs_expira_em'), table_name='jobs')
+    op.drop_index(op.f('ix_jobs_id_user'), table_name='jobs')
+    op.drop_index(op.f('ix_jobs_status'), table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,26 @@
+"""turmas.versao_dados: carimbo de versão para o cache de exportações
+
+Revision ID: d4f6b8c0e137
+Revises: c3e5a7b9d025
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f6b8c0e137'
+down_revision = 'c3e5a7b9d025'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('turmas', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('versao_dados', sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('turmas', schema=None) as batch_op:
+        batch_op.drop_column('versao_dados')
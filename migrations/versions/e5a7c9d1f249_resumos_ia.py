@@ -0,0 +1,36 @@
+"""tabela resumos_ia: cache persistente dos resumos da IA
+
+Revision ID: e5a7c9d1f249
+Revises: d4f6b8c0e137
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c9d1f249'
+down_revision = 'd4f6b8c0e137'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('resumos_ia',
+    sa.Column('chave', sa.String(length=64), nullable=False),
+    sa.Column('origem', sa.String(length=50), nullable=True),
+    sa.Column('modelo', sa.String(length=100), nullable=False),
+    sa.Column('resumo', sa.Text(), nullable=False),
+    sa.Column('criado_em', sa.DateTime(), nullable=True),
+    sa.Column('usado_em', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('chave')
+    )
+    op.create_index(op.f('ix_resumos_ia_origem'), 'resumos_ia', ['origem'], unique=False)
+    op.create_index(op.f('ix_resumos_ia_usado_em'), 'resumos_ia', ['usado_em'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_resumos_ia_usado_em'), table_name='resumos_ia')
+    op.drop_index(op.f('ix_resumos_ia_origem'), table_name='resumos_ia')
+    op.drop_table('resumos_ia')
@@ -0,0 +1,31 @@
+"""tabela textos_extraidos: texto extraído dos anexos enviados
+
+Revision ID: f6b8d0e2a351
+Revises: e5a7c9d1f249
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6b8d0e2a351'
+down_revision = 'e5a7c9d1f249'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('textos_extraidos',
+    sa.Column('caminho', sa.String(length=255), nullable=False),
+    sa.Column('mtime', sa.Float(), nullable=False),
+    sa.Column('tamanho', sa.Integer(), nullable=False),
+    sa.Column('texto', sa.Text(), nullable=False),
+    sa.Column('extraido_em', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('caminho')
+    )
+
+
+def downgrade():
+    op.drop_table('textos_extraidos')